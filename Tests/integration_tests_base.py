@@ -1,7 +1,10 @@
 import json
+import tempfile
+from pathlib import Path
 from typing import Self
 from unittest import TestCase
 
+from grave_settings.config_file import ConfigFile
 from grave_settings.handlers import OrderedHandler
 from grave_settings.base import SlotSettings
 from grave_settings.default_handlers import SerializationHandler, DeSerializationHandler
@@ -88,3 +91,28 @@ class IntegrationTestCaseBase(TestCase):
     def formatter_deser(self, formatter, ser_obj):
         return formatter.deserialize(ser_obj)
 
+
+class ConfigFileTestCaseBase(TestCase):
+    """
+    Each test gets a temporary directory, self.path is FILE_NAME inside of it (or the directory if FILE_NAME is None)
+    """
+    FILE_NAME = 'config.json'
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.dir.name)
+        if self.FILE_NAME is not None:
+            self.path = self.path / self.FILE_NAME
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def save_config(self, data, **kwargs) -> ConfigFile:
+        config = ConfigFile(self.path, data=data, **kwargs)
+        config.save()
+        return config
+
+    def load_config(self, data=Dummy, **kwargs) -> ConfigFile:
+        config = ConfigFile(self.path, data=data, **kwargs)
+        config.load()
+        return config
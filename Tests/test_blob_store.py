@@ -0,0 +1,47 @@
+from unittest import main
+
+from grave_settings.blob_store import BlobStore, BLOB_MMAP, BLOB_LAZY
+from grave_settings.helper_objects import LoadOnAccessProxy
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class TestBlobStore(ConfigFileTestCaseBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.blob = bytes(range(256)) * 64
+        store = BlobStore.for_config(self.path, min_bytes=1024)
+        data = Dummy(a=self.blob, b=[b'small', bytes(bytearray(self.blob))])  # equal but not the same object
+        self.save_config(data, blob_store=store)
+        self.blobs = self.path.with_name('config.json.blobs')
+
+    def load(self, **kwargs) -> Dummy:
+        config = self.load_config(blob_store=BlobStore.for_config(self.path, **kwargs))
+        return config.data
+
+    def test_deduplicated_out_of_band(self):
+        self.assertEqual(len(list(self.blobs.glob('*/*'))), 1)
+        text = self.path.read_text()
+        self.assertLess(len(text), 1024)
+        self.assertIn(b'small'.hex(), text)
+        data = self.load()
+        self.assertEqual(data.a, self.blob)
+        self.assertIs(type(data.a), bytes)
+        self.assertEqual(data.b, [b'small', self.blob])
+
+    def test_modes(self):
+        data = self.load(mode=BLOB_MMAP)
+        self.assertIs(type(data.a), memoryview)
+        self.assertEqual(data.a, self.blob)
+        data = self.load(mode=BLOB_LAZY)
+        self.assertIs(type(data.b[1]), LoadOnAccessProxy)
+        self.assertEqual(data.b[1].resolve_proxy(), self.blob)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            BlobStore(self.blobs).read('../config.json')
+        with self.assertRaises(Exception):
+            self.load_config()  # the document names blobs but there is no store
+
+
+if __name__ == '__main__':
+    main()
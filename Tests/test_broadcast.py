@@ -0,0 +1,103 @@
+import multiprocessing
+import subprocess
+import sys
+from pathlib import Path
+from unittest import main
+
+from grave_settings.broadcast import SettingsBroadcast
+from grave_settings.config_file import ConfigFile
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+def publish_from_child(path, payload):
+    broadcast = SettingsBroadcast(path)
+    broadcast.publish(payload)
+    broadcast.close()
+
+
+class TestSettingsBroadcast(ConfigFileTestCaseBase):
+    FILE_NAME = 'config.json.gsb'
+
+    def test_publish_and_read(self):
+        broadcast = SettingsBroadcast(self.path)
+        self.assertEqual(broadcast.read(), (0, None))
+        self.assertEqual(broadcast.publish({'a': [1, 2]}), 1)
+        self.assertEqual(broadcast.publish(), 2)
+        self.assertEqual(broadcast.read(), (2, None))
+        broadcast.close()
+
+    def test_shared_and_grown(self):
+        writer = SettingsBroadcast(self.path, capacity=64)
+        reader = SettingsBroadcast(self.path)
+        payload = {'data': 'x' * 10000}
+        writer.publish(payload)
+        self.assertEqual(reader.read(), (1, payload))
+        writer.close()
+        reader.close()
+
+    def test_old_mapping_stays_valid(self):
+        broadcast = SettingsBroadcast(self.path, capacity=64)
+        old = broadcast.mm  # as held by a reader in another thread
+        broadcast.publish({'data': 'x' * 10000})
+        self.assertIsNot(broadcast.mm, old)
+        self.assertFalse(old.closed)
+        self.assertEqual(old[:4], b'GSB1')
+        broadcast.close()
+
+    def test_imports_without_fcntl(self):
+        code = "import sys; sys.modules['fcntl'] = None; import grave_settings.config_file"
+        src = Path(__file__).resolve().parent.parent / 'src'  # -c puts the working directory on the path
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, cwd=src)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_other_process(self):
+        broadcast = SettingsBroadcast(self.path)
+        process = multiprocessing.get_context('fork').Process(target=publish_from_child,
+                                                               args=(self.path, ('a', 1)))
+        process.start()
+        process.join()
+        self.assertEqual(broadcast.read(), (1, ('a', 1)))
+        broadcast.close()
+
+
+class TestConfigBroadcast(ConfigFileTestCaseBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.save_config(Dummy(a=1, b=[1, 2]))
+
+    def get_config(self) -> ConfigFile:
+        config = self.load_config(broadcast=True)
+        return config
+
+    def test_second_load_adopts(self):
+        first = self.get_config()
+        version = first.broadcast.version
+        second = self.get_config()
+        self.assertEqual(second.broadcast.version, version)  # nothing parsed or published
+        self.assertEqual(second.broadcast_version, version)
+        self.assertEqual(second.data.b, [1, 2])
+
+    def test_reload_if_published(self):
+        first = self.get_config()
+        second = self.get_config()
+        self.save_config(Dummy(a=5, b=[3]))
+        self.assertFalse(second.reload_if_published())
+        self.assertTrue(first.reload_if_changed())
+        version = first.broadcast.version
+        self.assertTrue(second.reload_if_published())
+        self.assertEqual(second.broadcast.version, version)
+        self.assertEqual(second.data.a, 5)
+        self.assertFalse(second.reload_if_published())
+
+    def test_save_published(self):
+        first = self.get_config()
+        second = self.get_config()
+        first.data.a = 3
+        first.save()
+        self.assertEqual(first.broadcast_version, first.broadcast.version)
+        self.assertTrue(second.reload_if_published())
+        self.assertEqual(second.data.a, 3)
+
+
+if __name__ == '__main__':
+    main()
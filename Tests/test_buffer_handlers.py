@@ -0,0 +1,99 @@
+import tempfile
+import unittest
+from array import array
+from pathlib import Path
+from unittest import TestCase, main
+
+from grave_settings.blob_store import BlobStore
+from grave_settings.config_file import ConfigFile
+from grave_settings.default_handlers import numpy, PROFILE_COMPACT
+from grave_settings.formatters.json import JsonFormatter
+from integration_tests_base import Dummy
+
+
+class TestBufferHandlers(TestCase):
+    def setUp(self) -> None:
+        self.formatter = JsonFormatter()
+
+    def roundtrip(self, obj):
+        return self.formatter.loads(self.formatter.dumps(obj))
+
+    def test_array(self):
+        table = array('d', (i / 3 for i in range(100000)))
+        buffer = self.formatter.dumps(table)
+        self.assertIn('"typecode": "d"', buffer)
+        self.assertLess(len(buffer), table.itemsize * len(table) * 2)
+        remade = self.formatter.loads(buffer)
+        self.assertIs(type(remade), array)
+        self.assertEqual(remade, table)
+        self.assertEqual(self.roundtrip(array('h')), array('h'))
+
+    def test_array_byteorder(self):
+        ser = self.formatter.serialize(array('i', [1, 2, 3]))
+        ser['byteorder'] = 'big' if ser['byteorder'] == 'little' else 'little'
+        ser['b64'] = self.formatter.serialize(array('i', [1 << 24, 2 << 24, 3 << 24]))['b64']
+        self.assertEqual(self.formatter.deserialize(ser), array('i', [1, 2, 3]))
+
+    def test_bytearray_and_memoryview(self):
+        self.assertEqual(self.roundtrip(bytearray(b'\x00abc')), bytearray(b'\x00abc'))
+        view = memoryview(array('i', range(12))).cast('B').cast('i', [3, 4])
+        remade = self.roundtrip(view)
+        self.assertEqual((remade.format, remade.shape), ('i', (3, 4)))
+        self.assertEqual(remade.tolist(), view.tolist())
+        remade[0, 0] = 5  # backed by a bytearray
+        for empty in (memoryview(b''), memoryview(array('i'))):
+            remade = self.roundtrip(empty)
+            self.assertEqual((remade.format, remade.shape, remade.tobytes()), (empty.format, (0,), b''))
+
+    def test_external_blob(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'config.json'
+            store = BlobStore.for_config(path, min_bytes=64)
+            ConfigFile(path, data=Dummy(a=array('q', range(100)), b=array('q', [1])), blob_store=store).save()
+            self.assertEqual(len(list(store.directory.glob('*/*'))), 1)
+            config = ConfigFile(path, data=Dummy, blob_store=store)
+            config.load()
+            self.assertEqual(config.data.a, array('q', range(100)))
+            self.assertEqual(config.data.b, array('q', [1]))
+
+    def test_dtype_descr(self):
+        # the dtype of an ndarray is written as numpy.lib.format's descr, descr_to_dtype needs its tuples back
+        descr = [('x', '<f8'), ('', '|V4'), ('y', '>i2', (2, 3)), ('z', [('w', '|u1')])]
+        for formatter in (self.formatter, JsonFormatter(profile=PROFILE_COMPACT)):
+            remade = formatter.loads(formatter.dumps(descr))
+            self.assertEqual(remade, descr)
+            self.assertEqual([type(field) for field in remade], [tuple] * 4)
+            self.assertIs(type(remade[2][2]), tuple)
+            self.assertEqual(formatter.loads(formatter.dumps('<f8')), '<f8')
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed (pip install grave-settings[test])')
+    def test_ndarray(self):
+        arr = numpy.arange(24, dtype='>i4').reshape(2, 3, 4)[:, ::2]
+        remade = self.roundtrip(arr)
+        self.assertEqual(remade.dtype, arr.dtype)
+        self.assertTrue((remade == arr).all())
+        remade[0, 0, 0] = 7
+        structured = numpy.zeros(3, dtype=[('x', '<f8'), ('y', '<i2', (2,))])
+        self.assertEqual(self.roundtrip(structured).dtype, structured.dtype)
+        empty = numpy.zeros((3, 0), dtype='<f8')
+        remade = self.roundtrip(empty)
+        self.assertEqual((remade.dtype, remade.shape), (empty.dtype, (3, 0)))
+        compact = JsonFormatter(profile=PROFILE_COMPACT)
+        self.assertEqual(compact.loads(compact.dumps(structured)).dtype, structured.dtype)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed (pip install grave-settings[test])')
+    def test_external_ndarray(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'config.json'
+            store = BlobStore.for_config(path, min_bytes=64)
+            arr = numpy.arange(100, dtype='<f8').reshape(10, 10)
+            ConfigFile(path, data=Dummy(a=arr), blob_store=store).save()
+            self.assertEqual(len(list(store.directory.glob('*/*'))), 1)
+            config = ConfigFile(path, data=Dummy, blob_store=store)
+            config.load()
+            self.assertEqual(config.data.a.shape, (10, 10))
+            self.assertTrue((config.data.a == arr).all())
+
+
+if __name__ == '__main__':
+    main()
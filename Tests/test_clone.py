@@ -0,0 +1,42 @@
+from datetime import datetime
+from unittest import TestCase, main
+
+from grave_settings.formatter import FragmentCache
+from grave_settings.formatters.json import JsonFormatter
+from integration_tests_base import Dummy, EmptyFormatter
+
+
+class TestClone(TestCase):
+    def make(self) -> Dummy:
+        shared = Dummy(a=[1, 2], b=datetime(2023, 1, 2, 3, 4, 5))
+        root = Dummy(a=[shared, {'x': shared, 3: (4, 5)}])
+        root.b = root
+        return root
+
+    def test_clone(self):
+        obj = self.make()
+        remade = EmptyFormatter().clone(obj)  # its text encoding raises
+        obj.assert_object_equiv(self, remade)
+        self.assertIsNot(remade, obj)
+        self.assertIsNot(remade.a[0], obj.a[0])
+        self.assertIs(remade.b, remade)
+        self.assertIs(remade.a[1]['x'], remade.a[0])
+        self.assertEqual(remade.a[1][3], (4, 5))
+        self.assertEqual(remade.a[0].b, datetime(2023, 1, 2, 3, 4, 5))
+
+    def test_fragment_cache(self):
+        formatter = JsonFormatter()
+        obj = self.make()
+        cache = FragmentCache()
+        clones = []
+        for _ in range(2):  # the second one reuses the fragments of the first
+            serializer = formatter.get_serializer(obj, formatter.get_serialization_context())
+            serializer.fragment_cache = cache
+            clones.append(formatter.clone(obj, serializer=serializer))
+        for remade in clones:
+            obj.assert_object_equiv(self, remade)
+        self.assertIsNot(clones[0].a[0], clones[1].a[0])
+
+
+if __name__ == '__main__':
+    main()
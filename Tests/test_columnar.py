@@ -0,0 +1,45 @@
+from unittest import main
+
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class Row(Dummy):
+    __slots__ = tuple()
+
+
+class TestColumnar(ConfigFileTestCaseBase):
+    def round_trip(self, data, **kwargs) -> Dummy:
+        self.save_config(data, columnar_lists=4, **kwargs)
+        return self.load_config().data
+
+    def test_round_trip(self):
+        rows = [Dummy(a=i, b=[str(i), (i, i)]) for i in range(50)]
+        data = self.round_trip(Dummy(a=rows))
+        text = self.path.read_text()
+        self.assertIn('ColumnarList', text)
+        self.assertEqual(text.count('integration_tests_base.Dummy'), 2)
+        self.assertEqual([(r.a, r.b) for r in data.a], [(i, [str(i), (i, i)]) for i in range(50)])
+        self.assertTrue(all(type(r) is Dummy for r in data.a))
+
+    def test_references(self):
+        shared = [1, 2]
+        rows = [Dummy(a=i, b=shared) for i in range(6)]
+        data = self.round_trip(Dummy(a=rows, b=rows[3]))
+        self.assertIs(data.b, data.a[3])
+        self.assertTrue(all(r.b is data.a[0].b for r in data.a))
+
+    def test_forward_reference(self):
+        rows = [Dummy(a=i) for i in range(6)]
+        data = self.round_trip(Dummy(a={'z': rows, 'y': rows[2]}), canonical=True)  # y is written first
+        self.assertIs(data.a['y'], data.a['z'][2])
+        self.assertEqual([r.a for r in data.a['z']], list(range(6)))
+
+    def test_not_uniform(self):
+        data = self.round_trip(Dummy(a=[Dummy(a=i) for i in range(5)] + [Row(a=5)], b=[Dummy(a=1)] * 3))
+        self.assertNotIn('ColumnarList', self.path.read_text())
+        self.assertIs(type(data.a[5]), Row)
+        self.assertIs(data.b[0], data.b[2])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+from datetime import datetime, date, timedelta, timezone
+from enum import Enum
+from fractions import Fraction
+from unittest import TestCase, main
+from zoneinfo import ZoneInfo
+
+from grave_settings.default_handlers import PROFILE_COMPACT, SerializationHandler
+from grave_settings.formatters.json import JsonFormatter
+
+
+class Color(Enum):
+    RED = 1
+    BLUE = 2
+
+
+class TestCompactProfile(TestCase):
+    def setUp(self) -> None:
+        self.formatter = JsonFormatter(profile=PROFILE_COMPACT)
+
+    def roundtrip(self, obj):
+        return self.formatter.loads(self.formatter.dumps(obj))
+
+    def test_values(self):
+        values = [
+            datetime(2023, 5, 6, 7, 8, 9, 123456),
+            datetime(1901, 1, 1),
+            datetime(2023, 3, 12, 2, 30, tzinfo=timezone(timedelta(hours=-5), name='EST')),
+            datetime(2023, 11, 5, 1, 30, tzinfo=ZoneInfo('America/New_York')),
+            date(2020, 2, 29),
+            timedelta(days=-3, seconds=5, microseconds=7),
+            Color.BLUE,
+            complex(1.5, -2),
+            Fraction(3, 7),
+            (1, (2, 'x')),
+            frozenset({4}),
+            {5, 6}
+        ]
+        remade = self.roundtrip(values)
+        self.assertEqual(remade, values)
+        self.assertEqual([type(v) for v in remade], [type(v) for v in values])
+        self.assertEqual(remade[3].tzinfo, values[3].tzinfo)
+        self.assertEqual(remade[2].tzname(), 'EST')
+
+    def test_tagged_scalars(self):
+        shared = {1}
+        written = self.formatter.serialize([datetime(1970, 1, 2), date(1, 1, 2), timedelta(seconds=1), Color.RED,
+                                            complex(1, 2), Fraction(1, 2), (1, 2), shared, shared])
+        self.assertEqual(written[:8], [{'#dt': 86400000000}, {'#d': 2}, {'#td': 1000000},
+                                       {'#e': f'{__name__}.Color.RED'}, {'#c': [1.0, 2.0]}, {'#q': [1, 2]},
+                                       {'#t': [1, 2]}, {'#s': [1]}])
+        remade = self.roundtrip([shared, shared])
+        self.assertIs(remade[0], remade[1])  # sets are mutable so they keep their references
+
+    def test_tag_like_dict(self):
+        for formatter in (self.formatter, JsonFormatter()):
+            self.assertEqual(formatter.loads(formatter.dumps([{'#dt': 5}, {'#dt': 5, 'b': 1}])),
+                             [{'#dt': 5}, {'#dt': 5, 'b': 1}])
+
+    def test_smaller_and_inline(self):
+        stamp = datetime(2023, 5, 6, 7, 8, 9)
+        series = [stamp + timedelta(seconds=i) for i in range(100)] + [stamp]
+        compact = self.formatter.dumps(series)
+        verbose = JsonFormatter().dumps(series)
+        self.assertLess(len(compact), len(verbose) * 2 // 3)
+        self.assertNotIn('"ref"', compact)  # repeated values are written again
+        self.assertEqual(self.roundtrip(series), series)
+        self.assertEqual(JsonFormatter().loads(compact), series)  # reading does not depend on the profile
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            SerializationHandler(profile='tiny')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import json
+import os
+from pathlib import Path
+from unittest import main
+
+from grave_settings.config_file import ConfigFile
+from grave_settings.document_cache import DocumentCache
+from grave_settings.formatters.json import JsonFormatter
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class TestDocumentCache(ConfigFileTestCaseBase):
+    FILE_NAME = None
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.formatter = JsonFormatter()
+
+    def write(self, name: str, obj) -> Path:
+        path = self.path / name
+        with open(path, 'w') as f:
+            json.dump(obj, f)
+        return path
+
+    def test_hit_and_copy(self):
+        cache = DocumentCache()
+        path = self.write('a.json', {'a': [1, 2]})
+        _, first = cache.get(path, self.formatter)
+        first['a'].append(3)
+        _, second = cache.get(path, self.formatter)
+        self.assertEqual(second, {'a': [1, 2]})
+        self.assertIs(cache.get(path, self.formatter, copy=False)[1], cache.get(path, self.formatter, copy=False)[1])
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_file_change_invalidates(self):
+        cache = DocumentCache()
+        path = self.write('a.json', {'a': 1})
+        cache.get(path, self.formatter)
+        self.write('a.json', {'a': 22})
+        os.utime(path, ns=(0, 0))  # make sure the identity changes even on coarse file systems
+        self.assertEqual(cache.get(path, self.formatter)[1], {'a': 22})
+        self.assertEqual(cache.misses, 2)
+
+    def test_eviction(self):
+        cache = DocumentCache(max_entries=2)
+        paths = [self.write(f'{i}.json', {'i': i}) for i in range(3)]
+        for path in paths:
+            cache.get(path, self.formatter)
+        self.assertNotIn(paths[0], cache)
+        self.assertIn(paths[2], cache)
+        cache = DocumentCache(max_entries=None, max_bytes=20)
+        for path in paths:
+            cache.get(path, self.formatter)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.total_bytes, 20)
+
+    def test_config_file_load(self):
+        cache = DocumentCache()
+        path = self.path / 'config.json'
+        ConfigFile(path, data=Dummy(a=1, b=[1, 2])).save()
+        configs = [ConfigFile(path, data=Dummy, document_cache=cache) for _ in range(3)]
+        for config in configs:
+            config.load()
+        self.assertEqual(cache.misses, 1)
+        self.assertIsNot(configs[0].data, configs[1].data)
+        self.assertEqual(configs[2].data.b, [1, 2])
+        configs[0].data['a'] = 5
+        configs[0].save()
+        self.assertNotIn(path, cache)
+        configs[1].load()
+        self.assertEqual(configs[1].data.a, 5)
+
+
+if __name__ == '__main__':
+    main()
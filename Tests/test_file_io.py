@@ -0,0 +1,319 @@
+import gzip
+import json
+import os
+import threading
+from pathlib import Path
+from unittest import main
+
+from grave_settings.formatters.json import JsonFormatter
+from grave_settings.formatter import get_compression_from_path
+from grave_settings.config_file import ConfigFile, ShardPolicy
+from grave_settings.helper_objects import LoadOnAccessProxy
+from grave_settings.semantics import SortKeys
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class TestCompression(ConfigFileTestCaseBase):
+    FILE_NAME = None
+
+    def test_compression_from_suffix(self):
+        self.assertEqual(get_compression_from_path('a.json.gz'), 'gzip')
+        self.assertEqual(get_compression_from_path('a.json.bz2'), 'bz2')
+        self.assertEqual(get_compression_from_path('a.json.xz'), 'lzma')
+        self.assertIsNone(get_compression_from_path('a.json'))
+
+    def test_chunks_match_buffer(self):
+        formatter = JsonFormatter()
+        obj = Dummy(a=[1, 2, {'x': 'line\nbreak'}], b=Dummy(a=1, b='2'))
+        context = formatter.get_serialization_context()
+        ser_obj = formatter.serialize(obj)
+        self.assertEqual(''.join(formatter.serialized_obj_to_chunks(ser_obj, context)),
+                         formatter.serialized_obj_to_buffer(ser_obj, context))
+
+    def test_roundtrip_compressed(self):
+        formatter = JsonFormatter()
+        for suffix in ('.gz', '.bz2', '.xz'):
+            path = str(self.path / f'dummy.json{suffix}')
+            formatter.write_to_file(Dummy(a=1, b='x' * 100), path)
+            remade = formatter.read_from_file(path)
+            self.assertEqual(remade.a, 1)
+            self.assertEqual(remade.b, 'x' * 100)
+        path = str(self.path / 'dummy.json.gz')
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(json.load(f)['a'], 1)
+
+    def test_roundtrip_encoding(self):
+        formatter = JsonFormatter()
+        path = str(self.path / 'dummy.json')
+        for atomic in (False, True):
+            formatter.write_to_file(Dummy(a=[1, 'é'], b=Dummy(a='ü')), path, encoding='utf-16', atomic=atomic)
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read().count(b'\xff\xfe'), 1)  # one BOM
+            remade = formatter.read_from_file(path, encoding='utf-16')
+            self.assertEqual(remade.a, [1, 'é'])
+            self.assertEqual(remade.b.a, 'ü')
+
+    def test_explicit_compression(self):
+        formatter = JsonFormatter()
+        path = str(self.path / 'dummy.json')
+        formatter.write_to_file(Dummy(a=1), path, compression='bz2')
+        with self.assertRaises(Exception):
+            formatter.read_from_file(path)
+        self.assertEqual(formatter.read_from_file(path, compression='bz2').a, 1)
+
+    def test_config_file_uses_extension(self):
+        path = self.path / 'config.json.gz'
+        config = ConfigFile(path, data=Dummy(a=5))
+        self.assertIsInstance(config.formatter, JsonFormatter)
+        config.save()
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(json.load(f)['a'], 5)
+        config = ConfigFile(path, data=Dummy)
+        config.load()
+        self.assertEqual(config.data.a, 5)
+
+
+class TestContentHash(ConfigFileTestCaseBase):
+    def get_config_file(self, data) -> ConfigFile:
+        formatter = JsonFormatter()
+        write_chunks_to_file = formatter.write_chunks_to_file
+        self.writes = 0
+
+        def counting_write(*args, **kwargs):
+            self.writes += 1
+            return write_chunks_to_file(*args, **kwargs)
+        formatter.write_chunks_to_file = counting_write
+        return ConfigFile(self.path, data=data, formatter=formatter, canonical=True, skip_unchanged=True)
+
+    def test_canonical_output_sorted(self):
+        formatter = JsonFormatter()
+        context = formatter.get_serialization_context()
+        context.add_semantics(SortKeys(True))
+        obj = {'b': {3, 1, 2}, 'a': 1}
+        text = formatter.dumps(obj, serializer=formatter.get_serializer(obj, context))
+        self.assertLess(text.index('"a"'), text.index('"b"'))
+        self.assertEqual(json.loads(text)['b']['state'], [1, 2, 3])
+
+    def test_unchanged_save_skipped(self):
+        config = self.get_config_file(Dummy(a=1, b=2))
+        config.save()
+        config.save()
+        self.assertEqual(self.writes, 1)
+        config.data['a'] = 3
+        config.save()
+        self.assertEqual(self.writes, 2)
+
+    def test_load_then_save_skipped(self):
+        self.get_config_file(Dummy(a=1, b=2)).save()
+        config = self.get_config_file(Dummy)
+        config.load()
+        config.save()
+        self.assertEqual(self.writes, 0)
+
+    def test_external_edit_rewritten(self):
+        config = self.get_config_file(Dummy(a=1, b=2))
+        config.save()
+        with open(self.path, 'w') as f:
+            f.write('{}')
+        config.save()
+        self.assertEqual(self.writes, 2)
+
+
+class TestWriteBehind(ConfigFileTestCaseBase):
+    def get_config_file(self, data, **kwargs) -> ConfigFile:
+        formatter = JsonFormatter()
+        write_to_file = formatter.write_to_file
+        self.writes = 0
+        self.written = threading.Event()
+
+        def counting_write(*args, **kw):
+            self.writes += 1
+            ret = write_to_file(*args, **kw)
+            self.written.set()
+            return ret
+        formatter.write_to_file = counting_write
+        return ConfigFile(self.path, data=data, formatter=formatter, auto_save=True, **kwargs)
+
+    def read(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def test_atomic_write_leaves_no_temp_files(self):
+        formatter = JsonFormatter()
+        formatter.write_to_file(Dummy(a=1), str(self.path), atomic=True)
+        formatter.write_to_file(Dummy(a=2), str(self.path), atomic=True)
+        self.assertEqual(os.listdir(self.dir.name), ['config.json'])
+        self.assertEqual(self.read()['a'], 2)
+
+    def test_atomic_write_follows_symlink(self):
+        target = Path(self.dir.name) / 'target.json'
+        self.path.symlink_to(target)
+        JsonFormatter().write_to_file(Dummy(a=1), str(self.path), atomic=True)
+        self.assertTrue(self.path.is_symlink())
+        self.assertEqual(self.read()['a'], 1)
+
+    def test_saves_in_place_by_default(self):
+        config = self.save_config(Dummy(a=1))
+        inode = os.stat(self.path).st_ino
+        config.data['a'] = 2
+        config.save()
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+        self.assertEqual(self.read()['a'], 2)
+
+    def test_immediate_auto_save(self):
+        config = self.get_config_file(Dummy(a=1, b=2))
+        config.data['a'] = 3
+        self.assertEqual(self.writes, 1)
+        self.assertEqual(self.read()['a'], 3)
+
+    def test_replaced_data_unsubscribed(self):
+        config = self.get_config_file(Dummy(a=1, b=2))
+        config.data['a'] = 3
+        old = config.data
+        config.load()
+        with config:  # loads again
+            pass
+        old['a'] = 4
+        self.assertEqual(self.writes, 2)  # the change and the save on exit
+        config.data['a'] = 5
+        self.assertEqual(self.writes, 3)
+        self.assertEqual(self.read()['a'], 5)
+
+    def test_changes_coalesced(self):
+        config = self.get_config_file(Dummy(a=1, b=2), auto_save_delay=0.05)
+        for i in range(20):
+            config.data['a'] = i
+        self.assertEqual(self.writes, 0)
+        self.assertTrue(self.written.wait(5))
+        self.assertEqual(self.writes, 1)
+        self.assertEqual(self.read()['a'], 19)
+        config.close()
+
+    def test_flush_and_close(self):
+        config = self.get_config_file(Dummy(a=1, b=2), auto_save_delay=60)
+        config.data['a'] = 5
+        config.flush()
+        self.assertEqual(self.writes, 1)
+        self.assertEqual(self.read()['a'], 5)
+        config.flush()
+        self.assertEqual(self.writes, 1)
+        config.data['b'] = 6
+        config.close()
+        self.assertEqual(self.writes, 2)
+        self.assertEqual(self.read()['b'], 6)
+        self.assertFalse(config.write_behind.thread)
+
+
+class TestDependencyGraph(ConfigFileTestCaseBase):
+    FILE_NAME = None
+
+    def setUp(self) -> None:
+        super().setUp()
+        (self.path / 'sub').mkdir()
+
+    def make_graph(self, max_workers=4):
+        root = ConfigFile(self.path / 'root.json', data=Dummy(a='root'), max_workers=max_workers)
+        left = ConfigFile(self.path / 'sub' / 'left.json', data=Dummy(a='left'))
+        right = ConfigFile(self.path / 'sub' / 'right.json', data=Dummy(a='right'))
+        leaf = ConfigFile(self.path / 'sub' / 'leaf.json', data=Dummy(a='leaf'))
+        root.data.b = [left.data, right.data]
+        left.data.b = leaf.data
+        right.data.b = leaf.data
+        left.add_config_dependency(leaf)
+        right.add_config_dependency(leaf)
+        root.add_config_dependency(left)
+        root.add_config_dependency(right)
+        return root, left, right, leaf
+
+    def test_dependency_levels(self):
+        root, left, right, leaf = self.make_graph()
+        levels = root.get_dependency_levels()
+        self.assertEqual(len(levels), 2)
+        self.assertEqual(levels[0], [leaf])
+        self.assertCountEqual(levels[1], [left, right])
+        leaf.add_config_dependency(root, relative_path=False)
+        with self.assertRaises(ValueError):
+            root.get_dependency_levels()
+
+    def test_cached_fragments_save_links(self):
+        root = ConfigFile(self.path / 'root.json', data=Dummy(), cache_fragments=True)
+        sub = ConfigFile(self.path / 'sub' / 'sub.json', data=Dummy(a=1))
+        root.data.a = Dummy(a=sub.data)
+        root.add_config_dependency(sub)
+        root.save()
+        sub.data.a = 42
+        sub.data.invalidate()
+        root.save()
+        self.assertEqual(json.loads((self.path / 'sub' / 'sub.json').read_text())['a'], 42)
+
+    def test_parallel_roundtrip(self):
+        root = self.make_graph()[0]
+        root.save()
+        for name in ('root.json', 'sub/left.json', 'sub/right.json', 'sub/leaf.json'):
+            self.assertTrue((self.path / name).is_file(), name)
+        loaded = ConfigFile(self.path / 'root.json', data=Dummy, max_workers=4)
+        loaded.load()
+        left, right = loaded.data.b
+        self.assertEqual((loaded.data.a, left.a, right.a, left.b.a, right.b.a),
+                         ('root', 'left', 'right', 'leaf', 'leaf'))
+        self.assertIsNone(loaded.prefetcher)
+        self.assertEqual(len(loaded.sub_configs), 2)
+
+    def test_same_level_saved_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        class WaitingFormatter(JsonFormatter):
+            def write_to_file(self, *args, **kwargs):
+                barrier.wait()  # left and right have to be writing at the same time to get past this
+                return super().write_to_file(*args, **kwargs)
+
+        root, left, right, leaf = self.make_graph()
+        left.formatter = right.formatter = WaitingFormatter()
+        root.save()
+        self.assertEqual(json.loads((self.path / 'sub' / 'right.json').read_text())['a'], 'right')
+
+    def test_sequential_matches_parallel(self):
+        self.make_graph()[0].save()
+        parallel = (self.path / 'root.json').read_text()
+        self.make_graph(max_workers=1)[0].save()
+        self.assertEqual((self.path / 'root.json').read_text(), parallel)
+
+    def test_lazy_links(self):
+        self.make_graph()[0].save()
+        leaf_text = (self.path / 'sub' / 'leaf.json').read_text()
+        loaded = ConfigFile(self.path / 'root.json', data=Dummy, lazy_links=True)
+        loaded.load()
+        left, right = loaded.data.b
+        self.assertIsInstance(left, LoadOnAccessProxy)
+        self.assertFalse(left.is_proxy_loaded())
+        self.assertEqual(left.a, 'left')
+        self.assertTrue(left.is_proxy_loaded())
+        self.assertIsInstance(left.b, LoadOnAccessProxy)
+        self.assertFalse(right.is_proxy_loaded())
+        left['a'] = 'changed'
+        (self.path / 'sub' / 'leaf.json').unlink()
+        loaded.save()
+        self.assertFalse(right.is_proxy_loaded())
+        self.assertFalse((self.path / 'sub' / 'leaf.json').exists())
+        (self.path / 'sub' / 'leaf.json').write_text(leaf_text)
+        reloaded = ConfigFile(self.path / 'root.json', data=Dummy)
+        reloaded.load()
+        left, right = reloaded.data.b
+        self.assertEqual((left.a, right.a, left.b.a), ('changed', 'right', 'leaf'))
+
+
+
+class TestOptions(ConfigFileTestCaseBase):
+    def test_conflicting_options(self):
+        for kwargs in ({'skip_unchanged': False, 'shard_policy': ShardPolicy()},
+                       {'document_cache': True, 'sidecar_cache': True},
+                       {'sidecar_cache': True, 'broadcast': True},
+                       {'read_only': True, 'auto_save': True}):
+            with self.assertRaises(ValueError, msg=kwargs):
+                ConfigFile(self.path, data=Dummy(), **kwargs)
+        self.assertTrue(ConfigFile(self.path, data=Dummy(), shard_policy=ShardPolicy()).skip_unchanged)
+        self.assertFalse(ConfigFile(self.path, data=Dummy(), document_cache=True, sidecar_cache=False).skip_unchanged)
+
+
+if __name__ == '__main__':
+    main()
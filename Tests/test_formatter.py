@@ -1,7 +1,9 @@
 from unittest import TestCase
 
+from grave_settings.base import Settings
 from grave_settings.framestack_context import FrameStackContext
-from grave_settings.formatter import Formatter
+from grave_settings.formatter import Formatter, FragmentCache
+from grave_settings.formatters.json import JsonFormatter
 from grave_settings.semantics import *
 
 from integration_tests_base import IntegrationTestCaseBase, Dummy, EmptyFormatter
@@ -35,3 +37,76 @@ class TestSemantics(IntegrationTestCaseBase):
             self.assertIsNot(remade.a, remade.b)
         finally:
             globals().pop('NonSerializableDummy')
+
+
+class TestFragmentCache(TestCase):
+    def get_tree(self) -> Settings:
+        root = Settings()
+        shared = Dummy(a=1)
+        for name in ('left', 'right'):
+            child = Settings()
+            child.parent = root
+            child['value'] = name
+            child['dummy'] = shared
+            root[name] = child
+        shared.parent = root['left']
+        return root
+
+    def dump(self, formatter: JsonFormatter, obj, fragment_cache: FragmentCache | None):
+        serializer = formatter.get_serializer(obj, formatter.get_serialization_context())
+        serializer.fragment_cache = fragment_cache
+        return formatter.serialize(obj, serializer=serializer)
+
+    def test_unchanged_subtree_reused(self):
+        formatter = JsonFormatter()
+        cache = FragmentCache()
+        root = self.get_tree()
+        first = self.dump(formatter, root, cache)
+        root['right']['value'] = 'changed'
+        second = self.dump(formatter, root, cache)
+        self.assertIs(first['left'], second['left'])
+        self.assertIsNot(first['right'], second['right'])
+        self.assertEqual(second, self.dump(formatter, root, None))
+
+    def test_references_follow_changes(self):
+        formatter = JsonFormatter()
+        cache = FragmentCache()
+        root = self.get_tree()
+        self.dump(formatter, root, cache)
+        root['left']['dummy'] = Dummy(a=2)  # the right side now owns the shared object instead of referencing it
+        second = self.dump(formatter, root, cache)
+        self.assertEqual(second, self.dump(formatter, root, None))
+        self.assertEqual(second['right']['dummy']['a'], 1)
+
+    def test_closed_subtrees_reused_without_parent_links(self):
+        formatter = JsonFormatter()
+        cache = FragmentCache()
+        root = Settings()
+        root['unlinked'] = Settings()
+        root['unlinked']['leaf'] = Dummy(a=1)
+        root['unlinked']['other'] = Dummy(a=2)
+        first = self.dump(formatter, root, cache)
+        root['unlinked']['leaf']['a'] = 3  # does not reach root
+        second = self.dump(formatter, root, cache)
+        self.assertEqual(second['unlinked']['leaf']['a'], 3)
+        self.assertIsNot(first['unlinked'], second['unlinked'])
+        self.assertIs(first['unlinked']['other'], second['unlinked']['other'])  # leaves are closed
+
+    def test_unlinking_invalidates(self):
+        formatter = JsonFormatter()
+        cache = FragmentCache()
+        root = self.get_tree()
+        first = self.dump(formatter, root, cache)
+        root['left'].parent = None
+        root['left']['value'] = 'changed'
+        self.assertEqual(self.dump(formatter, root, cache)['left']['value'], 'changed')
+        self.assertIs(self.dump(formatter, root, cache)['right'], first['right'])
+
+    def test_descendants_verified_without_parent_links(self):
+        formatter = JsonFormatter()
+        cache = FragmentCache()
+        root = self.get_tree()
+        root['left'].parent = None
+        self.dump(formatter, root, cache)
+        root['left']['value'] = 'changed'
+        self.assertEqual(self.dump(formatter, root, cache)['left']['value'], 'changed')
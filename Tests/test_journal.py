@@ -0,0 +1,87 @@
+from unittest import main
+
+from grave_settings.config_file import ConfigFile
+from grave_settings.journal import SettingsJournal
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class TestJournal(ConfigFileTestCaseBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.config = self.save_config(Dummy(a=1, b=Dummy(a=2, b=[1])), journal=True)
+        self.journal_path = self.config.journal.path
+
+    def load(self, **kwargs) -> ConfigFile:
+        return self.load_config(journal=SettingsJournal(self.journal_path, **kwargs))
+
+    def test_changes_appended_and_replayed(self):
+        base = self.path.read_bytes()
+        data = self.config.data
+        data['a'] = [1, 2]
+        self.config.save()
+        data.update({'b': Dummy(a=3)})
+        self.config.save()
+        self.assertEqual(self.path.read_bytes(), base)
+        self.assertEqual(len(self.journal_path.read_text().splitlines()), 3)
+        loaded = self.load().data
+        self.assertEqual(loaded.a, [1, 2])
+        self.assertIsInstance(loaded.b, Dummy)
+        self.assertEqual(loaded.b.a, 3)
+
+    def test_shared_objects_save_in_full(self):
+        shared = Dummy(a=[1])
+        self.config.data.update({'a': shared, 'b': shared})
+        self.config.save()
+        self.assertEqual(len(self.journal_path.read_text().splitlines()), 1)
+        loaded = self.load().data
+        self.assertIs(loaded.a, loaded.b)
+        self.config.data['b'] = self.config.data.a.a  # shared with a key that did not change
+        self.config.save()
+        self.assertEqual(len(self.journal_path.read_text().splitlines()), 1)
+        loaded = self.load().data
+        self.assertIs(loaded.b, loaded.a.a)
+
+    def test_nothing_pending(self):
+        self.config.data['a'] = 5
+        self.config.save()
+        journal = self.journal_path.read_bytes()
+        self.config.save()
+        self.assertEqual(self.journal_path.read_bytes(), journal)
+        self.assertEqual(self.load().data.a, 5)
+
+    def test_compaction(self):
+        config = self.load(max_bytes=200)
+        for i in range(20):
+            config.data['a'] = i
+            config.save()
+        self.assertLessEqual(self.journal_path.stat().st_size, 200)
+        self.assertEqual(self.load().data.a, 19)
+
+    def test_unknown_keys_save_in_full(self):
+        child = self.config.data.b
+        child.parent = self.config.data
+        child['a'] = 4
+        self.config.save()
+        self.assertEqual(len(self.journal_path.read_text().splitlines()), 1)
+        self.assertEqual(self.load().data.b.a, 4)
+
+    def test_stale_journal_ignored(self):
+        self.config.data['a'] = 5
+        self.config.save()
+        self.save_config(Dummy(a=6))
+        self.assertEqual(self.load().data.a, 6)
+
+    def test_torn_tail_dropped(self):
+        self.config.data['a'] = 5
+        self.config.save()
+        with open(self.journal_path, 'a') as f:
+            f.write('["s","a",')
+        config = self.load()
+        self.assertEqual(config.data.a, 5)
+        config.data['a'] = 7
+        config.save()
+        self.assertEqual(self.load().data.a, 7)
+
+
+if __name__ == '__main__':
+    main()
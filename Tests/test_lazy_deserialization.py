@@ -0,0 +1,45 @@
+from unittest import main
+
+from grave_settings.helper_objects import LoadOnAccessProxy
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class TestLazyDeserialization(ConfigFileTestCaseBase):
+    def setUp(self) -> None:
+        super().setUp()
+        data = Dummy(a=[1, 2], b=Dummy(a=Dummy(a=[3]), b={'k': 'v'}))
+        data.a.append(data.b.a.a)
+        self.save_config(data)
+
+    def load(self) -> Dummy:
+        return self.load_config(lazy_subtrees=True).data
+
+    def test_members_materialize_on_read(self):
+        data = self.load()
+        child = data.b
+        self.assertIs(type(child), Dummy)
+        self.assertIs(data.b, child)
+        self.assertEqual(child.b, {'k': 'v'})
+        self.assertIs(type(child.a), Dummy)
+        self.assertIs(data['b'], child)
+
+    def test_class_untouched(self):
+        self.load()
+        plain = Dummy(b=LoadOnAccessProxy(lambda: 1))
+        self.assertIs(type(plain.b), LoadOnAccessProxy)  # only lazily loaded instances resolve their members
+        self.assertFalse(plain.b.is_proxy_loaded())
+
+    def test_references_across_boundaries(self):
+        data = self.load()
+        self.assertIs(data.a[2], data.b.a.a)  # loaded the subtree to resolve the reference
+        self.assertEqual(data.a[2], [3])
+
+    def test_save_loaded_and_unloaded(self):
+        self.load_config(lazy_subtrees=True).save()
+        data = self.load_config()
+        self.assertEqual(data.data.b.a.a, [3])
+        self.assertIs(data.data.a[2], data.data.b.a.a)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import json
+from unittest import main
+
+from grave_settings.formatters.json import JsonFormatter
+from grave_settings.semantics import OffsetIndex, SortKeys, Indentation
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class TestOffsetIndex(ConfigFileTestCaseBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.data = Dummy(a={'x': [1, {'y': 'é'}], 'n': {1: 2}, 'e': []},
+                          b=[Dummy(a=1.5, b=None), Dummy(a={}, b=[True])])
+        self.config = self.save_config(self.data, offset_index=True)
+        self.formatter = JsonFormatter()
+
+    def test_document_unchanged(self):
+        formatter = self.config.formatter
+        for semantics in ((), (SortKeys(True),), (Indentation(None),)):
+            context = self.config.get_serialization_context()
+            context.add_semantics(*semantics)
+            ser_obj = formatter.serialize(self.data, serializer=formatter.get_serializer(self.data, context))
+            expected = formatter.serialized_obj_to_buffer(ser_obj, context)
+            context.add_semantics(OffsetIndex(True))
+            indexed = ''.join(formatter.serialized_obj_to_chunks(ser_obj, context))
+            self.assertTrue(indexed.startswith(expected + '\n//gs-index '))
+            self.assertEqual(formatter.buffer_to_obj(indexed, context), json.loads(expected))
+
+    def test_index_spans(self):
+        with open(self.path, 'rb') as f:
+            index = JsonFormatter.read_index(f)
+            f.seek(0)
+            data = f.read()
+        self.assertIn('"b".1', index)
+        for ref, (start, end) in index.items():
+            self.assertEqual(json.loads(data[start:end]), self.formatter.spec.get_part_from_path(
+                json.loads(data[:data.index(b'\n//gs-index ')]), ref))
+
+    def test_read_subtree(self):
+        sub = self.formatter.read_subtree(str(self.path), ['b', 1])
+        self.assertIsInstance(sub, Dummy)
+        self.assertEqual(sub.b, [True])
+        self.assertEqual(self.formatter.read_subtree_obj(str(self.path), ['a', 'x', 1, 'y']), 'é')
+        with self.assertRaises(KeyError):
+            self.formatter.read_subtree_obj(str(self.path), ['a', 'missing'])
+        self.assertEqual(self.load_config().data.b[0].a, 1.5)
+
+    def test_without_index(self):
+        self.save_config(self.data)
+        with open(self.path, 'rb') as f:
+            self.assertIsNone(JsonFormatter.read_index(f))
+        self.assertEqual(self.formatter.read_subtree_obj(str(self.path), ['b', 0, 'a']), 1.5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+from unittest import TestCase, main
+from unittest.mock import patch
+
+from grave_settings.abstract import MISSING, IASettings
+from grave_settings.base import Settings
+from integration_tests_base import Dummy
+
+
+class TestInvalidationBatch(TestCase):
+    def setUp(self) -> None:
+        self.calls = []
+
+    def listen(self, settings):
+        def on_invalidate(keys=None):
+            self.calls.append(keys)
+        self.listener = on_invalidate  # subscriptions are weak
+        settings.invalidate.subscribe(on_invalidate)
+
+    def test_setitem_reports_key(self):
+        settings = Settings()
+        self.listen(settings)
+        settings['a'] = 1
+        settings['a'] = 1
+        del settings['a']
+        self.assertEqual(self.calls, [frozenset('a'), frozenset('a')])
+
+    def test_batch_coalesces(self):
+        settings = Settings()
+        self.listen(settings)
+        with settings.batch():
+            settings['a'] = 1
+            settings['b'] = 2
+            with settings.batch():
+                settings['c'] = 3
+            self.assertEqual(self.calls, [])
+        self.assertEqual(self.calls, [frozenset('abc')])
+
+    def test_batched_sets_skip_invalidate(self):
+        settings = Dummy()
+        self.listen(settings)
+        with settings.batch():
+            with patch.object(IASettings, 'invalidate', side_effect=AssertionError('invalidated')):
+                settings['a'] = 1
+                settings['b'] = 2
+        self.assertEqual(self.calls, [frozenset('ab')])
+
+    def test_empty_batch_is_silent(self):
+        settings = Settings()
+        self.listen(settings)
+        with settings.batch():
+            pass
+        self.assertEqual(self.calls, [])
+
+    def test_update_notifies_once(self):
+        settings = Dummy()
+        self.listen(settings)
+        settings.update({'a': 1, 'b': 2})
+        self.assertEqual(self.calls, [frozenset('ab')])
+
+    def test_parent_notified_once(self):
+        parent = Settings()
+        child = Settings()
+        child.parent = parent
+        self.listen(parent)
+        with child.batch():
+            child['a'] = 1
+            child['b'] = 2
+        self.assertEqual(self.calls, [None])
+
+    def test_batch_on_parent_absorbs_children(self):
+        parent = Settings()
+        child = Dummy()
+        child.parent = parent
+        self.listen(parent)
+        with parent.batch():
+            child['a'] = 1
+            child['b'] = 2
+            parent['x'] = child
+        self.assertEqual(self.calls, [None])
+
+    def test_revision_bumped_inside_batch(self):
+        settings = Settings()
+        with settings.batch():
+            revision = settings._revision
+            settings['a'] = 1
+            self.assertGreater(settings._revision, revision)
+
+
+class TestKeySubscriptions(TestCase):
+    def setUp(self) -> None:
+        self.events = []
+
+    def callback(self, key, old, new):
+        self.events.append((key, old, new))
+
+    def test_settings_key(self):
+        settings = Settings()
+        settings.subscribe_key('a', self.callback)
+        settings['a'] = 1
+        settings['a'] = 1
+        settings['b'] = 2
+        settings.update({'a': 3, 'b': 4})
+        del settings['a']
+        self.assertEqual(self.events, [('a', MISSING, 1), ('a', 1, 3), ('a', 3, MISSING)])
+
+    def test_slot_settings_key(self):
+        settings = Dummy(a=1)
+        settings.subscribe_key('a', self.callback)
+        settings['a'] = 2
+        settings['a'] = 2
+        settings.update({'a': 3, 'b': 4})
+        self.assertEqual(self.events, [('a', 1, 2), ('a', 2, 3)])
+
+    def test_path_through_parents(self):
+        root = Settings()
+        child = Dummy(a=1)
+        root['child'] = child
+        child.parent = root
+        root.subscribe_key(('child', 'a'), self.callback)
+        root.subscribe_key('child', self.callback)
+        child['a'] = 2
+        root[('child', 'a')] = 3
+        self.assertEqual(self.events, [(('child', 'a'), 1, 2), (('child', 'a'), 2, 3)])
+
+    def test_listener_count_pushed_down(self):
+        root = Settings()
+        middle = Settings()
+        leaf = Dummy(a=1)
+        middle['leaf'] = leaf
+        leaf.parent = middle
+        self.assertFalse(leaf.has_key_listeners())
+        root.subscribe_key(('middle', 'leaf', 'a'), self.callback)
+        root['middle'] = middle
+        middle.parent = root  # attached after the subscription
+        self.assertTrue(leaf.has_key_listeners())
+        leaf['a'] = 2
+        self.assertEqual(self.events, [(('middle', 'leaf', 'a'), 1, 2)])
+        middle.parent = None
+        self.assertFalse(leaf.has_key_listeners())
+        root.unsubscribe_key(('middle', 'leaf', 'a'), self.callback)
+        self.assertFalse(root.has_key_listeners())
+
+    def test_key_path_does_not_scan_siblings(self):
+        class NoScan(Settings):
+            __slots__ = tuple()
+
+            def generate_key_value_pairs(self, **kwargs):
+                raise AssertionError('scanned')
+
+        root = NoScan()
+        child = Dummy(a=1)
+        root['child'] = child
+        child.parent = root
+        root.subscribe_key(('child', 'a'), self.callback)
+        child['a'] = 2
+        self.assertEqual(self.events, [(('child', 'a'), 1, 2)])
+
+    def test_no_keys_without_listeners(self):
+        settings = Settings()
+        calls = []
+        settings['a'] = 1
+        self.assertFalse(settings.wants_keys())
+        listener = lambda keys=None: calls.append(keys)
+        settings.invalidate.subscribe(listener)
+        self.assertTrue(settings.wants_keys())
+        settings['a'] = 2
+        self.assertEqual(calls, [frozenset('a')])
+
+    def test_unsubscribe(self):
+        settings = Settings()
+        settings.subscribe_key('a', self.callback)
+        settings.unsubscribe_key('a', self.callback)
+        self.assertIsNone(settings._key_subscriptions)
+        self.assertFalse(settings.has_key_listeners())
+        settings['a'] = 1
+        self.assertEqual(self.events, [])
+
+
+class TestDirtyShortCircuit(TestCase):
+    class ShortCircuitSettings(Settings):
+        __slots__ = tuple()
+        DIRTY_SHORT_CIRCUIT = True
+
+    def test_propagation_stops_at_dirty_parent(self):
+        root = self.ShortCircuitSettings()
+        middle = self.ShortCircuitSettings()
+        leaf = Settings()
+        middle.parent = root
+        leaf.parent = middle
+        calls = []
+        listener = lambda keys=None: calls.append(keys)
+        root.invalidate.subscribe(listener)
+        leaf['a'] = 1
+        leaf['a'] = 2
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(root.is_dirty())
+        Settings.advance_epoch()
+        self.assertFalse(root.is_dirty())
+        leaf['a'] = 3
+        self.assertEqual(len(calls), 2)
+
+    def test_disabled_by_default(self):
+        root = Settings()
+        leaf = Settings()
+        leaf.parent = root
+        calls = []
+        listener = lambda keys=None: calls.append(keys)
+        root.invalidate.subscribe(listener)
+        leaf['a'] = 1
+        leaf['a'] = 2
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == '__main__':
+    main()
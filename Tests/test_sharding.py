@@ -0,0 +1,64 @@
+from pathlib import Path
+from unittest import main
+
+from grave_settings.config_file import ConfigFile, ShardPolicy
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class Hot(Dummy):
+    __slots__ = tuple()
+
+
+class TestSharding(ConfigFileTestCaseBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.shards = Path(self.dir.name) / 'config.json.shards'
+
+    def load(self, policy: ShardPolicy) -> ConfigFile:
+        return self.load_config(shard_policy=policy)
+
+    def test_size_threshold(self):
+        policy = ShardPolicy(min_bytes=200)
+        big = Dummy(a=['x' * 20] * 10, b=Dummy(a=list(range(60))))
+        self.save_config(Dummy(a=Dummy(a=1), b=big), shard_policy=policy)
+        self.assertEqual(sorted(p.name for p in self.shards.iterdir()), ['config.b.b.json', 'config.b.json'])
+        self.assertNotIn('x' * 20, self.path.read_text())
+        config = self.load(policy)
+        self.assertEqual(config.data.a.a, 1)
+        self.assertEqual(config.data.b.a, ['x' * 20] * 10)
+        self.assertEqual(config.data.b.b.a, list(range(60)))
+        self.assertEqual(len(config.sub_configs), 1)  # the nested shard hangs off its parent's shard
+
+    def test_only_changed_shards_written(self):
+        policy = ShardPolicy(types=(Hot,))
+        self.save_config(Dummy(a=Hot(a=1), b=Hot(a=2)), shard_policy=policy)
+        config = self.load(policy)
+        files = [self.path, self.shards / 'config.a.json', self.shards / 'config.b.json']
+        before = [p.stat().st_mtime_ns for p in files]
+        config.data.b.a = 3
+        config.save()
+        after = [p.stat().st_mtime_ns for p in files]
+        self.assertEqual(after[:2], before[:2])
+        self.assertNotEqual(after[2], before[2])
+        self.assertEqual(self.load(policy).data.b.a, 3)
+
+    def test_edits_inside_shards_saved(self):
+        policy = ShardPolicy(types=(Hot,))
+        self.save_config(Dummy(a=Hot(a=[1]), b=Hot(a=Dummy(a=1))), shard_policy=policy)
+        config = self.load(policy)
+        config.data.a.a.append(2)
+        config.data.b.a.a = 99
+        config.data.b.a.invalidate()
+        config.save()
+        config = self.load(policy)
+        self.assertEqual(config.data.a.a, [1, 2])
+        self.assertEqual(config.data.b.a.a, 99)
+
+    def test_file_names(self):
+        policy = ShardPolicy()
+        self.assertEqual(policy.get_file_name(Path('s.json.gz'), ['a b', 1]), 's.a_b.1.json.gz')
+        self.assertEqual(policy.get_file_name(Path('s.v2.toml'), ['k']), 's.v2.k.toml')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+from unittest import main
+
+from grave_settings.formatters.json import JsonFormatter
+from grave_settings.sidecar_cache import SidecarCache
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class TestSidecarCache(ConfigFileTestCaseBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.save_config(Dummy(a=1, b={'x': [1, 2.5, None, True]}))
+        self.formatter = JsonFormatter()
+        self.cache = SidecarCache()
+
+    def load(self) -> Dummy:
+        return self.load_config(formatter=self.formatter, sidecar_cache=self.cache).data
+
+    def test_cache_written_and_used(self):
+        first = self.load()
+        cache_path = self.cache.get_cache_path(self.path, self.formatter)
+        self.assertTrue(cache_path.is_file())
+        self.assertEqual(cache_path.parent.name, '__gscache__')
+        second = self.load()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(second.b, first.b)
+        self.assertEqual(second.b, {'x': [1, 2.5, None, True]})
+
+    def test_source_change_reparsed(self):
+        self.load()
+        self.save_config(Dummy(a=2))
+        self.assertEqual(self.load().a, 2)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_same_stat_different_content(self):
+        self.load()
+        st = os.stat(self.path)
+        text = self.path.read_text().replace('"a": 1', '"a": 7')
+        self.path.write_text(text)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(self.load().a, 7)
+
+    def test_corrupt_cache_ignored(self):
+        self.load()
+        self.cache.get_cache_path(self.path, self.formatter).write_bytes(b'GSC1garbage')
+        self.assertEqual(self.load().a, 1)
+        self.assertEqual(self.cache.misses, 2)
+        self.assertEqual(self.load().a, 1)
+        self.assertEqual(self.cache.hits, 1)
+
+
+if __name__ == '__main__':
+    main()
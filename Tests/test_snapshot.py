@@ -0,0 +1,161 @@
+import threading
+from unittest import TestCase, main
+
+from grave_settings.base import Settings
+from grave_settings.snapshot import FrozenSettings, SnapshotPublisher
+from integration_tests_base import Dummy
+
+
+class TestFrozenSettings(TestCase):
+    def get_settings(self):
+        root = Settings()
+        root['a'] = 1
+        root['items'] = [1, 2, {'x': 3}]
+        root['left'] = Dummy(a=1)
+        root['right'] = Dummy(a=2)
+        return root
+
+    def test_freeze_copies(self):
+        root = self.get_settings()
+        frozen = FrozenSettings.freeze(root)
+        root['items'].append(4)
+        self.assertEqual(frozen['items'], (1, 2, {'x': 3}))
+        self.assertEqual(frozen['left', 'a'], 1)
+        self.assertEqual(frozen['left'].a, 1)
+        with self.assertRaises(TypeError):
+            frozen.a = 2
+        with self.assertRaises(TypeError):
+            frozen['items'][2]['x'] = 4
+
+    def test_set_shares_structure(self):
+        frozen = FrozenSettings.freeze(self.get_settings())
+        changed = frozen.set(('left', 'a'), 5)
+        self.assertEqual(frozen['left', 'a'], 1)
+        self.assertEqual(changed['left', 'a'], 5)
+        self.assertIs(changed['right'], frozen['right'])
+        self.assertIs(changed['items'], frozen['items'])
+        removed = changed.delete('right')
+        self.assertNotIn('right', removed)
+        self.assertIn('right', changed)
+
+    def test_refreeze_shares_unchanged(self):
+        root = self.get_settings()
+        frozen = FrozenSettings.freeze(root)
+        self.assertIs(FrozenSettings.freeze(root, previous=frozen), frozen)
+        root['right']['a'] = 7  # no parent link, found through the child's revision
+        refrozen = FrozenSettings.freeze(root, previous=frozen)
+        self.assertEqual(refrozen['right', 'a'], 7)
+        self.assertIs(refrozen['left'], frozen['left'])
+        self.assertIs(refrozen['items'], frozen['items'])
+
+    def test_thaw(self):
+        root = self.get_settings()
+        thawed = FrozenSettings.freeze(root).thaw()
+        self.assertIsInstance(thawed, Settings)
+        self.assertIsInstance(thawed['left'], Dummy)
+        self.assertEqual(thawed['items'], [1, 2, {'x': 3}])
+        self.assertEqual(thawed['right']['a'], 2)
+
+
+class TestSnapshotPublisher(TestCase):
+    def test_auto_refresh(self):
+        root = Settings()
+        root['a'] = 1
+        publisher = SnapshotPublisher(root)
+        published = []
+        listener = lambda snapshot: published.append(snapshot)
+        publisher.publish.subscribe(listener)
+        before = publisher.snapshot()
+        with root.batch():
+            root['a'] = 2
+            root['b'] = 3
+        after = publisher.snapshot()
+        self.assertEqual(dict(before), {'a': 1})
+        self.assertEqual(dict(after), {'a': 2, 'b': 3})
+        self.assertEqual(published, [after])
+        self.assertEqual(publisher.version, 1)
+
+    def test_auto_refresh_nested(self):
+        root = Settings()
+        root['left'] = Dummy(a=1)
+        root['sub'] = Settings()
+        root['sub']['x'] = 1
+        publisher = SnapshotPublisher(root)
+        root['left']['a'] = 5
+        self.assertEqual(publisher.snapshot()['left', 'a'], 5)
+        root['sub']['x'] = 2
+        self.assertEqual(publisher.snapshot()['sub', 'x'], 2)
+        added = Settings()
+        root['added'] = added
+        added['y'] = 3  # settings added later are watched after the refresh
+        self.assertEqual(publisher.snapshot()['added', 'y'], 3)
+        old = root['left']
+        root['left'] = Dummy(a=0)
+        version = publisher.version
+        old['a'] = 9  # no longer part of the settings
+        self.assertEqual(publisher.version, version)
+        self.assertEqual(publisher.snapshot()['left', 'a'], 0)
+
+    def test_write_rebuilds_path_only(self):
+        frozen = []
+
+        class Counted(Dummy):
+            __slots__ = tuple()
+
+            def generate_key_value_pairs(self, **kwargs):
+                frozen.append(self)
+                return super().generate_key_value_pairs(**kwargs)
+
+        root = Settings()
+        for i in range(20):
+            root[i] = Counted(a=Counted(a=i), b=[Counted(a=-i)])
+        publisher = SnapshotPublisher(root)
+        before = publisher.snapshot()
+        frozen.clear()
+        leaf = root[3].a
+        leaf['a'] = 30
+        in_list = root[4].b[0]
+        in_list['a'] = 40
+        after = publisher.snapshot()
+        self.assertEqual(frozen, [leaf, in_list])  # ancestors are copied, nothing else is re-frozen
+        self.assertEqual((after[3, 'a', 'a'], after[4, 'b'][0]['a']), (30, 40))
+        self.assertEqual(publisher.version, 2)
+        for i in range(20):
+            if i not in (3, 4):
+                self.assertIs(after[i], before[i])
+        self.assertIs(after[3, 'b'], before[3, 'b'])
+        self.assertIs(after[4, 'a'], before[4, 'a'])
+
+    def test_update(self):
+        publisher = SnapshotPublisher()
+        publisher.update({'a': 1, 'b': Dummy(a=2)})
+        publisher.update([(('b', 'a'), 3)])
+        self.assertEqual(publisher.snapshot()['b', 'a'], 3)
+        publisher.delete('a')
+        self.assertNotIn('a', publisher.snapshot())
+
+    def test_readers_see_consistent_snapshots(self):
+        publisher = SnapshotPublisher()
+        publisher.update({'a': 0, 'b': 0})
+        stop = threading.Event()
+        torn = []
+
+        def read():
+            while not stop.is_set():
+                snapshot = publisher.snapshot()
+                if snapshot['a'] != snapshot['b']:
+                    torn.append(snapshot)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for i in range(1, 2000):
+            publisher.update({'a': i, 'b': i})
+        stop.set()
+        for reader in readers:
+            reader.join()
+        self.assertEqual(torn, [])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+from unittest import main
+
+from grave_settings.base import SlotSettings
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class Row(SlotSettings):
+    __slots__ = 'name', 'size', 'enabled', 'tags'
+
+    def init_settings(self, **kwargs) -> None:
+        self.name = 'row'
+        self.size = 10
+        self.enabled = True
+        self.tags = []
+
+
+class Required(SlotSettings):
+    __slots__ = 'name',
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+
+class TestSparse(ConfigFileTestCaseBase):
+    def round_trip(self, data, sparse=True) -> Dummy:
+        self.save_config(data, sparse=sparse)
+        return self.load_config().data
+
+    def test_only_changes_written(self):
+        changed = Row()
+        changed.size = 3
+        changed.tags.append('x')
+        loose = Row()
+        loose.size = 10.0  # equal but not the same type
+        loose.enabled = 1
+        data = self.round_trip(Dummy(a=[Row(), changed, loose]))
+        text = self.path.read_text()
+        self.assertNotIn('"name"', text)
+        self.assertEqual(text.count('"size"'), 2)
+        self.assertNotIn('"b"', text)  # None is Dummy's default
+        plain, changed, loose = data.a
+        self.assertEqual((plain.name, plain.size, plain.enabled, plain.tags), ('row', 10, True, []))
+        self.assertEqual((changed.size, changed.tags), (3, ['x']))
+        self.assertIs(type(loose.size), float)
+        self.assertIs(type(loose.enabled), int)
+        self.assertIsNone(data.b)
+
+    def test_full_by_default(self):
+        self.round_trip(Dummy(a=Row()), sparse=False)
+        self.assertIn('"name"', self.path.read_text())
+
+    def test_needs_arguments(self):
+        self.assertIsNone(Required.get_default_state())
+        data = self.round_trip(Dummy(a=Required('row')))
+        self.assertEqual(data.a.name, 'row')
+
+
+if __name__ == '__main__':
+    main()
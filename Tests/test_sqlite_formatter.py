@@ -0,0 +1,80 @@
+import sqlite3
+from contextlib import closing
+from unittest import main
+
+from grave_settings.config_file import ConfigFile
+from grave_settings.formatters.sqlite import SqliteFormatter
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class TestSqliteFormatter(ConfigFileTestCaseBase):
+    FILE_NAME = 'config.sqlite'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.data = Dummy(a=[1, 2.5, True, None, 's', 1 << 70])
+        self.data.b = Dummy(a=self.data.a, b={'k': {'z': [1]}, 'n': {3: 4}})
+        self.config = self.save_config(self.data)
+
+    def get_rows(self) -> dict:
+        with closing(sqlite3.connect(self.path)) as conn:
+            return {row[0]: row[1:] for row in conn.execute('SELECT id, pos, value, digest FROM nodes')}
+
+    def test_roundtrip(self):
+        self.assertIsInstance(self.config.formatter, SqliteFormatter)
+        config = self.load_config()
+        self.assertEqual(config.data.a, [1, 2.5, True, None, 's', 1 << 70])
+        self.assertIs(config.data.b.a, config.data.a)
+        self.assertEqual(config.data.b.b, {'k': {'z': [1]}, 'n': {3: 4}})
+
+    def test_only_changed_rows_written(self):
+        before = self.get_rows()
+        self.data.b.b['k']['z'].append(2)
+        self.config.save()
+        after = self.get_rows()
+        changed = [row_id for row_id in after if before.get(row_id) != after[row_id]]
+        self.assertEqual(len(changed), 6)  # root, b, b.b, k, z and the new item
+        self.data.b.b.pop('n')
+        self.config.save()
+        self.assertEqual(len(self.get_rows()), len(after) - 6)
+
+    def test_skip_unchanged_writes_in_place(self):
+        config = ConfigFile(self.path, data=self.data, skip_unchanged=True)
+        with closing(sqlite3.connect(self.path)) as conn:  # dropped if the file were replaced
+            conn.executescript('''
+                CREATE TABLE writes (id INTEGER);
+                CREATE TRIGGER count_updates AFTER UPDATE ON nodes BEGIN INSERT INTO writes VALUES (new.id); END;
+                CREATE TRIGGER count_inserts AFTER INSERT ON nodes BEGIN INSERT INTO writes VALUES (new.id); END;
+            ''')
+        config.save()
+        self.data.b.b['k']['z'].append(2)
+        config.save()
+        with closing(sqlite3.connect(self.path)) as conn:
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM writes').fetchone(), (6,))
+
+    def test_journal_rejected(self):
+        with self.assertRaises(ValueError):
+            ConfigFile(self.path, data=self.data, journal=True)
+
+    def test_references_record_row_ids(self):
+        with closing(sqlite3.connect(self.path)) as conn:
+            (ref,) = conn.execute('SELECT ref FROM nodes WHERE ref IS NOT NULL').fetchone()
+            self.assertEqual(conn.execute('SELECT key FROM nodes WHERE id = ?', (ref,)).fetchone(), ('a',))
+
+    def test_read_subtree(self):
+        formatter = SqliteFormatter()
+        self.assertEqual(formatter.read_subtree(str(self.path), ['b', 'b', 'k']), {'z': [1]})
+        self.assertEqual(formatter.read_subtree(str(self.path), ['a', 1]), 2.5)
+        with self.assertRaises(KeyError):
+            formatter.read_subtree_obj(str(self.path), ['missing'])
+
+    def test_buffers(self):
+        formatter = SqliteFormatter()
+        remade = formatter.loads(formatter.dumps(Dummy(a={'x': [False]})))
+        self.assertEqual(remade.a, {'x': [False]})
+        with self.assertRaises(ValueError):
+            formatter.write_to_file(self.data, str(self.path) + '.gz')
+
+
+if __name__ == '__main__':
+    main()
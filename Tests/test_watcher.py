@@ -0,0 +1,85 @@
+import os
+import time
+from unittest import main
+
+from grave_settings.base import Settings
+from grave_settings.watcher import InotifyWaiter
+from integration_tests_base import Dummy, ConfigFileTestCaseBase
+
+
+class TestReload(ConfigFileTestCaseBase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.write(Dummy(a=1, b=Dummy(a=2, b=[1, 2])))
+
+    def write(self, data):
+        self.save_config(data)
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))  # coarse mtimes
+
+    def test_apply_changes(self):
+        target = Settings()
+        target.update({'a': 1, 'b': Dummy(a=1, b=2), 'c': 3})
+        inner = target['b']
+        calls = []
+        listener = lambda keys=None: calls.append(keys)
+        target.invalidate.subscribe(listener)
+        source = Settings()
+        source.update({'a': 1, 'b': Dummy(a=5, b=2), 'd': 4})
+        self.assertTrue(target.apply_changes(source))
+        self.assertIs(target['b'], inner)
+        self.assertEqual(inner.a, 5)
+        self.assertEqual(dict(target.sd), {'a': 1, 'b': inner, 'd': 4})
+        self.assertEqual(calls, [frozenset('cd')])
+        self.assertFalse(target.apply_changes(source))
+
+    def test_reload_in_place(self):
+        config = self.load_config(auto_save=True)
+        inner = config.data.b
+        events = []
+        inner.subscribe_key('a', lambda *args: events.append(args))
+        self.write(Dummy(a=1, b=Dummy(a=3, b=[1, 2])))
+        identity = config.get_file_identity(self.path)
+        self.assertTrue(config.reload())
+        self.assertIs(config.data.b, inner)
+        self.assertEqual(events, [('a', 2, 3)])
+        self.assertEqual(config.get_file_identity(self.path), identity)  # auto save did not write
+        self.assertFalse(config.changes_made)
+        self.assertFalse(config.reload())
+
+    def wait_for(self, predicate, timeout=5.0):
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            if predicate():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def check_watch(self, use_inotify: bool):
+        config = self.load_config()
+        inner = config.data.b
+        watcher = config.watch(interval=0.05, use_inotify=use_inotify)
+        try:
+            config.data['a'] = 10
+            config.save()  # our own save is not reloaded
+            time.sleep(0.1)
+            self.assertEqual(watcher.reloads, 0)
+            self.write(Dummy(a=10, b=Dummy(a=7, b=[1, 2])))
+            self.assertTrue(self.wait_for(lambda: inner.a == 7))
+            self.assertIs(config.data.b, inner)
+        finally:
+            config.close()
+        self.assertIsNone(config.watcher)
+        self.assertFalse(watcher.thread.is_alive())
+
+    def test_watch_polling(self):
+        self.check_watch(False)
+
+    def test_watch_inotify(self):
+        if not InotifyWaiter.is_supported():
+            self.skipTest('inotify is not available')
+        self.check_watch(True)
+
+
+if __name__ == '__main__':
+    main()
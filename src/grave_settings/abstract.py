@@ -5,9 +5,10 @@
 @author: ☙ Ryan McConnell ❧
 """
 from abc import abstractmethod
-from typing import TypeVar, MutableMapping, Type, Mapping, Callable, Self, Generator, Literal
+from weakref import WeakValueDictionary
+from typing import TypeVar, MutableMapping, Type, Mapping, Callable, Self, Generator, Literal, Iterable, AbstractSet
 
-from observer_hooks import notify
+from observer_hooks import notify, AbortNotifyException, HardRefEventHandler
 
 from grave_settings.conversion_manager import ConversionManager
 from grave_settings.formatter_settings import FormatterContext, PreservedReference
@@ -97,11 +98,76 @@ def make_kill_converter(cls: Type[VersionedSerializable]) -> Callable[[dict], di
     return lambda _: cls().to_dict(explicit=True)
 
 
+class _Missing:
+    __slots__ = tuple()
+
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()  # the old value of a new key and the new value of a deleted key in key change events
+
+
+class InvalidationBatch:
+    """
+    Returned by :py:meth:`IASettings.batch`. While it is entered, invalidations of the settings object are recorded
+    instead of notified. Leaving the outermost with block emits a single invalidate(keys=...) with the union of the
+    changed keys, or keys=None if any change did not say which keys it touched
+    """
+    __slots__ = 'settings', 'depth', 'keys', 'changed'
+
+    def __init__(self, settings: 'IASettings'):
+        self.settings = settings
+        self.depth = 0
+        self.keys: set | None = set()
+        self.changed = False
+
+    def record(self, keys: Iterable | None):
+        self.changed = True
+        if keys is None:
+            self.keys = None
+        elif self.keys is not None:
+            self.keys.update(keys)
+
+    def record_key(self, key):
+        self.changed = True
+        if self.keys is not None:
+            self.keys.add(key)
+
+    def __enter__(self) -> 'IASettings':
+        if self.depth == 0:
+            self.settings._batch = self
+        self.depth += 1
+        return self.settings
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.depth -= 1
+        if self.depth:
+            return
+        self.settings._batch = None
+        if self.changed:  # changes that happened before an exception are still changes
+            keys = None if self.keys is None else frozenset(self.keys)
+            self.keys = set()
+            self.changed = False
+            self.settings.invalidate(keys=keys)
+
+
 class IASettings(VersionedSerializable, MutableMapping):
-    __slots__ = 'parent', '_invalidate', 'file_path'
+    __slots__ = '_parent', '_invalidate', 'file_path', '_revision', '_batch', '_key_subscriptions', '_dirty_epoch', \
+        '_lazy_members', '_key_children', '_key_listeners', 'parent_key'
+    DIRTY_SHORT_CIRCUIT = False  # set on a class to stop propagation at parents already dirty in this epoch
+    _epoch = 1
 
     def __init__(self, *args, initialize_settings=True, **kwargs):
-        self.parent: IASettings | None = None
+        self._parent: IASettings | None = None
+        self._key_children: WeakValueDictionary | None = None  # id -> object, of the objects whose parent is this one
+        self._key_listeners = 0  # key subscriptions here and on the parents
+        self.parent_key = None  # the key this object was last stored under, see key_changed
+        self._revision = 0  # bumped by invalidate. Serializer fragment caches compare against it
+        self._batch: InvalidationBatch | None = None
+        self._key_subscriptions: dict[tuple, HardRefEventHandler] | None = None
+        self._dirty_epoch = 0
+        self._lazy_members: dict | None = None  # key -> LoadOnAccessProxy, see enable_lazy_member
         if initialize_settings:
             self.init_settings(**kwargs)
 
@@ -111,21 +177,213 @@ class IASettings(VersionedSerializable, MutableMapping):
     def get_versioning_endpoint(self) -> Type[VersionedSerializable]:
         return IASettings
 
+    @property
+    def parent(self) -> 'IASettings | None':
+        return self._parent
+
+    @parent.setter
+    def parent(self, parent: 'IASettings | None'):
+        old = self._parent
+        if old is parent:
+            return
+        if old is not None:
+            old._key_children.pop(id(self), None)
+            ancestor = old
+            while ancestor is not None:  # our changes no longer reach them, see FragmentCache
+                ancestor._revision += 1
+                ancestor = ancestor._parent
+        self._parent = parent
+        delta = -(0 if old is None else old._key_listeners)
+        if parent is not None:
+            if parent._key_children is None:
+                parent._key_children = WeakValueDictionary()
+            parent._key_children[id(self)] = self
+            delta += parent._key_listeners
+        if delta:
+            self.add_key_listeners(delta)
+
+    def add_key_listeners(self, delta: int):
+        """
+        Pushes a change in the number of key subscriptions down to this object and its children
+        """
+        self._key_listeners += delta
+        if self._key_children is not None:
+            for child in list(self._key_children.values()):
+                child.add_key_listeners(delta)
+
+    def wants_keys(self) -> bool:
+        """
+        Setters check this before building the keys of an invalidation. They are only seen by key listeners and the
+        subscribers of this object's own invalidate
+        """
+        if self._key_listeners:
+            return True
+        handler = getattr(self, '_invalidate', None)
+        return handler is not None and len(handler.subs) > 0
+
+    def invalidate_key(self, key):
+        """
+        invalidate() after a change to key. Inside a batch the key is recorded directly
+        """
+        batch = self._batch
+        if batch is not None:
+            self._revision += 1
+            batch.record_key(key)
+            return
+        self.invalidate(keys=frozenset((key,)) if self.wants_keys() else None)
+
     @notify()
-    def invalidate(self) -> None:
-        if self.parent is not None:
-            self.parent.invalidate()
+    def invalidate(self, keys: AbstractSet | None = None) -> None:
+        """
+        :param keys: The keys that changed, None when they are not known (ex: a change propagated from a child)
+        """
+        self._revision += 1
+        if self._batch is not None:
+            self._batch.record(keys)
+            raise AbortNotifyException(None)  # the batch notifies once when it closes
+        epoch = IASettings._epoch
+        self._dirty_epoch = epoch
+        parent = self._parent
+        if parent is not None:
+            if parent.DIRTY_SHORT_CIRCUIT and parent._dirty_epoch == epoch:
+                return  # parent and its ancestors were already notified this epoch
+            parent.invalidate()
+
+    @staticmethod
+    def advance_epoch():
+        """
+        Starts a new dirty epoch, after this every invalidation propagates up the parents again. Called when settings
+        are saved. See DIRTY_SHORT_CIRCUIT
+        """
+        IASettings._epoch += 1
+
+    def is_dirty(self) -> bool:
+        """
+        :return: True if this object was invalidated since the last call to advance_epoch
+        """
+        return self._dirty_epoch == IASettings._epoch
+
+    def batch(self) -> InvalidationBatch:
+        """
+        Use as a context manager to coalesce the invalidations of many changes into one::
+
+            with settings.batch():
+                settings['a'] = 1
+                settings['b'] = 2
+
+        Batches nest, only the outermost one notifies. The parent chain is walked once when the batch closes
+        """
+        if self._batch is not None:
+            return self._batch
+        return InvalidationBatch(self)
+
+    def subscribe_key(self, key, func: Callable[[object, object, object], None]):
+        """
+        Calls func(key, old, new) whenever the value at key changes. key may be a list or tuple path through nested
+        settings, those changes are only seen when the nested settings' parent attributes lead back here. New and
+        deleted keys report :py:data:`MISSING` as the old and new value. Lambdas and partials are held strongly, other
+        callables weakly
+        """
+        path = tuple(key) if type(key) in (list, tuple) else (key,)
+        subs = self._key_subscriptions
+        if subs is None:
+            subs = self._key_subscriptions = {}
+        try:
+            handler = subs[path]
+        except KeyError:
+            handler = subs[path] = HardRefEventHandler()
+            self.add_key_listeners(1)
+        handler.subscribe(func)
+
+    def unsubscribe_key(self, key, func: Callable[[object, object, object], None]):
+        path = tuple(key) if type(key) in (list, tuple) else (key,)
+        subs = self._key_subscriptions
+        if subs is None or path not in subs:
+            return
+        handler = subs[path]
+        handler.unsubscribe(func)
+        if not handler:
+            del subs[path]
+            self.add_key_listeners(-1)
+            if not subs:
+                self._key_subscriptions = None
+
+    def has_key_listeners(self) -> bool:
+        """
+        Setters check this before gathering old values so unobserved settings don't pay for key events
+        """
+        return self._key_listeners > 0
+
+    def key_changed(self, key, old, new):
+        """
+        Delivers a key change event here and, as a key path, to the parents. The key of a child in its parent is the
+        parent_key the setters of the parent recorded when the child was stored
+        """
+        path = (key,)
+        obj = self
+        while True:
+            subs = obj._key_subscriptions
+            if subs is not None:
+                handler = subs.get(path)
+                if handler is not None:
+                    handler(path[0] if len(path) == 1 else path, old, new)
+            parent = obj._parent
+            if parent is None or not parent._key_listeners:
+                return
+            key = obj.parent_key
+            try:
+                if key is None or parent[key] is not obj:
+                    return
+            except (KeyError, AttributeError):
+                return
+            path = (key,) + path
+            obj = parent
+
+    def apply_changes(self, source: 'IASettings') -> bool:
+        """
+        Makes this object equal to source in place. Nested settings of the same type are updated recursively instead
+        of replaced so references into this tree stay valid. Only keys whose values differ are assigned, and each
+        object reports them in a single invalidation
+
+        :return: True if anything changed
+        """
+        changed = False
+        with self.batch():
+            for key, new in source.generate_key_value_pairs():
+                if key in self:
+                    old = self[key]
+                    if old is new:
+                        continue
+                    if isinstance(old, IASettings) and type(old) is type(new):
+                        changed = old.apply_changes(new) or changed
+                        continue
+                    if type(old) is type(new) and old == new:
+                        continue
+                self[key] = new
+                changed = True
+            for key in [k for k in self if k not in source]:
+                del self[key]
+                changed = True
+        return changed
 
     def update(self, mapping_obj: Mapping[_KT, _VT], **kwargs: _VT):
-        it_t = type(mapping_obj)
-        if it_t == list or it_t == tuple:
-            for k, v in mapping_obj:
-                self[k] = v
-        else:
-            for k, v in mapping_obj.items():
+        with self.batch():
+            it_t = type(mapping_obj)
+            if it_t == list or it_t == tuple:
+                for k, v in mapping_obj:
+                    self[k] = v
+            else:
+                for k, v in mapping_obj.items():
+                    self[k] = v
+            for k, v in kwargs.items():
                 self[k] = v
-        for k, v in kwargs.items():
-            self[k] = v
+
+    def enable_lazy_member(self, key):
+        """
+        Called when a lazily deserialized member (a LoadOnAccessProxy) was stored under key. Members stay proxies by
+        default, see SlotSettings
+        """
+        pass
 
     def finalize(self, frame: FormatterContext):
         for key, v in self.generate_key_value_pairs():
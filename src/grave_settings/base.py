@@ -4,12 +4,18 @@
 
 @author: ☙ Ryan McConnell ❧
 """
+from enum import Enum
+from types import NoneType
 from typing import Mapping, Generator, Type
 
 from ordered_set import OrderedSet
 from grave_settings.utilities import unwrap_slots_to_base, ext_str_slots
-from grave_settings.abstract import IASettings, _KT, _VT, VersionedSerializable
+from grave_settings.abstract import IASettings, _KT, _VT, VersionedSerializable, MISSING
 from grave_settings.formatter_settings import FormatterContext
+from grave_settings.helper_objects import lazy_members_suspended
+from grave_settings.semantics import SparseSerialization
+
+SPARSE_TYPES = frozenset((NoneType, bool, int, float, complex, str, bytes))
 
 
 class Settings(IASettings):
@@ -24,13 +30,33 @@ class Settings(IASettings):
         return Settings
 
     def update(self, __m: Mapping[_KT, _VT], **kwargs: _VT):
-        self.sd.update(__m, **kwargs)
+        changes = dict(__m, **kwargs)
+        for k, v in changes.items():
+            if isinstance(v, IASettings):
+                v.parent_key = k
+        if self.has_key_listeners():
+            sd = self.sd
+            olds = [(k, sd.get(k, MISSING)) for k in changes]
+            sd.update(changes)
+            self.invalidate(keys=frozenset(changes))
+            for k, old in olds:
+                new = changes[k]
+                if old is MISSING or old != new:
+                    self.key_changed(k, old, new)
+        else:
+            self.sd.update(changes)
+            if (batch := self._batch) is not None:
+                self._revision += 1
+                batch.record(changes)
+            else:
+                self.invalidate(keys=frozenset(changes) if self.wants_keys() else None)
 
     def __contains__(self, item):
         return item in self.sd
 
     def __setitem__(self, key, value):
         is_new = key not in self
+        prev = MISSING
         if is_new == False:
             prev = self[key]
             is_new = value != prev
@@ -39,11 +65,17 @@ class Settings(IASettings):
             set = self
             for it_ in key[:-1]:
                 set = set[it_]
-            set[key[-1]] = value
+            set[key[-1]] = value  # the nested settings object reports the key change
+            if is_new:
+                self.invalidate_key(key[0])
         else:
             self.sd[key] = value
-        if is_new:
-            self.invalidate()
+            if isinstance(value, IASettings):
+                value.parent_key = key
+            if is_new:
+                self.invalidate_key(key)
+                if self.has_key_listeners():
+                    self.key_changed(key, prev, value)
 
     def __getitem__(self, item):
         it_t = type(item)
@@ -56,7 +88,10 @@ class Settings(IASettings):
             return self.sd[item]
 
     def __delitem__(self, itm):
-        del self.sd[itm]
+        prev = self.sd.pop(itm)
+        self.invalidate_key(itm)
+        if self.has_key_listeners():
+            self.key_changed(itm, prev, MISSING)
 
     def __iter__(self):
         return iter(self.sd)
@@ -139,6 +174,29 @@ class SlotSettings(IASettings):
     def get_versioning_endpoint(cls) -> Type[VersionedSerializable]:
         return SlotSettings
 
+    def enable_lazy_member(self, key):
+        """
+        Moves the proxy out of its slot. Reading the empty slot falls through to __getattr__, which loads the proxy and
+        puts the real object in the slot. Only this instance is affected
+        """
+        lazy = self._lazy_members
+        if lazy is None:
+            lazy = self._lazy_members = {}
+        lazy[key] = getattr(self, key)
+        delattr(self, key)
+
+    def __getattr__(self, item):  # only called for empty slots and missing attributes
+        lazy = self._lazy_members if item != '_lazy_members' else None
+        if lazy is None or item not in lazy:
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{item}'")
+        proxy = lazy[item]
+        if lazy_members_suspended():
+            return proxy
+        value = proxy.resolve_proxy()
+        setattr(self, item, value)
+        lazy.pop(item, None)
+        return value
+
     def get_settings_keys_rems(self, rems=None) -> set:
         if rems is None:
             rems = self._slot_rems
@@ -151,20 +209,21 @@ class SlotSettings(IASettings):
         return self.SETTINGS_KEYS
 
     def safe_update(self, mapping_obj: Mapping[_KT, _VT], **kwargs: _VT):
-        try:
-            return super(SlotSettings, self).update(mapping_obj, **kwargs)
-        except AttributeError:
-            valid_attrs = self.get_settings_keys()
-
-            it_t = type(mapping_obj)
-            if it_t == list or it_t == tuple:
-                new_dict = {k: v for k, v in mapping_obj if k in valid_attrs}
-            else:
-                new_dict = {k: v for k, v in mapping_obj.items() if k in valid_attrs}
-            for k, v in kwargs.items():
-                if k in valid_attrs:
-                    new_dict[k] = v
-            return super(SlotSettings, self).update(new_dict)
+        with self.batch():
+            try:
+                return super(SlotSettings, self).update(mapping_obj, **kwargs)
+            except AttributeError:
+                valid_attrs = self.get_settings_keys()
+
+                it_t = type(mapping_obj)
+                if it_t == list or it_t == tuple:
+                    new_dict = {k: v for k, v in mapping_obj if k in valid_attrs}
+                else:
+                    new_dict = {k: v for k, v in mapping_obj.items() if k in valid_attrs}
+                for k, v in kwargs.items():
+                    if k in valid_attrs:
+                        new_dict[k] = v
+                return super(SlotSettings, self).update(new_dict)
 
     def __contains__(self, item):
         return hasattr(self, item)
@@ -175,13 +234,23 @@ class SlotSettings(IASettings):
             set = self
             for it_ in key[:-1]:
                 set = set[it_]
-            set[key[-1]] = value
+            set[key[-1]] = value  # the nested settings object reports the key change
+            self.invalidate_key(key[0])
         else:
             if it_t is str:
+                if isinstance(value, IASettings):
+                    value.parent_key = key
+                if self.has_key_listeners():
+                    prev = getattr(self, key, MISSING)
+                    setattr(self, key, value)
+                    self.invalidate_key(key)
+                    if prev is MISSING or prev != value:
+                        self.key_changed(key, prev, value)
+                    return
                 setattr(self, key, value)
             else:
                 raise ValueError('Keys for member settings must be string')
-        self.invalidate()
+            self.invalidate_key(key)
 
     def __getitem__(self, item):
         it_t = type(item)
@@ -208,7 +277,30 @@ class SlotSettings(IASettings):
     def generate_key_value_pairs(self) -> Generator[tuple[object, object], None, None]:
         return ((s, getattr(self, s)) for s in self.get_settings_keys())
 
+    @classmethod
+    def get_default_state(cls) -> dict | None:
+        """
+        The immutable members of a new instance, made once per class for
+        :py:class:`~grave_settings.semantics.SparseSerialization`. None if the class can't be made without arguments
+        """
+        try:
+            return cls.__dict__['_default_state']
+        except KeyError:
+            pass
+        try:
+            obj = cls()
+        except TypeError:
+            state = None
+        else:
+            state = {k: v for k, v in obj.generate_key_value_pairs()
+                     if type(v) in SPARSE_TYPES or isinstance(v, Enum)}
+        cls._default_state = state
+        return state
+
     def to_dict(self, context: FormatterContext, **kwargs) -> dict:
+        if context.semantic_context[SparseSerialization] and (defaults := self.get_default_state()) is not None:
+            return {k: v for k, v in self.generate_key_value_pairs()
+                    if not (k in defaults and type(v) is type(d := defaults[k]) and v == d)}
         return dict(self.generate_key_value_pairs())
 
     def __str__(self):
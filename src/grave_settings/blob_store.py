@@ -0,0 +1,98 @@
+# - * -coding: utf - 8 - * -
+"""
+
+
+@author: ☙ Ryan McConnell ❧
+"""
+import hashlib
+import mmap
+import os
+import re
+import threading
+from functools import partial
+from pathlib import Path
+from typing import Type
+
+from grave_settings.helper_objects import LoadOnAccessProxy
+
+BLOB_READ = 'read'
+BLOB_MMAP = 'mmap'
+BLOB_LAZY = 'lazy'
+
+
+class BlobStore:
+    """
+    Content addressed storage for large bytes values (see :py:class:`~grave_settings.semantics.ExternalBlobs`). Values
+    of at least min_bytes are written to a file named after their sha256 and the document only holds the digest, so
+    equal values share one file. Blobs are never removed since any number of configs may share a store.
+
+    mode picks what loading a blob returns. BLOB_READ reads it into bytes, BLOB_MMAP returns a read only memoryview of
+    the mapped file (no copy, but the value is no longer bytes) and BLOB_LAZY returns a LoadOnAccessProxy that reads it
+    the first time it is used
+    """
+    DIGEST_REGEX = re.compile(r'[0-9a-f]{64}')
+
+    def __init__(self, directory: Path, min_bytes: int = 1 << 16, mode: str = BLOB_READ, fsync=True):
+        if mode not in (BLOB_READ, BLOB_MMAP, BLOB_LAZY):
+            raise ValueError(f'Unknown blob mode: {mode}')
+        self.directory = Path(directory)
+        self.min_bytes = min_bytes
+        self.mode = mode
+        self.fsync = fsync
+
+    @classmethod
+    def for_config(cls, config_path: Path, **kwargs):
+        config_path = Path(config_path)
+        return cls(config_path.with_name(f'{config_path.name}.blobs'), **kwargs)
+
+    def is_external(self, data: bytes | memoryview) -> bool:
+        return (data.nbytes if type(data) is memoryview else len(data)) >= self.min_bytes
+
+    def get_path(self, digest: str) -> Path:
+        if self.DIGEST_REGEX.fullmatch(digest) is None:  # it came from a document, don't let it name other files
+            raise ValueError(f'Invalid blob digest: {digest!r}')
+        return self.directory / digest[:2] / digest
+
+    def put(self, data: bytes | memoryview) -> str:
+        """
+        :return: The digest that loads data back. Nothing is written if the store already has it
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.get_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f'{digest}.{os.getpid()}.{threading.get_ident()}.tmp')
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+            except BaseException:
+                if tmp_path.exists():
+                    os.remove(tmp_path)
+                raise
+        return digest
+
+    def read(self, digest: str) -> bytes:
+        with open(self.get_path(digest), 'rb') as f:
+            return f.read()
+
+    def map(self, digest: str) -> memoryview:
+        with open(self.get_path(digest), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:  # empty files can't be mapped
+                return memoryview(b'')
+            return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def read_as(self, digest: str, t_object: Type[bytes] = bytes) -> bytes:
+        data = self.read(digest)
+        return data if t_object is bytes else t_object(data)
+
+    def load(self, digest: str, t_object: Type[bytes] = bytes):
+        if self.mode == BLOB_MMAP:
+            return self.map(digest)
+        elif self.mode == BLOB_LAZY:
+            return LoadOnAccessProxy(partial(self.read_as, digest, t_object))
+        else:
+            return self.read_as(digest, t_object)
@@ -0,0 +1,170 @@
+# - * -coding: utf - 8 - * -
+"""
+
+
+@author: ☙ Ryan McConnell ❧
+"""
+import marshal
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+try:
+    import fcntl
+except ImportError:  # not a POSIX system
+    fcntl = None
+
+BROADCAST_MAGIC = b'GSB1'
+# magic, sequence, version, capacity, payload length
+BROADCAST_HEADER = struct.Struct('<4sQQQQ')
+SEQUENCE = struct.Struct('<Q')
+SEQUENCE_OFFSET = 4
+
+
+class SettingsBroadcast:
+    """
+    A version counter and an optional payload shared between processes through a memory mapped file, meant for
+    prefork servers where every worker holds a ConfigFile of the same file. The process that reloads the file
+    publishes the parsed tree and the others adopt it without parsing the text (see ConfigFile's broadcast parameter).
+
+    Writers take an exclusive flock. Readers never lock: the header holds a sequence number that is odd while a write is
+    in progress, a read is retried if the sequence was odd or changed while it copied the payload. The payload is
+    encoded with marshal so it can only hold the types marshal supports, and all processes must run the same Python
+    version. It needs fcntl, so it is not available on Windows
+
+    Growing the file maps it again. The old mapping is not closed, readers of this process that still hold it keep it
+    alive and it is unmapped when the last of them lets go of it
+    """
+    SPIN_LIMIT = 1000
+
+    def __init__(self, path: Path, capacity: int = 1 << 16):
+        if fcntl is None:
+            raise OSError('SettingsBroadcast needs fcntl.flock, which this platform does not have')
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+        self.lock_depth = 0
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            with self.exclusive():
+                if os.fstat(self.fd).st_size < BROADCAST_HEADER.size:
+                    capacity = max(capacity, BROADCAST_HEADER.size)
+                    os.ftruncate(self.fd, capacity)
+                    os.pwrite(self.fd, BROADCAST_HEADER.pack(BROADCAST_MAGIC, 0, 0, capacity, 0), 0)
+                self.mm = mmap.mmap(self.fd, os.fstat(self.fd).st_size)
+                if self.mm[:len(BROADCAST_MAGIC)] != BROADCAST_MAGIC:
+                    raise ValueError(f'Not a settings broadcast file: {self.path}')
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    @classmethod
+    def for_config(cls, config_path: Path, dir_name='__gscache__', **kwargs):
+        """
+        :return: The broadcast of a config file, kept in the same cache directory as the SidecarCache entries
+        """
+        config_path = Path(config_path)
+        return cls(config_path.parent / dir_name / f'{config_path.name}.gsb', **kwargs)
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Holds the writer lock, for this process's threads and for other processes
+        """
+        with self.lock:
+            if self.lock_depth == 0:
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            self.lock_depth += 1
+            try:
+                yield self
+            finally:
+                self.lock_depth -= 1
+                if self.lock_depth == 0:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def remap(self):
+        self.mm = mmap.mmap(self.fd, os.fstat(self.fd).st_size)  # readers may still be using the old one
+
+    def read_header(self) -> tuple:
+        for _ in range(self.SPIN_LIMIT):
+            mm = self.mm
+            header = BROADCAST_HEADER.unpack_from(mm, 0)
+            if header[1] & 1 == 0 and SEQUENCE.unpack_from(mm, SEQUENCE_OFFSET)[0] == header[1]:
+                return header
+            time.sleep(0)
+        with self.exclusive():  # a writer died mid write, the payload is garbage but the header is not
+            return BROADCAST_HEADER.unpack_from(self.mm, 0)
+
+    @property
+    def version(self) -> int:
+        return self.read_header()[2]
+
+    def read(self) -> tuple[int, Any]:
+        """
+        :return: The published version and payload. The payload is None if nothing was published with it
+        """
+        for _ in range(self.SPIN_LIMIT):
+            mm = self.mm  # the same mapping for the whole attempt
+            _, sequence, version, capacity, length = BROADCAST_HEADER.unpack_from(mm, 0)
+            if sequence & 1:
+                time.sleep(0)
+                continue
+            if capacity > len(mm):  # another process grew the file
+                with self.lock:
+                    if self.mm is mm:
+                        self.remap()
+                continue
+            data = mm[BROADCAST_HEADER.size:BROADCAST_HEADER.size + length]
+            if SEQUENCE.unpack_from(mm, SEQUENCE_OFFSET)[0] == sequence:
+                break
+        else:
+            with self.exclusive():
+                _, sequence, version, capacity, length = BROADCAST_HEADER.unpack_from(self.mm, 0)
+                if sequence & 1:
+                    return version, None
+                data = self.mm[BROADCAST_HEADER.size:BROADCAST_HEADER.size + length]
+        if not data:
+            return version, None
+        try:
+            return version, marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            return version, None
+
+    def publish(self, payload: Any = None) -> int:
+        """
+        Bumps the version and replaces the payload. Payloads marshal can't encode are published as None
+
+        :return: The new version
+        """
+        try:
+            data = b'' if payload is None else marshal.dumps(payload)
+        except ValueError:
+            data = b''
+        with self.exclusive():
+            _, sequence, version, capacity, _ = BROADCAST_HEADER.unpack_from(self.mm, 0)
+            if capacity > len(self.mm):
+                self.remap()
+            needed = BROADCAST_HEADER.size + len(data)
+            if needed > len(self.mm):
+                capacity = max(needed, len(self.mm) * 2)
+                os.ftruncate(self.fd, capacity)
+                self.remap()
+            sequence += 1 + (sequence & 1)  # odd, a writer that died left it odd already
+            SEQUENCE.pack_into(self.mm, SEQUENCE_OFFSET, sequence)
+            self.mm[BROADCAST_HEADER.size:needed] = data
+            version += 1
+            BROADCAST_HEADER.pack_into(self.mm, 0, BROADCAST_MAGIC, sequence, version, capacity, len(data))
+            SEQUENCE.pack_into(self.mm, SEQUENCE_OFFSET, sequence + 1)
+            return version
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                self.mm.close()
+                os.close(self.fd)
+                self.fd = None
@@ -4,22 +4,40 @@
 
 @author: ☙ Ryan McConnell ❧
 """
+import hashlib
+import json
 import os
+import re
 import shutil
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import Self, Any, Type
+from typing import Self, Any, Type, Iterable
 
 from observer_hooks import EventCapturer
 
 from grave_settings.utilities import format_class_str
 from grave_settings.abstract import IASettings, Serializable
+from grave_settings.blob_store import BlobStore
+from grave_settings.broadcast import SettingsBroadcast
+from grave_settings.document_cache import DocumentCache, DEFAULT_DOCUMENT_CACHE
 from grave_settings.formatter_settings import FormatterContext
 from grave_settings.formatters.toml import TomlFormatter
 from grave_settings.formatters.json import JsonFormatter
-from grave_settings.formatter import Formatter, DeSerializer, Serializer
+from grave_settings.formatters.sqlite import SqliteFormatter
+from grave_settings.formatter import Formatter, DeSerializer, Serializer, COMPRESSION_SUFFIXES, FragmentCache
 from grave_settings.handlers import OrderedHandler
-from grave_settings.semantics import ClassStringPassFunction, Semantics, Semantic
+from grave_settings.helper_objects import LoadOnAccessProxy
+from grave_settings.journal import SettingsJournal, JOURNAL_SET, JOURNAL_DELETE
+from grave_settings.sidecar_cache import SidecarCache
+from grave_settings.watcher import ConfigWatcher
+from grave_settings.semantics import ClassStringPassFunction, Semantics, Semantic, SortKeys, LazyDeserialization, \
+    OffsetIndex, ExternalBlobs, ColumnarEncoding, SparseSerialization
 
 
 class PassLogFilePath(Semantic[str]):
@@ -54,17 +72,334 @@ class LogFileLink(Serializable):
         self.config = state_obj['config']
 
 
+class DependencyPrefetcher:
+    """
+    Reads and parses the files of a ConfigFile dependency graph on a thread pool. Each parsed file is scanned for
+    LogFileLink objects so the files they point to are queued long before deserialization reaches them
+    """
+    def __init__(self, max_workers: int | None = None):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ConfigFilePrefetch')
+        self.lock = threading.Lock()
+        self.futures: dict[Path, Future] = {}
+        self.link_class_str = format_class_str(LogFileLink)
+
+    def prefetch(self, path: Path, formatter: Formatter, compression: str | bool | None = None):
+        with self.lock:
+            if path not in self.futures:
+                self.futures[path] = self.pool.submit(self.read, path, formatter, compression)
+
+    def read(self, path: Path, formatter: Formatter, compression: str | bool | None):
+        buffer = formatter.read_buffer_from_file(str(path), compression=compression)
+        obj = formatter.buffer_to_obj(buffer, formatter.get_deserialization_context())
+        for link_path in self.find_link_paths(obj, formatter.spec.class_id, path.parent):
+            if (fmt := ConfigFile.get_formatter_str_from_path(link_path)) is not None:
+                self.prefetch(link_path, ConfigFile.FORMATTER_STR_DICT[fmt])
+        return formatter, buffer, obj
+
+    def find_link_paths(self, obj, class_id: str, base: Path) -> Iterable[Path]:
+        stack = [obj]
+        while stack:
+            o = stack.pop()
+            if type(o) is dict:
+                if o.get(class_id) == self.link_class_str:
+                    if (path := self.get_link_path(o, base)) is not None:
+                        yield path
+                else:
+                    stack.extend(o.values())
+            elif type(o) is list:
+                stack.extend(o)
+
+    @staticmethod
+    def get_link_path(state_obj: dict, base: Path) -> Path | None:
+        path = state_obj.get('rel_path', state_obj.get('path'))
+        if type(path) is dict:  # a serialized pathlib.Path
+            path = path.get('path') if path.get('abs') else path.get('rel_path', path.get('path'))
+        if type(path) is not str:
+            return None
+        return (base / path).resolve()
+
+    def take(self, path: Path, formatter: Formatter) -> tuple[str | bytes, Any] | None:
+        """
+        :return: The buffer and parsed object of path if it was prefetched with the same type of formatter
+        """
+        with self.lock:
+            future = self.futures.pop(path, None)
+        if future is None or future.exception() is not None:
+            return None  # loading the file normally will raise the error in context
+        fmt, buffer, obj = future.result()
+        if type(fmt) is not type(formatter):
+            return None
+        return buffer, obj
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class WriteBehindSaver:
+    """
+    Coalesces save requests for a ConfigFile and performs them on a background thread. The first request opens a window
+    of delay seconds, every request inside the window is folded into the save at its end. Failed saves are kept
+    pending and re-raised by flush()
+    """
+    def __init__(self, config: 'ConfigFile', delay: float):
+        self.config = weakref.ref(config)
+        self.delay = delay
+        self.condition = threading.Condition()
+        self.save_lock = threading.Lock()
+        self.pending = False
+        self.deadline: float | None = None
+        self.closed = False
+        self.error: Exception | None = None
+        self.thread: threading.Thread | None = None
+
+    def schedule(self):
+        with self.condition:
+            if self.closed:
+                raise ValueError('Saver is closed')
+            self.pending = True
+            if self.deadline is None:
+                self.deadline = time.monotonic() + self.delay
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='WriteBehindSaver', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.closed and self.deadline is None:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                while not self.closed and (remaining := self.deadline - time.monotonic()) > 0:
+                    self.condition.wait(remaining)
+                if self.closed:
+                    return  # close() flushes on the closing thread
+            try:
+                if not self.save():
+                    return
+            except Exception as e:
+                self.error = e
+
+    def save(self) -> bool:
+        with self.save_lock:
+            with self.condition:
+                pending = self.pending
+                self.pending = False
+                self.deadline = None
+            if not pending:
+                return True
+            config = self.config()
+            if config is None:
+                return False
+            try:
+                config.save()
+            except Exception:
+                with self.condition:
+                    self.pending = True
+                raise
+            self.error = None
+            return True
+
+    def flush(self):
+        self.save()
+        if (error := self.error) is not None:
+            self.error = None
+            raise error
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+        self.flush()
+
+
+class ShardPolicy:
+    """
+    Decides which IASettings subtrees of a ConfigFile are written to files of their own (shards). A subtree is sharded
+    if it is an instance of one of types or if its serialized form is estimated to be at least min_bytes, not counting
+    the shards inside it. Shards are linked like configs added with add_config_dependency and live in a directory
+    named after the root file (settings.json -> settings.json.shards/settings.<key path>.json). Every save serializes
+    them but they are only written when their output changed.
+
+    Like linked configs, PreservedReferences do not cross shard boundaries: an object reachable from two shards is
+    written (and loaded) once per shard
+    """
+    FILE_NAME_REGEX = re.compile(r'[^\w\-]')
+
+    def __init__(self, min_bytes: int | None = None, types: Iterable[Type[IASettings]] = ()):
+        self.min_bytes = min_bytes
+        self.types = tuple(types)
+
+    def is_shard_type(self, obj: IASettings) -> bool:
+        return isinstance(obj, self.types)
+
+    def is_shard_size(self, ser_obj) -> bool:
+        return self.min_bytes is not None and self.estimate_size(ser_obj) >= self.min_bytes
+
+    @staticmethod
+    def estimate_size(ser_obj) -> int:
+        """
+        :return: The length of ser_obj as compact JSON. Other formats are close enough for a threshold
+        """
+        return len(json.dumps(ser_obj, separators=(',', ':'), default=str))
+
+    @staticmethod
+    def get_directory(config_path: Path) -> Path:
+        return config_path.with_name(f'{config_path.name}.shards')
+
+    def get_file_name(self, owner_path: Path, key_path: list) -> str:
+        """
+        :return: The name of the shard holding the subtree at key_path of the config at owner_path. It keeps the
+            format and compression suffixes of owner_path
+        """
+        name = owner_path.name
+        suffixes = owner_path.suffixes
+        n_suffixes = 0
+        if suffixes and suffixes[-1].lower() in COMPRESSION_SUFFIXES:
+            n_suffixes += 1
+        if len(suffixes) > n_suffixes and suffixes[-1 - n_suffixes][1:].lower() in ConfigFile.FORMATTER_STR_DICT:
+            n_suffixes += 1
+        suffix = ''.join(suffixes[len(suffixes) - n_suffixes:])
+        stem = name[:len(name) - len(suffix)]
+        parts = '.'.join(self.FILE_NAME_REGEX.sub('_', str(k)) for k in key_path)
+        return f'{stem}.{parts}{suffix}'
+
+
 class ConfigFile(Serializable):
     FORMATTER_STR_DICT = {
         'json': JsonFormatter(),
-        'toml': TomlFormatter()
+        'toml': TomlFormatter(),
+        'sqlite': SqliteFormatter()
     }
 
     def __init__(self, file_path: Path, data: IASettings | Any | Type | None = None,
-                 formatter: None | Formatter | str = None, auto_save=False, read_only=False):
+                 formatter: None | Formatter | str = None, auto_save=False, read_only=False,
+                 compression: str | bool | None = None, canonical=False, skip_unchanged: bool | None = None,
+                 cache_fragments=False, auto_save_delay: float | None = None, atomic_save=False, max_workers=1,
+                 lazy_links=False, document_cache: DocumentCache | bool | None = None,
+                 sidecar_cache: SidecarCache | bool | None = None, broadcast: SettingsBroadcast | bool | None = None,
+                 journal: SettingsJournal | bool | None = None, lazy_subtrees=False,
+                 offset_index=False, shard_policy: ShardPolicy | None = None,
+                 blob_store: BlobStore | bool | None = None, columnar_lists=0, sparse=False):
+        """
+        :param compression: None picks the compression from the file suffix (ex: settings.json.gz), False disables it
+            and a string names one of the formatter's compression openers. When formatter is None it is guessed from
+            the suffix in front of the compression suffix
+        :param canonical: Write keys in sorted order so equal states always produce equal bytes
+        :param skip_unchanged: Hash the output of save and do not touch the file if it matches what was last read or
+            written (and the file has not been changed by someone else since). The output is buffered to do this.
+            Formatters that write in place (ex: SqliteFormatter) only write what changed already and save as usual.
+            None turns it on when there is a shard_policy
+        :param cache_fragments: Keep the serialized form of IASettings subtrees between saves and only re-serialize
+            the ones that were invalidated. Whole subtrees are only reused when their nested settings have their parent
+            set. See :py:class:`~grave_settings.formatter.FragmentCache`
+        :param auto_save_delay: With auto_save, invalidations are coalesced for this many seconds and saved on a
+            background thread (see :py:class:`WriteBehindSaver`). Call flush() or close() to make sure they are written
+        :param atomic_save: Write to a temporary file and replace the target so a crash never leaves a partial file.
+            The file is replaced rather than rewritten in place, see Formatter.write_chunks_to_file
+        :param max_workers: Above 1, the files of linked configs are read and parsed ahead of time on a thread pool
+            when loading (de-serializing them stays on the loading thread), and saved level by level (dependencies
+            first) on a thread pool when saving. Configs in the same level are serialized and written concurrently
+        :param lazy_links: Linked configs are not loaded with this one. A
+            :py:class:`~grave_settings.helper_objects.LoadOnAccessProxy` takes their place and loads them the first time
+            it is used. Linked configs that were never loaded are not saved
+        :param document_cache: Load through a :py:class:`~grave_settings.document_cache.DocumentCache` so files that
+            have not changed are not read and parsed again. True uses the process wide DEFAULT_DOCUMENT_CACHE
+        :param sidecar_cache: Load through a :py:class:`~grave_settings.sidecar_cache.SidecarCache` that keeps a
+            binary copy of the parsed file in a __gscache__ directory next to it. True uses a default SidecarCache.
+            Only one of document_cache, sidecar_cache and broadcast can be used
+        :param broadcast: Share parsed versions of the file with other processes through a
+            :py:class:`~grave_settings.broadcast.SettingsBroadcast`. Whichever process loads a new version of the file
+            first parses and publishes it, the others adopt the published tree. Our saves are published as a new
+            version without a tree. True uses SettingsBroadcast.for_config
+        :param journal: Save changes to top level keys by appending them to a
+            :py:class:`~grave_settings.journal.SettingsJournal` instead of rewriting the file, and replay it when
+            loading. Only changes made through __setitem__, __delitem__ and update are seen. Changes that share an
+            object with another key, and the first save after a load, write the file in full. True uses
+            SettingsJournal.for_config. Formatters that write in place can't be journaled
+        :param lazy_subtrees: Nested settings objects are loaded the first time they are used. See
+            :py:class:`~grave_settings.semantics.LazyDeserialization`
+        :param offset_index: Write the file with an index of where its members are so Formatter.read_subtree can read
+            one of them without parsing the whole file. See :py:class:`~grave_settings.semantics.OffsetIndex`
+        :param shard_policy: Split subtrees into linked files of their own, see :py:class:`ShardPolicy`. Needs
+            skip_unchanged so a change inside a shard does not rewrite this file
+        :param blob_store: Write large bytes values to a :py:class:`~grave_settings.blob_store.BlobStore` instead of
+            hex encoding them in the file. True uses BlobStore.for_config. Linked configs use the same store
+        :param columnar_lists: Lists of at least this many objects of the same settings class are written as columns
+            (one key list and one array per key) instead of a dictionary per object. 0 disables it. See
+            :py:class:`~grave_settings.semantics.ColumnarEncoding`
+        :param sparse: SlotSettings members that still have the value a new instance of their class has are not
+            written. See :py:class:`~grave_settings.semantics.SparseSerialization`
+        :raises ValueError: For options that can't be combined
+        """
+        self.file_path = file_path.resolve().absolute()
+        if formatter is None:
+            formatter = self.get_formatter_str_from_path(self.file_path)
         if type(formatter) == str:
             formatter = self.FORMATTER_STR_DICT[formatter]
-        self.file_path = file_path.resolve().absolute()
+        if skip_unchanged is None:
+            skip_unchanged = shard_policy is not None
+        elif shard_policy is not None and not skip_unchanged:
+            raise ValueError('shard_policy needs skip_unchanged, every save would rewrite all shards')
+        if sum(x not in (None, False) for x in (document_cache, sidecar_cache, broadcast)) > 1:
+            raise ValueError('Only one of document_cache, sidecar_cache and broadcast can be used to load')
+        if journal not in (None, False) and formatter is not None and formatter.WRITES_IN_PLACE:
+            raise ValueError(f'{formatter.__class__.__name__} already writes only what changed, it can\'t be journaled')
+        if read_only and auto_save:
+            raise ValueError('A read-only config can\'t auto save')
+        self.compression = compression
+        self.canonical = canonical
+        self.skip_unchanged = skip_unchanged
+        self.content_digest: str | None = None
+        self.content_identity: tuple | None = None
+        self.fragment_cache = FragmentCache() if cache_fragments else None
+        self.atomic_save = atomic_save
+        self.max_workers = max_workers
+        self.lazy_links = lazy_links
+        self.lazy_subtrees = lazy_subtrees
+        self.offset_index = offset_index
+        self.columnar_lists = columnar_lists
+        self.sparse = sparse
+        self.shard_policy = shard_policy
+        self.shard_directory: Path | None = None  # None for a root config, shards of shards share one directory
+        self.shard_links: list[list[tuple[Any, LogFileLink]]] = []  # links written inside each subtree being measured
+        if document_cache is True:
+            document_cache = DEFAULT_DOCUMENT_CACHE
+        elif document_cache is False:
+            document_cache = None
+        self.document_cache: DocumentCache | None = document_cache
+        if sidecar_cache is True:
+            sidecar_cache = SidecarCache()
+        elif sidecar_cache is False:
+            sidecar_cache = None
+        self.sidecar_cache: SidecarCache | None = sidecar_cache
+        if broadcast is True:
+            broadcast = SettingsBroadcast.for_config(self.file_path)
+        elif broadcast is False:
+            broadcast = None
+        self.broadcast: SettingsBroadcast | None = broadcast
+        self.broadcast_version: int | None = None  # the last version we published or adopted
+        if journal is True:
+            journal = SettingsJournal.for_config(self.file_path)
+        elif journal is False:
+            journal = None
+        self.journal: SettingsJournal | None = journal
+        self.journal_owners: dict[int, Any] | None = None  # object id -> top level key, as of the file and journal
+        if blob_store is True:
+            blob_store = BlobStore.for_config(self.file_path)
+        elif blob_store is False:
+            blob_store = None
+        self.blob_store: BlobStore | None = blob_store
+        self.file_identity: tuple | None = None  # of the file as we last read or wrote it
+        self.reloading = False
+        self.watcher: ConfigWatcher | None = None
+        self.prefetcher: DependencyPrefetcher | None = None
+        self.save_lock = threading.RLock()
+        self.write_behind = None if auto_save_delay is None else WriteBehindSaver(self, auto_save_delay)
         self.data = data
         self.auto_save = auto_save
         self.formatter = formatter
@@ -72,6 +407,31 @@ class ConfigFile(Serializable):
         self.read_only = read_only
         self.sub_configs: dict[Any, LogFileLink] = {}
         self.sub_config_paths: dict[Path, Any] = {}
+        self.subscribed_data: IASettings | None = None
+        self.subscribe_data()
+
+    def subscribe_data(self):
+        """
+        Moves our invalidate subscription to the current data object. Objects we no longer hold can't trigger saves
+        """
+        data = self.data
+        old = self.subscribed_data
+        if old is data:
+            return
+        if old is not None:
+            old.invalidate.unsubscribe(self.settings_invalidated)
+            self.subscribed_data = None
+        if isinstance(data, IASettings):
+            data.invalidate.subscribe(self.settings_invalidated)
+            self.subscribed_data = data
+
+    @classmethod
+    def get_formatter_str_from_path(cls, path: Path) -> str | None:
+        suffixes = path.suffixes
+        if suffixes and suffixes[-1].lower() in COMPRESSION_SUFFIXES:
+            suffixes = suffixes[:-1]
+        if suffixes and (fmt := suffixes[-1][1:].lower()) in cls.FORMATTER_STR_DICT:
+            return fmt
 
     def add_config_dependency(self, other: 'ConfigFile', relative_path=True):
         if not other.is_loaded():
@@ -82,12 +442,17 @@ class ConfigFile(Serializable):
             log_file_link = LogFileLink(config=other, file_path=other.file_path)
         self.add_log_file_link(log_file_link)
 
-    def add_log_file_link(self, link: LogFileLink):
+    def add_log_file_link(self, link: LogFileLink, data: Any = None):
+        """
+        :param data: The object that stands for the linked config in our data. Defaults to the linked config's data
+        """
         other = link.config
+        if data is None:
+            data = other.data
         if other.file_path in self.sub_config_paths:
             self.sub_configs.pop(self.sub_config_paths[other.file_path])
-        self.sub_configs[other.data] = link
-        self.sub_config_paths[other.file_path] = other.data
+        self.sub_configs[data] = link
+        self.sub_config_paths[other.file_path] = data
 
     def is_loaded(self):
         return self.data is not None and not isinstance(self.data, type)
@@ -99,10 +464,149 @@ class ConfigFile(Serializable):
             backup_path = base / f"{self.file_path.stem}_backup_{dt_n}{self.file_path.suffix}"
             shutil.copyfile(str(self.file_path), str(backup_path))
 
-    def settings_invalidated(self):
+    def settings_invalidated(self, *args, **kwargs):
+        if self.reloading:  # the changes came from the file
+            return
+        if self.journal is not None:
+            self.journal.record(kwargs.get('keys', args[0] if args else None))
         self.changes_made = True
         if self.auto_save:
-            self.save()
+            if self.write_behind is None:
+                self.save()
+            else:
+                self.write_behind.schedule()
+
+    def flush(self):
+        """
+        Performs any save that the write-behind auto save is holding on to
+        """
+        if self.write_behind is not None:
+            self.write_behind.flush()
+
+    def close(self):
+        """
+        Flushes and stops the write-behind auto save thread and stops watching the file
+        """
+        self.unwatch()
+        if self.write_behind is not None:
+            self.write_behind.close()
+
+    def watch(self, interval: float = 1.0, use_inotify=True) -> ConfigWatcher:
+        """
+        Starts reloading the data in place (see reload) whenever the file changes on disk. See
+        :py:class:`~grave_settings.watcher.ConfigWatcher`
+        """
+        self.unwatch()
+        self.watcher = ConfigWatcher(self, interval=interval, use_inotify=use_inotify)
+        return self.watcher
+
+    def unwatch(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reloads if the file is not the one we last read or wrote
+
+        :return: True if the data changed
+        """
+        with self.save_lock:  # a save in progress has replaced the file but not recorded its identity yet
+            identity = self.get_file_identity(self.file_path)
+            if identity is None or identity == self.file_identity:
+                return False
+            return self.reload()
+
+    def reload_if_published(self) -> bool:
+        """
+        Reloads if another process published a version of the file we have not seen. Cheaper than reload_if_changed
+        since it reads shared memory instead of calling stat
+
+        :return: True if the data changed
+        """
+        if self.broadcast is None or self.broadcast.version == self.broadcast_version:
+            return False
+        with self.save_lock:
+            version = self.broadcast.version
+            if self.get_file_identity(self.file_path) == self.file_identity:
+                self.broadcast_version = version
+                return False
+            return self.reload()
+
+    def read_through_broadcast(self, path: Path, formatter: Formatter, identity: tuple) -> tuple[str, Any]:
+        """
+        :return: The content digest and parsed tree of path, from the broadcast if it was published for this identity
+            of the file. Otherwise the file is parsed and published while holding the broadcast's writer lock, so
+            processes loading the same new file wait for one of them to parse it
+        """
+        key = (identity, format_class_str(formatter.__class__), self.compression)
+        with self.broadcast.exclusive():
+            version, payload = self.broadcast.read()
+            if type(payload) is tuple and len(payload) == 3 and payload[0] == key:
+                self.broadcast_version = version
+                return payload[1], payload[2]
+            buffer = formatter.read_buffer_from_file(str(path), compression=self.compression)
+            obj = formatter.buffer_to_obj(buffer, formatter.get_deserialization_context())
+            digest = self.get_content_digest((buffer,))
+            if self.get_file_identity(path) == identity:  # unchanged while we parsed it
+                self.broadcast_version = self.broadcast.publish((key, digest, obj))
+            return digest, obj
+
+    def reload(self) -> bool:
+        """
+        Reads the file again and applies the differences to the current data in place (see
+        :py:meth:`~grave_settings.abstract.IASettings.apply_changes`). References into the data stay valid and only
+        the keys that changed are invalidated, auto save ignores those invalidations. If the data is not IASettings or
+        its type changed, the data is replaced like in load
+
+        :return: True if the data changed
+        """
+        with self.save_lock:
+            old = self.data
+            if not isinstance(old, IASettings):
+                self.load()
+                return True
+            sub_configs, sub_config_paths = self.sub_configs, self.sub_config_paths
+            self.sub_configs, self.sub_config_paths = {}, {}
+            try:
+                self.load()
+            except Exception:
+                self.sub_configs, self.sub_config_paths = sub_configs, sub_config_paths
+                raise
+            new = self.data
+            if type(new) is not type(old):
+                return True
+            self.data = old
+            self.subscribe_data()
+            self.sub_configs, self.sub_config_paths = sub_configs, sub_config_paths
+            self.reloading = True
+            try:
+                return old.apply_changes(new)
+            finally:
+                self.reloading = False
+
+    @staticmethod
+    def get_content_digest(chunks: Iterable[str | bytes]) -> str:
+        h = hashlib.sha256()
+        for chunk in chunks:
+            h.update(chunk.encode('utf-8') if type(chunk) is str else chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def get_file_identity(path: Path) -> tuple | None:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def set_content_digest(self, digest: str | None):
+        self.content_digest = digest
+        self.content_identity = None if digest is None else self.get_file_identity(self.file_path)
+
+    def is_content_unchanged(self, digest: str) -> bool:
+        return (digest == self.content_digest and self.content_identity is not None and
+                self.content_identity == self.get_file_identity(self.file_path))
 
     def validate_file_path(self, path: Path, must_exist=False):
         if must_exist:
@@ -117,8 +621,62 @@ class ConfigFile(Serializable):
             raise ValueError(f'File path is invalid: {path}')
 
     def save(self, path: Path = None, formatter: None | Formatter = None, force=True, validate_path=True):
+        with self.save_lock:
+            if self.max_workers > 1 and path is None and self.sub_configs:
+                self.save_dependencies()
+                self._save(formatter=formatter, force=force, validate_path=validate_path, save_dependencies=False)
+            else:
+                self._save(path=path, formatter=formatter, force=force, validate_path=validate_path)
+
+    def get_dependency_levels(self) -> list[list['ConfigFile']]:
+        """
+        :return: The linked configs (not including this one) grouped by height. Every config comes after all the
+            configs it links to, configs in the same group do not depend on each other
+        """
+        heights: dict[int, tuple[int, ConfigFile]] = {}
+
+        def visit(config: ConfigFile, visiting: set) -> int:
+            key = id(config)
+            if key in heights:
+                return heights[key][0]
+            if key in visiting:
+                raise ValueError(f'Circular config dependency: {config.file_path}')
+            visiting.add(key)
+            height = 0
+            for link in config.sub_configs.values():
+                height = max(height, visit(link.config, visiting) + 1)
+            visiting.discard(key)
+            heights[key] = height, config
+            return height
+
+        visit(self, set())
+        del heights[id(self)]
+        levels = [[] for _ in range(max((h for h, _ in heights.values()), default=-1) + 1)]
+        for height, config in heights.values():
+            levels[height].append(config)
+        return levels
+
+    def save_dependencies(self):
+        """
+        Saves the linked configs (not this one) on a thread pool, one level of get_dependency_levels at a time
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ConfigFileSave') as pool:
+            for level in self.get_dependency_levels():
+                for future in [pool.submit(config.save_file_only) for config in level if config.is_loaded()]:
+                    future.result()
+
+    def save_file_only(self):
+        """
+        Saves this config's file without saving the configs it links to
+        """
+        with self.save_lock:
+            self._save(save_dependencies=False)
+
+    def _save(self, path: Path = None, formatter: None | Formatter = None, force=True, validate_path=True,
+              save_dependencies=True):
         if self.read_only:
             raise ValueError('Saving in read-only mode')
+        IASettings.advance_epoch()  # changes made from here on must reach our invalidate subscription again
         if path is None:
             path = self.file_path
             vf = self.changes_made
@@ -132,27 +690,207 @@ class ConfigFile(Serializable):
             formatter = self.formatter
         if formatter is None:
             raise ValueError('No formatter supplied')
-        serializer = self.formatter.get_serializer(self.data, self.get_serialization_context())
-        serializer.handler.type_bank[object] = self.handle_serialize_IASettings
+        own_file = path == self.file_path
+        if self.journal is not None and own_file and self.save_journal(formatter):
+            self.changes_made = vf
+            return
+        serializer = self.get_save_serializer(formatter, self.data, save_dependencies=save_dependencies)
         #serializer.handler.add_handler(IASettings, self.handle_serialize_IASettings)
-        formatter.write_to_file(self.data, str(self.file_path), serializer=serializer)
+        if formatter is self.formatter:  # fragments are specific to the formatter that made them
+            serializer.fragment_cache = self.fragment_cache
+        if self.journal is not None and own_file:
+            checked_in = self.collect_checked_in(serializer)
+        # the journal names the file's digest, formatters that write in place skip unchanged output on their own
+        if (self.skip_unchanged and not formatter.WRITES_IN_PLACE) or (self.journal is not None and own_file):
+            chunks = list(formatter.dumps_chunks(self.data, serializer=serializer))
+            digest = self.get_content_digest(chunks)
+            if not (own_file and self.skip_unchanged and self.is_content_unchanged(digest)):
+                formatter.write_chunks_to_file(chunks, str(path), compression=self.compression,
+                                               atomic=self.atomic_save)
+                if own_file:
+                    self.set_content_digest(digest)
+            if self.journal is not None and own_file:
+                self.journal.reset(digest)
+                spec = serializer.spec
+                self.journal_owners = {oid: spec.str_to_path(ref)[0] for oid, ref in checked_in.items() if ref}
+        else:
+            formatter.write_to_file(self.data, str(path), serializer=serializer, compression=self.compression,
+                                    atomic=self.atomic_save)
+            if own_file:
+                self.set_content_digest(None)
+        if self.document_cache is not None:  # the identity check may not see a rewrite within the mtime resolution
+            self.document_cache.discard(path)
+        if own_file:
+            self.file_identity = self.get_file_identity(path)
+            if self.broadcast is not None:
+                self.broadcast_version = self.broadcast.publish()
         self.changes_made = vf
 
+    def save_journal(self, formatter: Formatter) -> bool:
+        """
+        Appends the changes recorded since the last save to the journal
+
+        :return: False if they can't be journaled and the file has to be written in full. Each key is serialized on
+            its own, so changes that share an object with another key (ex: update({'a': obj, 'b': obj})) can't be
+        """
+        journal = self.journal
+        data = self.data
+        owners = self.journal_owners
+        if not (isinstance(data, IASettings) and owners is not None and journal.can_append(self.content_digest)):
+            return False
+        if self.get_file_identity(self.file_path) != self.file_identity:  # someone else wrote the file
+            return False
+        if not journal.pending:
+            return True
+        records = []
+        claimed = {}
+        for key in journal.pending:
+            if type(key) not in (str, int, float, bool):
+                return False
+            if key in data:
+                serializer = self.get_save_serializer(formatter, data[key])
+                checked_in = self.collect_checked_in(serializer)
+                records.append(journal.set_record(key, formatter.serialize(data[key], serializer=serializer)))
+                for oid in checked_in:
+                    owner = owners.get(oid, key)
+                    if oid in claimed or (owner != key and owner not in journal.pending):
+                        return False
+                    claimed[oid] = key
+            else:
+                records.append(journal.delete_record(key))
+        if not journal.append(records):
+            return False
+        owners.update(claimed)
+        return True
+
+    @staticmethod
+    def collect_checked_in(serializer: Serializer) -> dict:
+        """
+        :return: A dict that receives the id_cache of serializer (object id -> reference path) when it is disposed
+        """
+        checked_in = {}
+        serializer.context.finalize.subscribe(lambda *args: checked_in.update(serializer.context.id_cache))
+        return checked_in
+
+    def replay_journal(self, formatter: Formatter, digest: str):
+        records = self.journal.read(digest)
+        if not records:
+            return
+        data = self.data
+        with data.batch():
+            for record in records:
+                if record[0] == JOURNAL_SET:
+                    deserializer = self.get_load_deserializer(formatter)
+                    data[record[1]] = formatter.deserialize(record[2], deserializer=deserializer)
+                elif record[0] == JOURNAL_DELETE and record[1] in data:
+                    del data[record[1]]
+
     @classmethod
     def check_in_serialization_context(cls, context: FormatterContext):
         pass
 
     def get_serialization_context(self):
-        return self.formatter.get_serialization_context()
+        context = self.formatter.get_serialization_context()
+        if self.canonical:
+            context.add_semantics(SortKeys(True))
+        if self.offset_index:
+            context.add_semantics(OffsetIndex(True))
+        if self.columnar_lists:
+            context.add_semantics(ColumnarEncoding(self.columnar_lists))
+        if self.sparse:
+            context.add_semantics(SparseSerialization(True))
+        if self.blob_store is not None:
+            context.add_semantics(ExternalBlobs(self.blob_store))
+        return context
 
-    def handle_serialize_IASettings(self, serializer: Serializer, obj: IASettings, **kwargs):
-        if obj in self.sub_configs:
+    def get_save_serializer(self, formatter: Formatter, obj, save_dependencies=True) -> Serializer:
+        serializer = formatter.get_serializer(obj, self.get_serialization_context())
+        handler = partial(self.handle_serialize_IASettings, save_dependency=save_dependencies)
+        serializer.handler.type_bank[object] = handler
+        serializer.handler.type_bank[LoadOnAccessProxy] = handler  # lazy links and lazy subtrees
+        return serializer
+
+    def handle_serialize_IASettings(self, serializer: Serializer, obj: IASettings, save_dependency=True, **kwargs):
+        if type(obj).__hash__ is not None and obj in self.sub_configs:  # every object comes through here
             link = self.sub_configs[obj]
-            link.config.save()
+            if serializer.fragment_cache is not None:  # the save below has to happen every time
+                serializer.fragment_cache.mark_volatile()
+            # lazy links that were never loaded have not changed
+            if link.config.is_loaded() and self.should_save_link(link, save_dependency):
+                link.config.save()
+            if self.shard_links:
+                self.shard_links[-1].append((obj, link))
             return serializer.handle_default(link)
+        elif type(obj) is LoadOnAccessProxy:
+            return serializer.handle_load_on_access_proxy(obj, **kwargs)
+        elif (self.shard_policy is not None and isinstance(obj, IASettings) and obj is not self.data and
+              id(obj) not in serializer.context.id_cache):
+            return self.handle_serialize_shard_candidate(serializer, obj, save_dependency=save_dependency, **kwargs)
         else:
             return serializer.handle_default(obj, **kwargs)
 
+    def handle_serialize_shard_candidate(self, serializer: Serializer, obj: IASettings, save_dependency=True,
+                                         **kwargs):
+        policy = self.shard_policy
+        nested = []
+        if not policy.is_shard_type(obj):
+            if policy.min_bytes is None:
+                return serializer.handle_default(obj, **kwargs)
+            id_cache = serializer.context.id_cache
+            n_cache = len(id_cache)
+            n_lifecycle = len(serializer.id_lifecycle_objects)
+            self.shard_links.append(nested)
+            try:
+                ser_obj = serializer.handle_default(obj, **kwargs)
+            finally:
+                self.shard_links.pop(-1)
+            if not policy.is_shard_size(ser_obj):
+                if self.shard_links:
+                    self.shard_links[-1].extend(nested)
+                return ser_obj
+            # the subtree goes to the shard, nothing in it can be referenced from this file
+            for object_id in list(islice(reversed(id_cache), len(id_cache) - n_cache)):
+                del id_cache[object_id]
+            del serializer.id_lifecycle_objects[n_lifecycle:]
+        self.make_shard(obj, serializer.context.key_path, nested)
+        return self.handle_serialize_IASettings(serializer, obj, save_dependency=save_dependency, **kwargs)
+
+    def get_shard_directory(self) -> Path:
+        if self.shard_directory is None:
+            return self.shard_policy.get_directory(self.file_path)
+        return self.shard_directory
+
+    def make_shard(self, obj: IASettings, key_path: list, nested: list[tuple[Any, LogFileLink]]) -> 'ConfigFile':
+        """
+        Links obj to a new shard config. The links in nested (made while measuring obj) move to the shard
+        """
+        directory = self.get_shard_directory()
+        name = self.shard_policy.get_file_name(self.file_path, key_path)
+        path = (directory / name).resolve()
+        n = 1
+        while path in self.sub_config_paths:  # two keys that only differ by characters that can't be in a file name
+            n += 1
+            path = (directory / f'{n}-{name}').resolve()
+        directory.mkdir(exist_ok=True)
+        config = ConfigFile(path, data=obj, formatter=self.formatter, compression=self.compression,
+                            canonical=self.canonical, atomic_save=self.atomic_save, offset_index=self.offset_index,
+                            shard_policy=self.shard_policy, blob_store=self.blob_store,
+                            columnar_lists=self.columnar_lists, sparse=self.sparse)
+        config.shard_directory = directory
+        for data, link in nested:
+            self.sub_configs.pop(data, None)
+            self.sub_config_paths.pop(link.config.file_path, None)
+            rel_path = Path(os.path.relpath(link.config.file_path, directory))
+            config.add_log_file_link(LogFileLink(config=link.config, rel_path=rel_path), data=data)
+        self.add_config_dependency(config)
+        return config
+
+    def should_save_link(self, link: LogFileLink, save_dependency: bool) -> bool:
+        config = link.config
+        if config.shard_directory is None:
+            return save_dependency
+        return True  # shards skip unchanged output, edits inside them don't always invalidate their root
+
     def load(self, path: Path = None, formatter: None | Formatter = None, validate_path=True, semantics: Semantics = None):
         if path is None:
             path = self.file_path
@@ -162,18 +900,70 @@ class ConfigFile(Serializable):
             formatter = self.formatter
         if formatter is None:
             raise ValueError('No formatter supplied')
-        context = self.get_deserialization_context()
-        deserializer = self.formatter.get_deserializer(None, context)
-        deserializer.secondary_handler.add_handler(LogFileLink, self.handle_deserialize_LogFileLink)
-        if semantics is not None:
-            context.semantic_context.semantics.update(semantics)
-        with EventCapturer(deserializer.notify_settings_converted) as capture:
-            self.data = formatter.read_from_file(str(path), deserializer=deserializer)
+        if self.fragment_cache is not None:
+            self.fragment_cache.clear()
+        identity = self.get_file_identity(path)  # before reading so a write during the read is not missed
+        want_digest = (self.skip_unchanged and not formatter.WRITES_IN_PLACE) or \
+            (self.journal is not None and path == self.file_path)
+        prefetcher = self.prefetcher
+        own_prefetcher = (prefetcher is None and self.max_workers > 1 and path == self.file_path and
+                          not self.lazy_links)
+        if own_prefetcher:
+            prefetcher = self.prefetcher = DependencyPrefetcher(self.max_workers)
+            prefetcher.prefetch(path, formatter, self.compression)
+        try:
+            deserializer = self.get_load_deserializer(formatter)
+            if semantics is not None:
+                deserializer.context.semantic_context.semantics.update(semantics)
+            with EventCapturer(deserializer.notify_settings_converted) as capture:
+                prefetched = None if prefetcher is None else prefetcher.take(path, formatter)
+                if prefetched is not None:
+                    buffer, obj = prefetched
+                    digest = self.get_content_digest((buffer,)) if want_digest else None
+                    self.data = formatter.deserialize(obj, deserializer=deserializer)
+                elif self.broadcast is not None and path == self.file_path and identity is not None:
+                    digest, obj = self.read_through_broadcast(path, formatter, identity)
+                    if not want_digest:
+                        digest = None
+                    self.data = formatter.deserialize(obj, deserializer=deserializer)
+                elif self.document_cache is not None:
+                    buffer, obj = self.document_cache.get(path, formatter, compression=self.compression)
+                    digest = self.get_content_digest((buffer,)) if want_digest else None
+                    self.data = formatter.deserialize(obj, deserializer=deserializer)
+                elif self.sidecar_cache is not None:
+                    digest, obj = self.sidecar_cache.load(path, formatter, compression=self.compression)
+                    if not want_digest:
+                        digest = None
+                    self.data = formatter.deserialize(obj, deserializer=deserializer)
+                elif want_digest:
+                    buffer = formatter.read_buffer_from_file(str(path), compression=self.compression)
+                    digest = self.get_content_digest((buffer,))
+                    self.data = formatter.loads(buffer, deserializer=deserializer)
+                else:
+                    digest = None
+                    self.data = formatter.read_from_file(str(path), deserializer=deserializer,
+                                                         compression=self.compression)
+        finally:
+            self.prefetcher = None
+            if own_prefetcher:
+                prefetcher.close()
+        if path == self.file_path:
+            self.set_content_digest(digest)
+            self.file_identity = identity
+            if self.journal is not None and isinstance(self.data, IASettings):
+                self.journal_owners = None  # the next save writes the file in full to learn them
+                self.replay_journal(formatter, digest)
         if len(capture) > 0:
             self.backup_settings_file()
         if isinstance(self.data, IASettings):
             self.data.file_path = self.file_path
         self.changes_made = False
+        self.subscribe_data()
+
+    def get_load_deserializer(self, formatter: Formatter) -> DeSerializer:
+        deserializer = formatter.get_deserializer(None, self.get_deserialization_context())
+        deserializer.secondary_handler.add_handler(LogFileLink, self.handle_deserialize_LogFileLink)
+        return deserializer
 
     @classmethod
     def check_in_deserialization_context(cls, context: FormatterContext):
@@ -185,14 +975,34 @@ class ConfigFile(Serializable):
         context = self.formatter.get_deserialization_context()
         if isinstance(self.data, type):
             context.add_frame_semantics(ClassStringPassFunction(lambda x: x == format_class_str(self.data)))
+        if self.lazy_subtrees:
+            context.add_semantics(LazyDeserialization(True))
+        if self.blob_store is not None:
+            context.add_semantics(ExternalBlobs(self.blob_store))
         return context
 
     def handle_deserialize_LogFileLink(self, deserializer: DeSerializer, obj: LogFileLink, **kwargs):
         if obj.file_path is not None:
-            obj.config.file_path = obj.file_path.absolute()
-        else:
-            obj.config.file_path = obj.rel_path.absolute()
-        data_obj = obj.config.get_load_data_obj()
+            obj.config.file_path = Path(obj.file_path).resolve()
+        else:  # add_config_dependency makes rel_path relative to our directory
+            obj.config.file_path = (self.file_path.parent / obj.rel_path).resolve()
+        obj.config.document_cache = self.document_cache
+        obj.config.sidecar_cache = self.sidecar_cache
+        obj.config.blob_store = self.blob_store
+        if self.shard_policy is not None and obj.config.file_path.parent == self.get_shard_directory().resolve():
+            obj.config.shard_policy = self.shard_policy
+            obj.config.shard_directory = obj.config.file_path.parent
+            obj.config.skip_unchanged = True
+        if self.lazy_links:
+            obj.config.lazy_links = True
+            proxy = LoadOnAccessProxy(obj.config.get_load_data_obj)
+            self.add_log_file_link(obj, data=proxy)
+            return proxy
+        obj.config.prefetcher = self.prefetcher
+        try:
+            data_obj = obj.config.get_load_data_obj()
+        finally:
+            obj.config.prefetcher = None
         self.add_log_file_link(obj)
         return data_obj
 
@@ -209,11 +1019,18 @@ class ConfigFile(Serializable):
             self.load(validate_path=False)
         elif isinstance(self.data, type):
             self.data = self.instantiate_data()
+            self.subscribe_data()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if not self.read_only:
-            self.save()
+        try:
+            if not self.read_only:
+                self.save()
+        finally:
+            if self.write_behind is not None:
+                with self.write_behind.condition:
+                    self.write_behind.pending = False  # just saved
+            self.close()
 
     def get_load_data_obj(self):
         if not self.is_loaded():
@@ -223,7 +1040,7 @@ class ConfigFile(Serializable):
     def to_dict(self, *args):
         return {
             'formatter_t': self.formatter.__class__,
-            'data_t': self.data.__class__
+            'data_t': self.data if isinstance(self.data, type) else self.data.__class__
         }
 
     def from_dict(self, state_obj: dict, *args):
@@ -4,12 +4,16 @@
 
 @author: ☙ Ryan McConnell ❧
 """
+import sys
+from array import array
+from base64 import b64encode, b64decode
 from numbers import Rational, Complex
 from pathlib import Path
 from types import NoneType, MethodType
 from datetime import timedelta, datetime, date, timezone, tzinfo
 from enum import Enum
-from typing import Mapping, Union, get_args
+from fractions import Fraction
+from typing import Mapping, Union, get_args, AbstractSet
 from types import FunctionType
 from functools import partial
 from zoneinfo import ZoneInfo
@@ -24,6 +28,18 @@ from grave_settings.framestack_context import FrameStackContext
 from grave_settings.helper_objects import KeySerializableDict
 from grave_settings.semantics import *
 
+try:
+    import numpy
+    from numpy.lib.format import dtype_to_descr, descr_to_dtype
+except ImportError:
+    numpy = None
+
+PROFILE_VERBOSE = 'verbose'
+PROFILE_COMPACT = 'compact'
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+COMPACT_TAGS = frozenset(('#dt', '#d', '#td', '#e', '#c', '#q', '#t', '#fs', '#s'))
+
 
 def force_instantiate(type_obj: Type[T]) -> T:
     try:
@@ -37,6 +53,18 @@ class NotSerializableException(Exception):
 
 
 class SerializationHandler(OrderedHandler):
+    """
+    :param profile: PROFILE_COMPACT writes datetime, date, timedelta, Enum, complex, Fraction, tuple, frozenset and set
+        objects as a single key dict of a tag and a number, string or short list (ex: {"#dt": <epoch microseconds>})
+        instead of a class string and state. Hashable ones are written again where they repeat instead of being tracked
+        for PreservedReferences. DeSerializationHandler reads both profiles
+    """
+    def __init__(self, *args, profile: str = PROFILE_VERBOSE, **kwargs):
+        if profile not in (PROFILE_VERBOSE, PROFILE_COMPACT):
+            raise ValueError(f'Unknown handler profile: {profile}')
+        self.profile = profile
+        super(SerializationHandler, self).__init__(*args, **kwargs)
+
     def init_handler(self):
         super(SerializationHandler, self).init_handler()
         self.add_handlers({  # This only works because dictionaries preserve order! Be careful order matters here
@@ -59,8 +87,82 @@ class SerializationHandler(OrderedHandler):
             EventHandler: self.omit,
             Complex: self.handle_Complex,
             Rational: self.handle_Rational,
-            Path: self.handle_path
+            Path: self.handle_path,
+            bytearray: self.handle_bytearray,
+            memoryview: self.handle_memoryview,
+            array: self.handle_array
         })
+        if numpy is not None:
+            self.add_handlers({
+                numpy.ndarray: self.handle_ndarray
+            })
+        self.compact_encoders = {}
+        if self.profile == PROFILE_COMPACT:
+            self.compact_encoders.update({
+                datetime: self.encode_datetime,
+                date: self.encode_date,
+                timedelta: self.encode_timedelta,
+                complex: self.encode_complex,
+                Fraction: self.encode_Fraction,
+                tuple: self.encode_tuple,
+                frozenset: self.encode_frozenset,
+                set: self.encode_set
+            })
+
+    def get_compact_encoder(self, t_obj: type):
+        """
+        Encoders are matched by exact type since a subclass would not survive the round trip, Enums by their base
+
+        :return: A callable returning the tag and value of an object or None if it's not written in compact form
+        """
+        try:
+            return self.compact_encoders[t_obj]
+        except KeyError:
+            encoder = self.encode_Enum if self.profile == PROFILE_COMPACT and issubclass(t_obj, Enum) else None
+            self.compact_encoders[t_obj] = encoder
+            return encoder
+
+    @staticmethod
+    def encode_datetime(key: datetime, context: FormatterContext):
+        if key.tzinfo is None:
+            return '#dt', (key - EPOCH) // MICROSECOND
+        us = (key - EPOCH.replace(tzinfo=timezone.utc)) // MICROSECOND
+        tz = key.tzinfo
+        if isinstance(tz, ZoneInfo):
+            return '#dt', Temporary([us, tz.key])
+        return '#dt', Temporary([us, key.utcoffset().total_seconds(), key.tzname()])
+
+    @staticmethod
+    def encode_date(key: date, context: FormatterContext):
+        return '#d', key.toordinal()
+
+    @staticmethod
+    def encode_timedelta(key: timedelta, context: FormatterContext):
+        return '#td', key // MICROSECOND
+
+    @staticmethod
+    def encode_Enum(key: Enum, context: FormatterContext):
+        return '#e', f'{format_class_str(key.__class__)}.{key.name}'
+
+    @staticmethod
+    def encode_complex(key: complex, context: FormatterContext):
+        return '#c', Temporary([key.real, key.imag])
+
+    @staticmethod
+    def encode_Fraction(key: Fraction, context: FormatterContext):
+        return '#q', Temporary([key.numerator, key.denominator])
+
+    @staticmethod
+    def encode_tuple(key: tuple, context: FormatterContext):
+        return '#t', Temporary(list(key))
+
+    @staticmethod
+    def encode_frozenset(key: frozenset, context: FormatterContext):
+        return '#fs', SerializationHandler.handle_Iterable(key, context)['state']
+
+    @staticmethod
+    def encode_set(key: set, context: FormatterContext):
+        return '#s', SerializationHandler.handle_Iterable(key, context)['state']
 
     @staticmethod
     def handle_path(key: Path, *args, **kwargs):
@@ -109,10 +211,65 @@ class SerializationHandler(OrderedHandler):
 
     @staticmethod
     def handle_bytes(key: bytes, context: FormatterContext, **kwargs):
+        if (blobs := context.semantic_context[ExternalBlobs]) and blobs.val.is_external(key):
+            return {
+                'blob': blobs.val.put(key),
+                'size': len(key)
+            }
         return {
             'hex': key.hex()
         }
 
+    @staticmethod
+    def get_buffer_state(data, context: FormatterContext) -> dict:
+        """
+        The raw bytes of a buffer in one piece: a digest when they go to an external blob store, otherwise base64
+        """
+        data = memoryview(data)
+        if not data.c_contiguous:
+            data = data.tobytes()
+        if (blobs := context.semantic_context[ExternalBlobs]) and blobs.val.is_external(data):
+            return {
+                'blob': blobs.val.put(data)
+            }
+        return {
+            'b64': b64encode(data).decode('ascii')
+        }
+
+    @staticmethod
+    def handle_bytearray(key: bytearray, context: FormatterContext, **kwargs):
+        return SerializationHandler.get_buffer_state(key, context)
+
+    @staticmethod
+    def handle_memoryview(key: memoryview, context: FormatterContext, **kwargs):
+        return {
+            'format': key.format,
+            'shape': Temporary(list(key.shape)),
+            **SerializationHandler.get_buffer_state(key, context)
+        }
+
+    @staticmethod
+    def handle_array(key: array, context: FormatterContext, **kwargs):
+        return {
+            'typecode': key.typecode,
+            'byteorder': sys.byteorder,
+            **SerializationHandler.get_buffer_state(key, context)
+        }
+
+    @staticmethod
+    def handle_ndarray(key, context: FormatterContext, **kwargs):
+        if key.dtype.hasobject:  # the members are python objects, not raw data
+            return {
+                'dtype': 'O',
+                'state': Temporary(key.tolist())
+            }
+        return {
+            'dtype': Temporary(dtype_to_descr(key.dtype)),  # keeps the byte order and structured fields
+            'shape': Temporary(list(key.shape)),
+            **SerializationHandler.get_buffer_state(numpy.ascontiguousarray(key).reshape(-1).view(numpy.uint8),
+                                                     context)  # as plain bytes, some dtypes can't be exported
+        }
+
     @staticmethod
     def handle_partial(key: partial, context: FormatterContext, **kwargs):
         return {
@@ -135,8 +292,14 @@ class SerializationHandler(OrderedHandler):
 
     @staticmethod
     def handle_Iterable(key: Iterable, context: FormatterContext, **kwargs):
+        state = list(key)
+        if isinstance(key, AbstractSet) and context.semantic_context[SortKeys]:
+            try:
+                state.sort()
+            except TypeError:  # unorderable members keep iteration order
+                pass
         return {
-            'state': Temporary(list(key))
+            'state': Temporary(state)
         }
 
     @staticmethod
@@ -238,8 +401,69 @@ class DeSerializationHandler(OrderedHandler):
             bytes: self.handle_bytes,
             Complex: self.handle_Complex,
             Rational: self.handle_Rational,
-            Path: self.handle_path
+            Path: self.handle_path,
+            bytearray: self.handle_bytearray,
+            memoryview: self.handle_memoryview,
+            array: self.handle_array
         })
+        if numpy is not None:
+            self.add_handlers({
+                numpy.ndarray: self.handle_ndarray
+            })
+        self.compact_decoders = {  # see SerializationHandler.compact_encoders
+            '#dt': self.decode_datetime,
+            '#d': self.decode_date,
+            '#td': self.decode_timedelta,
+            '#e': self.decode_Enum,
+            '#c': self.decode_complex,
+            '#q': self.decode_Fraction,
+            '#t': self.decode_tuple,
+            '#fs': self.decode_frozenset,
+            '#s': self.decode_set
+        }
+
+    @staticmethod
+    def decode_datetime(value: int | list, context: FormatterContext) -> datetime:
+        if type(value) is not list:
+            return EPOCH + timedelta(microseconds=value)
+        dt = EPOCH.replace(tzinfo=timezone.utc) + timedelta(microseconds=value[0])
+        if len(value) == 2:
+            return dt.astimezone(ZoneInfo(value[1]))
+        offset = timedelta(seconds=value[1])
+        return dt.astimezone(timezone(offset) if value[2] is None else timezone(offset, value[2]))
+
+    @staticmethod
+    def decode_date(value: int, context: FormatterContext) -> date:
+        return date.fromordinal(value)
+
+    @staticmethod
+    def decode_timedelta(value: int, context: FormatterContext) -> timedelta:
+        return timedelta(microseconds=value)
+
+    @staticmethod
+    def decode_Enum(value: str, context: FormatterContext) -> Enum:
+        class_str, _, name = value.rpartition('.')
+        return context.load_type(class_str)[name]
+
+    @staticmethod
+    def decode_complex(value: list, context: FormatterContext) -> complex:
+        return complex(*value)
+
+    @staticmethod
+    def decode_Fraction(value: list, context: FormatterContext) -> Fraction:
+        return Fraction(*value)
+
+    @staticmethod
+    def decode_tuple(value: list, context: FormatterContext) -> tuple:
+        return tuple(value)
+
+    @staticmethod
+    def decode_frozenset(value: list, context: FormatterContext) -> frozenset:
+        return frozenset(value)
+
+    @staticmethod
+    def decode_set(value: list, context: FormatterContext) -> set:
+        return set(value)
 
     @staticmethod
     def handle_path(t_object: Path, json_obj: dict, *args, **kwargs):
@@ -268,8 +492,52 @@ class DeSerializationHandler(OrderedHandler):
 
     @staticmethod
     def handle_bytes(t_object: Type[bytes], json_obj: dict, context: FormatterContext, **kwargs):
+        if 'blob' in json_obj:
+            if not (blobs := context.semantic_context[ExternalBlobs]):
+                raise ValueError('Loading an external blob needs the ExternalBlobs semantic')
+            return blobs.val.load(json_obj['blob'], t_object)
         return t_object.fromhex(json_obj['hex'])
 
+    @staticmethod
+    def get_buffer_data(json_obj: dict, context: FormatterContext) -> bytes:
+        if 'blob' in json_obj:
+            if not (blobs := context.semantic_context[ExternalBlobs]):
+                raise ValueError('Loading an external blob needs the ExternalBlobs semantic')
+            return blobs.val.read(json_obj['blob'])
+        return b64decode(json_obj['b64'])
+
+    @staticmethod
+    def handle_bytearray(t_object: Type[bytearray], json_obj: dict, context: FormatterContext, **kwargs):
+        if 'state' in json_obj:  # written as a list of ints before bytearray had a handler
+            return t_object(json_obj['state'])
+        return t_object(DeSerializationHandler.get_buffer_data(json_obj, context))
+
+    @staticmethod
+    def handle_memoryview(t_object: Type[memoryview], json_obj: dict, context: FormatterContext, **kwargs):
+        view = memoryview(bytearray(DeSerializationHandler.get_buffer_data(json_obj, context)))
+        shape = json_obj['shape']
+        if 0 in shape:  # cast refuses zeros in the shape, an empty view can only be made one dimensional
+            return view.cast(json_obj['format'])
+        return view.cast(json_obj['format'], shape)
+
+    @staticmethod
+    def handle_array(t_object: Type[array], json_obj: dict, context: FormatterContext, **kwargs):
+        arr = t_object(json_obj['typecode'])
+        arr.frombytes(DeSerializationHandler.get_buffer_data(json_obj, context))
+        if json_obj['byteorder'] != sys.byteorder:
+            arr.byteswap()
+        return arr
+
+    @staticmethod
+    def handle_ndarray(t_object, json_obj: dict, context: FormatterContext, **kwargs):
+        if 'state' in json_obj:
+            arr = numpy.array(json_obj['state'], dtype=object)
+        else:
+            dtype = descr_to_dtype(json_obj['dtype'])
+            data = bytearray(DeSerializationHandler.get_buffer_data(json_obj, context))  # the array stays writable
+            arr = numpy.frombuffer(data, dtype=dtype).reshape(json_obj['shape'])
+        return arr if t_object is numpy.ndarray else arr.view(t_object)
+
     @staticmethod
     def handle_partial(t_object: Type[partial], json_obj: dict, context: FormatterContext, **kwargs):
         return t_object(json_obj['func'], *json_obj['args'], **json_obj['kwargs'])
@@ -0,0 +1,116 @@
+# - * -coding: utf - 8 - * -
+"""
+
+
+@author: ☙ Ryan McConnell ❧
+"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from grave_settings.formatter import Formatter
+from grave_settings.utilities import copy_primitive_tree
+
+
+class DocumentCacheEntry:
+    __slots__ = 'identity', 'formatter_t', 'compression', 'buffer', 'obj'
+
+    def __init__(self, identity: tuple, formatter_t: type, compression, buffer: str | bytes, obj: Any):
+        self.identity = identity
+        self.formatter_t = formatter_t
+        self.compression = compression
+        self.buffer = buffer
+        self.obj = obj
+
+    def size(self) -> int:
+        return len(self.buffer)
+
+
+class DocumentCache:
+    """
+    A bounded LRU of parsed config files. Entries are keyed on the file path and validated against the file's
+    (mtime_ns, size, inode) on every lookup, so a file that changed on disk is read again. The parsed trees are
+    shared between everyone using the cache, get() hands out copies unless asked not to.
+
+    :param max_entries: The number of files kept
+    :param max_bytes: Least recently used files are dropped while the cached buffers are larger than this
+    """
+    def __init__(self, max_entries: int | None = 128, max_bytes: int | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[Path, DocumentCacheEntry] = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_file_identity(path: Path) -> tuple:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def get(self, path: Path, formatter: Formatter, compression: str | bool | None = None,
+            copy=True) -> tuple[str | bytes, Any]:
+        """
+        :param copy: False returns the shared parsed tree. It must be treated as read-only, deserializing it modifies
+            it
+        :return: The file buffer and its parsed tree
+        """
+        path = Path(path).resolve()
+        identity = self.get_file_identity(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and (entry.identity != identity or entry.formatter_t is not type(formatter) or
+                                      entry.compression != compression):
+                self.remove_entry(path)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(path)
+                self.hits += 1
+        if entry is None:
+            self.misses += 1
+            buffer = formatter.read_buffer_from_file(str(path), compression=compression)
+            obj = formatter.buffer_to_obj(buffer, formatter.get_deserialization_context())
+            entry = DocumentCacheEntry(identity, type(formatter), compression, buffer, obj)
+            if self.get_file_identity(path) == identity:  # don't keep a file that was written while we read it
+                self.add_entry(path, entry)
+        return entry.buffer, copy_primitive_tree(entry.obj) if copy else entry.obj
+
+    def add_entry(self, path: Path, entry: DocumentCacheEntry):
+        with self.lock:
+            if path in self.entries:
+                self.remove_entry(path)
+            self.entries[path] = entry
+            self.total_bytes += entry.size()
+            self.evict()
+
+    def remove_entry(self, path: Path):
+        self.total_bytes -= self.entries.pop(path).size()
+
+    def evict(self):
+        entries = self.entries
+        while entries and ((self.max_entries is not None and len(entries) > self.max_entries) or
+                           (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            self.total_bytes -= entries.popitem(last=False)[1].size()
+
+    def discard(self, path: Path):
+        path = Path(path).resolve()
+        with self.lock:
+            if path in self.entries:
+                self.remove_entry(path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path: Path):
+        return Path(path).resolve() in self.entries
+
+
+DEFAULT_DOCUMENT_CACHE = DocumentCache()  # used by ConfigFile(document_cache=True)
@@ -4,21 +4,53 @@
 
 @author: ☙ Ryan McConnell ❧
 """
+import bz2
+import codecs
+import gzip
+import lzma
+import os
+import shutil
+import threading
 from abc import ABC, abstractmethod
+from copy import deepcopy
+from functools import partial
 from io import IOBase
+from itertools import islice
 from weakref import WeakSet
 
 from observer_hooks import notify
 
+from grave_settings.abstract import IASettings
 from grave_settings.framestack_context import FrameStackContext
-from grave_settings.default_handlers import DeSerializationHandler, SerializationHandler
+from grave_settings.default_handlers import DeSerializationHandler, SerializationHandler, PROFILE_VERBOSE, \
+    COMPACT_TAGS
 from grave_settings.handlers import OrderedHandler, OrderedMethodHandler
-from grave_settings.helper_objects import PreservedReferenceNotDissolvedError, KeySerializableDict
+from grave_settings.helper_objects import PreservedReferenceNotDissolvedError, KeySerializableDict, \
+    LoadOnAccessProxy, suspend_lazy_members
 from grave_settings.formatter_settings import FormatterSpec, Temporary, FormatterContext, PreservedReference, NoRef, \
-    AddSemantics
+    AddSemantics, ColumnarList
 from grave_settings.semantics import *
 
 
+COMPRESSION_OPENERS = {
+    'gzip': gzip.open,
+    'bz2': bz2.open,
+    'lzma': lzma.open
+}
+
+COMPRESSION_SUFFIXES = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'lzma',
+    '.lzma': 'lzma'
+}
+
+
+def get_compression_from_path(path: str) -> str | None:
+    return COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+
 class ProcessingException(Exception):
     def __init__(self, processor, obj=None, wrapped_exception: Exception = None, key_stack=None,
                  frame_semantics: Semantics = None, semantics: Semantics = None):
@@ -110,16 +142,78 @@ class IFormatter(ABC):
             buffer = buffer.encode(encoding)
         _io.write(buffer)
 
-    def write_to_file(self, data, path: str, encoding='utf-8', serializer: Processor = None):
+    def open_file(self, path: str, mode: str, compression: str | bool | None = None):
+        """
+        Opens a file for the formatter. When compression is None it is picked from the file suffix (see
+        COMPRESSION_SUFFIXES), False disables it and otherwise it names a key of COMPRESSION_OPENERS. Text modes are
+        opened as text on the compressed stream so encoding and compression happen in the same pass.
+        """
+        if compression is None:
+            compression = get_compression_from_path(path)
+        if not compression:
+            return open(path, mode)
+        try:
+            opener = COMPRESSION_OPENERS[compression]
+        except KeyError:
+            raise ValueError(f'Unknown compression: {compression}')
+        if 'b' not in mode:
+            mode += 't'
+        return opener(path, mode)
+
+    def write_to_file(self, data, path: str, encoding='utf-8', serializer: Processor = None,
+                      compression: str | bool | None = None, atomic=False):
+        # dumps_chunks serializes before the file is opened so we don't overwrite the file if there was an exception
+        chunks = self.dumps_chunks(data, serializer=serializer)
+        self.write_chunks_to_file(chunks, path, encoding=encoding, compression=compression, atomic=atomic)
+
+    def write_chunks_to_file(self, chunks: Iterable[str | bytes], path: str, encoding='utf-8',
+                             compression: str | bool | None = None, atomic=False):
+        """
+        :param atomic: Write to a temporary file next to path, fsync it and move it over path. Readers and crashes will
+            only ever see the old or the new file. A symlink at path is followed and its target replaced. The new file
+            is a new inode: hard links to the old file keep the old contents and it is owned by the writing user
+        """
         if encoding == 'utf-8':
             fm = 'w'
         else:
             fm = 'wb'
-        buffer = self.dumps(data, serializer=serializer)
-        if encoding is not None and encoding != 'utf-8':
-            buffer = buffer.encode(encoding)
-        with open(path, fm) as f:  # We don't want to overwrite the file is there was an exception
-            f.write(buffer)
+        if not atomic:
+            with self.open_file(path, fm, compression=compression) as f:
+                self.write_chunks(f, chunks, encoding)
+            return
+        if compression is None:
+            compression = get_compression_from_path(path) or False  # the temporary file has the wrong suffix
+        path = os.path.realpath(path)  # replacing a symlink would turn it into a regular file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with self.open_file(tmp_path, fm, compression=compression) as f:
+                self.write_chunks(f, chunks, encoding)
+            with open(tmp_path, 'rb+') as f:
+                os.fsync(f.fileno())
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if hasattr(os, 'O_DIRECTORY'):  # make the rename itself durable
+            fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    @staticmethod
+    def write_chunks(f: IOBase, chunks: Iterable[str | bytes], encoding='utf-8'):
+        if encoding is None or encoding == 'utf-8':
+            for chunk in chunks:
+                f.write(chunk)
+            return
+        encoder = codecs.getincrementalencoder(encoding)()  # one encoder so BOMs and stateful codecs stay correct
+        for chunk in chunks:
+            f.write(encoder.encode(chunk))
+        f.write(encoder.encode('', final=True))
 
     def from_buffer(self, _io: IOBase, encoding='utf-8', kwargs: dict | None = None, deserializer: Processor = None):
         data = _io.read()
@@ -127,11 +221,23 @@ class IFormatter(ABC):
             data = data.decode(encoding)
         return self.loads(data, kwargs=kwargs, deserializer=deserializer)
 
-    def read_from_file(self, path: str, encoding='utf-8', kwargs: dict | None = None, deserializer: Processor = None):
+    def read_buffer_from_file(self, path: str, encoding='utf-8', compression: str | bool | None = None) -> str | bytes:
         if encoding == 'utf-8':
-            f = open(path, 'r')
+            f = self.open_file(path, 'r', compression=compression)
         else:
-            f = open(path, 'rb')
+            f = self.open_file(path, 'rb', compression=compression)
+        with f:
+            data = f.read()
+        if encoding is not None and encoding != 'utf-8':
+            data = data.decode(encoding)
+        return data
+
+    def read_from_file(self, path: str, encoding='utf-8', kwargs: dict | None = None, deserializer: Processor = None,
+                       compression: str | bool | None = None):
+        if encoding == 'utf-8':
+            f = self.open_file(path, 'r', compression=compression)
+        else:
+            f = self.open_file(path, 'rb', compression=compression)
         with f:
             # noinspection PyTypeChecker
             return self.from_buffer(f, encoding=encoding, kwargs=kwargs, deserializer=deserializer)
@@ -140,6 +246,12 @@ class IFormatter(ABC):
     def serialized_obj_to_buffer(self, ser_obj, context: FormatterContext) -> str | bytes:
         pass
 
+    def serialized_obj_to_chunks(self, ser_obj, context: FormatterContext) -> Iterable[str | bytes]:
+        """
+        Override this to stream the encoded output in pieces. The default yields the whole buffer at once
+        """
+        yield self.serialized_obj_to_buffer(ser_obj, context)
+
     @abstractmethod
     def buffer_to_obj(self, buffer: str | bytes, context: FormatterContext):
         pass
@@ -167,16 +279,56 @@ class IFormatter(ABC):
             serializer = self.get_serializer(obj, self.get_serialization_context())
         return self.serialized_obj_to_buffer(self.serialize(obj, kwargs=kwargs, serializer=serializer), serializer.context)
 
+    def dumps_chunks(self, obj: Any, kwargs: dict | None = None, serializer: Processor = None) -> Iterable[str | bytes]:
+        """
+        Serializes obj immediately and returns the encoded output as an iterable of chunks
+        """
+        if serializer is None:
+            serializer = self.get_serializer(obj, self.get_serialization_context())
+        ser_obj = self.serialize(obj, kwargs=kwargs, serializer=serializer)
+        return self.serialized_obj_to_chunks(ser_obj, serializer.context)
+
     def loads(self, buffer, kwargs: dict | None = None, deserializer: Processor = None):
         if deserializer is None:
             deserializer = self.get_deserializer(None, self.get_deserialization_context())
         obj = self.buffer_to_obj(buffer, deserializer.context)
         return self.deserialize(obj, kwargs=kwargs, deserializer=deserializer)
 
+    def clone(self, obj: T, serializer: Processor = None, deserializer: Processor = None) -> T:
+        """
+        A deep copy of obj made like loads(dumps(obj)), with the same handlers, semantics and shared references, except
+        the serialized tree is handed to the deserializer as is instead of being encoded and parsed
+        """
+        if serializer is None:
+            serializer = self.get_serializer(obj, self.get_serialization_context())
+        ser_obj = self.serialize(obj, serializer=serializer)
+        if getattr(serializer, 'fragment_cache', None) is not None:  # it keeps the fragments, the deserializer eats them
+            ser_obj = deepcopy(ser_obj)
+        if deserializer is None:
+            deserializer = self.get_deserializer(None, self.get_deserialization_context())
+        return self.deserialize(ser_obj, deserializer=deserializer)
+
     @abstractmethod
     def get_serializer(self, root_obj, context: FormatterContext) -> Processor:
         pass
 
+    def read_subtree_obj(self, path: str, key_path: Iterable, compression: str | bool | None = None):
+        """
+        :return: The serialized tree at key_path in the file at path. References in it that point outside of it can't
+            be resolved. Formatters that can find it without parsing the whole file override this
+        """
+        obj = self.buffer_to_obj(self.read_buffer_from_file(path, compression=compression),
+                                 self.get_deserialization_context())
+        try:
+            return self.spec.get_part_from_path(obj, list(key_path))
+        except (IndexError, TypeError):
+            raise KeyError(list(key_path))
+
+    def read_subtree(self, path: str, key_path: Iterable, kwargs: dict | None = None, deserializer: Processor = None,
+                     compression: str | bool | None = None):
+        return self.deserialize(self.read_subtree_obj(path, key_path, compression=compression), kwargs=kwargs,
+                                deserializer=deserializer)
+
     @abstractmethod
     def get_deserializer(self, root_obj, context: FormatterContext) -> Processor:
         pass
@@ -191,7 +343,8 @@ class IFormatter(ABC):
                 return serializer.process()
 
     def free_deser_obj(self, obj):
-        obj.clear()
+        if isinstance(obj, (dict, list)):  # scalars are valid documents too
+            obj.clear()
 
     def deserialize(self, obj, kwargs: dict | None = None, deserializer: Processor = None):
         if deserializer is None:
@@ -203,15 +356,141 @@ class IFormatter(ABC):
                 ret = deserializer.process(**kwargs)
             else:
                 ret = deserializer.process()
-            self.free_deser_obj(obj)
+            if ret is not obj:  # lists are deserialized in place
+                self.free_deser_obj(obj)
             return ret
 
 
+class FragmentCacheEntry:
+    __slots__ = 'obj', 'revision', 'path', 'fragment', 'checked_in', 'lifecycle', 'references', 'children', 'closed', \
+        'volatile'
+
+    def __init__(self, obj: IASettings, revision: int, path: str, fragment, checked_in: dict, lifecycle: list,
+                 references: list, children: dict, closed: bool, volatile=False):
+        self.obj = obj
+        self.revision = revision
+        self.path = path
+        self.fragment = fragment
+        self.checked_in = checked_in  # id_cache entries (object id -> reference path) made inside the subtree
+        self.lifecycle = lifecycle
+        self.references = references  # (object, reference path) for every PreservedReference made inside the subtree
+        self.children = children  # id -> entry of the IASettings serialized directly inside this one
+        self.closed = closed  # every nested IASettings has its parent set, so changes to them reach our revision
+        self.volatile = volatile  # serializing it has side effects so it is never reused
+
+
+class FragmentCache:
+    """
+    Keeps the serialized form of IASettings subtrees between dumps of the same hierarchy. A fragment is reused while
+    the IASettings object has not been invalidated since it was made, it sits at the same key path and its preserved
+    references still line up with the id cache of the running Serializer. Reused fragments are shared between dumps
+    so the serialized output must not be mutated.
+
+    Only changes that go through invalidate() (item assignment on the settings classes) are seen. Mutating attributes
+    or nested containers directly will leave stale fragments behind; call clear() after doing that. Reusing a fragment
+    only compares revisions of the object itself, so it is limited to subtrees whose nested IASettings all have their
+    parent set to the settings object holding them (their invalidations bump the revisions of their ancestors). In
+    other subtrees only the nested objects that are closed this way are reused.
+
+    Handlers whose work must happen on every dump (like saving a linked config) call mark_volatile() so the subtrees
+    being serialized are never reused.
+    """
+    def __init__(self):
+        self.roots: dict[int, FragmentCacheEntry] = {}
+        self.next_roots: dict[int, FragmentCacheEntry] = {}
+        self.stack: list[list] = []  # [children, old children, obj, closed] of the entries being made
+        self.references: list[tuple[object, str]] = []
+        self.n_volatile = 0
+
+    def mark_volatile(self):
+        self.n_volatile += 1
+
+    def clear(self):
+        self.roots = {}
+
+    def begin(self):
+        IASettings.advance_epoch()  # ancestors skipped by the dirty short circuit would not bump their revisions
+        self.next_roots = {}
+        self.stack.clear()
+        self.references = []
+
+    def commit(self):
+        self.roots = self.next_roots
+        self.abort()
+
+    def abort(self):
+        self.next_roots = {}
+        self.stack.clear()
+        self.references = []
+
+    def find_entry(self, obj: IASettings) -> FragmentCacheEntry | None:
+        if self.stack:
+            entry = self.stack[-1][1].get(id(obj))
+        else:
+            entry = self.roots.get(id(obj))
+        if entry is not None and entry.obj is obj:
+            return entry
+
+    def store_entry(self, entry: FragmentCacheEntry):
+        if self.stack:
+            frame = self.stack[-1]
+            frame[0][id(entry.obj)] = entry
+            if not entry.closed or entry.obj.parent is not frame[2]:
+                frame[3] = False
+        else:
+            self.next_roots[id(entry.obj)] = entry
+
+    def can_reuse(self, entry: FragmentCacheEntry, revision: int, path: str, id_cache: dict) -> bool:
+        if entry.volatile or not entry.closed or entry.revision != revision or entry.path != path:
+            return False
+        if not id_cache.keys().isdisjoint(entry.checked_in):
+            return False  # something in the subtree has already been written and would now be a reference
+        checked_in = entry.checked_in
+        for obj, ref in entry.references:
+            oid = id(obj)
+            if checked_in.get(oid) != ref and id_cache.get(oid) != ref:
+                return False
+        return True
+
+    def serialize(self, serializer: 'Serializer', obj: IASettings, **kwargs):
+        id_cache = serializer.context.id_cache
+        revision = getattr(obj, '_revision', None)
+        if revision is None or id(obj) in id_cache:
+            return serializer.serialize_object(obj, **kwargs)
+        path = serializer.path_to_str()
+        entry = self.find_entry(obj)
+        if entry is not None and self.can_reuse(entry, revision, path, id_cache):
+            id_cache.update(entry.checked_in)
+            serializer.id_lifecycle_objects.extend(entry.lifecycle)
+            self.references.extend(entry.references)
+            self.store_entry(entry)
+            return entry.fragment
+
+        n_cache = len(id_cache)
+        n_lifecycle = len(serializer.id_lifecycle_objects)
+        n_references = len(self.references)
+        n_volatile = self.n_volatile
+        frame = [{}, {} if entry is None else entry.children, obj, True]
+        self.stack.append(frame)
+        try:
+            fragment = serializer.serialize_object(obj, **kwargs)
+        finally:
+            self.stack.pop()
+        checked_in = dict(islice(reversed(id_cache.items()), len(id_cache) - n_cache))
+        self.store_entry(FragmentCacheEntry(obj, revision, path, fragment, checked_in,
+                                            serializer.id_lifecycle_objects[n_lifecycle:],
+                                            self.references[n_references:], frame[0], frame[3],
+                                            volatile=self.n_volatile != n_volatile))
+        return fragment
+
+
 class Serializer(Processor):
     def __init__(self, root_object, spec: FormatterSpec, context: FormatterContext):
         super().__init__(root_object, spec, context)
         self.root_object = root_object
         self.id_lifecycle_objects = []
+        self.fragment_cache: FragmentCache | None = None
+        self.get_compact_encoder = getattr(context.handler, 'get_compact_encoder', None)
 
         self.handler = OrderedMethodHandler()
         # noinspection PyTypeChecker
@@ -220,7 +499,8 @@ class Serializer(Processor):
             self.handle_add_semantics,
             self.handle_temporary,
             self.handle_user_list,
-            self.handle_user_dict
+            self.handle_user_dict,
+            self.handle_load_on_access_proxy
         )
 
     def set_default_semantics(self):
@@ -241,7 +521,10 @@ class Serializer(Processor):
             OverrideClassString,
             IgnoreDuckTypingForType,
             IgnoreDuckTypingForSubclasses,
-            OmitMe
+            OmitMe,
+            ExternalBlobs,
+            ColumnarEncoding,
+            SparseSerialization
         }
 
     def check_in_object(self, obj: T) -> PreservedReference | T:
@@ -250,6 +533,8 @@ class Serializer(Processor):
         if object_id in id_cache:
             auto_preserve_references = self.semantics[AutoPreserveReferences]
             if auto_preserve_references:
+                if self.fragment_cache is not None:
+                    self.fragment_cache.references.append((obj, id_cache[object_id]))
                 return PreservedReference(obj=obj, ref=id_cache[object_id])
             else:
                 return obj
@@ -295,17 +580,59 @@ class Serializer(Processor):
         if p_ref is not instance:  # This is true if the object was converted into a PreservedReference
             self.context.add_semantics(AutoPreserveReferences(False))
             return self.serialize(p_ref, **kwargs)
+        elif (columnar := self.semantics[ColumnarEncoding]) and len(instance) >= max(columnar.val, 1) and \
+                isinstance(instance[0], IASettings) and id(instance[0]) not in self.context.id_cache:
+            return self.serialize_columnar(instance, **kwargs)
         else:
             return self.handle_serialize_list_in_place(instance.copy(), **kwargs)
 
+    def serialize_columnar(self, instance: list, **kwargs):
+        """
+        The elements are serialized in place as usual (so references to them and their members keep their paths) and
+        then folded into columns if they all came out with the same class string, version and keys
+        """
+        t = instance[0].__class__
+        if any(x.__class__ is not t for x in instance):
+            return self.handle_serialize_list_in_place(instance.copy(), **kwargs)
+        rows = self.handle_serialize_list_in_place(instance.copy(), **kwargs)
+        class_id, version_id = self.spec.class_id, self.spec.version_id
+        first = rows[0]
+        if type(first) is not dict or class_id not in first:
+            return rows
+        class_str = first[class_id]
+        version_info = first.get(version_id, None)
+        row_keys = first.keys()
+        for row in rows:
+            if type(row) is not dict or row.get(class_id) != class_str or row.get(version_id, None) != version_info or \
+                    row.keys() != row_keys:
+                return rows
+        keys = [k for k in row_keys if k != class_id and k != version_id]
+        ro = {
+            class_id: format_class_str(ColumnarList),
+            'class': class_str,
+            'length': len(rows),
+            'keys': keys,
+            'columns': [[row[k] for row in rows] for k in keys]
+        }
+        if version_id in first:
+            ro['version'] = version_info
+        return ro
+
     def handle_user_dict(self, instance: dict, **kwargs):
         p_ref = self.check_in_object(instance)
         if p_ref is not instance:  # This is true if the object was converted into a PreservedReference
             self.context.add_semantics(AutoPreserveReferences(False))
             return self.serialize(p_ref, **kwargs)
+        elif len(instance) == 1 and next(iter(instance)) in COMPACT_TAGS:  # would be read back as a compact value
+            with self.semantics:
+                self.context.add_frame_semantics(AutoPreserveReferences(False))
+                return self.serialize(KeySerializableDict(instance), **kwargs)
         else:
             return self.handle_serialize_dict_in_place(instance.copy(), **kwargs)
 
+    def handle_load_on_access_proxy(self, instance: LoadOnAccessProxy, **kwargs):
+        return self.serialize(instance.resolve_proxy(), **kwargs)
+
     def handle_add_semantics(self, instance: AddSemantics, **kwargs):
         tv = instance.val
         if instance.semantics:
@@ -336,6 +663,30 @@ class Serializer(Processor):
         return template_dict
 
     def handle_default(self, instance: object, **kwargs):
+        if self.get_compact_encoder is not None and \
+                (encoder := self.get_compact_encoder(instance.__class__)) is not None:
+            return self.serialize_compact(instance, encoder, **kwargs)
+        if self.fragment_cache is not None and isinstance(instance, IASettings):
+            return self.fragment_cache.serialize(self, instance, **kwargs)
+        return self.serialize_object(instance, **kwargs)
+
+    def serialize_compact(self, instance: object, encoder, **kwargs):
+        """
+        Writes {tag: value} for the compact profile of SerializationHandler. Only unhashable objects are tracked for
+        PreservedReferences
+        """
+        if instance.__hash__ is None:
+            p_ref = self.check_in_object(instance)
+            if p_ref is not instance:
+                self.context.add_semantics(AutoPreserveReferences(False))
+                return self.serialize(p_ref, **kwargs)
+        tag, value = encoder(instance, self.context)
+        if value.__class__ not in self.primitives:
+            with self.context(tag), self.semantics:
+                value = self.serialize(value, **kwargs)
+        return {tag: value}
+
+    def serialize_object(self, instance: object, **kwargs):
         ducks = self.it_quack(instance.__class__)
         if ducks and hasattr(instance, 'check_in_serialization_context'):
             instance.check_in_serialization_context(self.context)
@@ -352,7 +703,17 @@ class Serializer(Processor):
     def process(self, obj=None, **kwargs):
         if obj is None:
             obj = self.root_obj
-        return self.serialize(obj, **kwargs)
+        fragment_cache = self.fragment_cache
+        if fragment_cache is None:
+            return self.serialize(obj, **kwargs)
+        fragment_cache.begin()
+        try:
+            ret = self.serialize(obj, **kwargs)
+        except Exception:
+            fragment_cache.abort()
+            raise
+        fragment_cache.commit()
+        return ret
 
     def serialize(self, obj: Any, **kwargs):
         try:
@@ -376,11 +737,71 @@ class Serializer(Processor):
         self.id_lifecycle_objects = []
 
 
+class LazyDeserializationState:
+    """
+    Shared by the proxies of one lazy deserialization (see :py:class:`~grave_settings.semantics.LazyDeserialization`).
+    It holds the state and semantics of every subtree that was not loaded yet and the reference cache of the objects
+    that were, so PreservedReferences keep resolving across lazy boundaries. A reference into a subtree that was not
+    loaded yet loads it
+    """
+    def __init__(self, deserializer: 'DeSerializer'):
+        self.deserializer_t = deserializer.__class__
+        self.context_t = deserializer.context.__class__
+        self.spec = deserializer.spec
+        self.handler = deserializer.handler
+        self.secondary_handler = deserializer.secondary_handler
+        self.id_cache = deserializer.context.id_cache
+        self.root_object = deserializer.root_obj  # the document being processed
+        self.pending: dict[tuple, tuple] = {}
+        self.lock = threading.RLock()
+
+    def defer(self, deserializer: 'DeSerializer', instance: dict, **kwargs) -> LoadOnAccessProxy:
+        path = tuple(deserializer.context.key_path)
+        semantic_context = deserializer.context.semantic_context
+        self.pending[path] = (instance, semantic_context.copy_semantics(), semantic_context.handler, kwargs)
+        return LoadOnAccessProxy(partial(self.load, path))
+
+    def load(self, path: tuple):
+        with self.lock:
+            try:
+                instance, semantics, handler, kwargs = self.pending.pop(path)
+            except KeyError:  # already loaded to resolve a reference
+                return self.id_cache[self.spec.path_to_str(path)]
+            context = self.context_t(FrameStackContext(handler, Semantics(semantics)))
+            context.id_cache = self.id_cache
+            context.key_path = list(path)
+            deserializer = self.deserializer_t(instance, self.spec.copy(), context)
+            deserializer.handler = self.handler
+            deserializer.secondary_handler = self.secondary_handler
+            deserializer.lazy_state = self
+            deserializer.lazy_path = path
+            with suspend_lazy_members(), deserializer:
+                return deserializer.process(**kwargs)
+
+    def load_containing(self, key_path: list) -> bool:
+        """
+        Loads the subtree that key_path points into, if it was not loaded yet
+
+        :return: True if a subtree was loaded
+        """
+        key_path = tuple(key_path)
+        with self.lock:
+            for path in self.pending:
+                if key_path[:len(path)] == path:
+                    self.load(path)
+                    return True
+        return False
+
+
 class DeSerializer(Processor):
     def __init__(self, root_object, spec: FormatterSpec, context: FormatterContext):
         super().__init__(root_object, spec, context)
         self.root_object = root_object
         self.preserved_refs = WeakSet()
+        self.lazy_state: LazyDeserializationState | None = None
+        self.lazy_path = tuple()  # where root_object is in the document when loading a lazy subtree
+        self.allow_deferral = True
+        self.compact_decoders = getattr(context.handler, 'compact_decoders', {})
 
         self.handler = OrderedMethodHandler()
         # noinspection PyTypeChecker
@@ -409,11 +830,14 @@ class DeSerializer(Processor):
             ClassStringPassFunction,
             KeySemanticsTemplate,
             IgnoreDuckTypingForType,
-            IgnoreDuckTypingForSubclasses
+            IgnoreDuckTypingForSubclasses,
+            LazyDeserialization,
+            ExternalBlobs
         }
 
-    def run_semantics_through_path(self, key_path: list) -> Semantics:
-        start = self.root_object
+    def run_semantics_through_path(self, key_path: list, start=None) -> Semantics:
+        if start is None:
+            start = self.root_obj
         save_semantic_contex = self.context.semantic_context
         self.context.key_path.clear()
         semantics = Semantics()
@@ -439,9 +863,20 @@ class DeSerializer(Processor):
         version_info = None
         class_id = None
         type_obj = None
+        if len(instance) == 1 and (tag := next(iter(instance))) in self.compact_decoders:
+            return self.handle_compact(tag, instance[tag], **kwargs)
+        if (self.allow_deferral and self.spec.class_id in instance and
+                len(self.context.key_path) > len(self.lazy_path) and self.semantics[LazyDeserialization]):
+            type_obj = self.context.load_type(instance[self.spec.class_id])
+            if isinstance(type_obj, type) and issubclass(type_obj, IASettings):
+                if self.lazy_state is None:
+                    self.lazy_state = LazyDeserializationState(self)
+                return self.lazy_state.defer(self, instance, **kwargs)
         if self.spec.class_id in instance:
             class_id = instance.pop(self.spec.class_id)
             type_obj = self.context.load_type(class_id)
+            if type_obj is ColumnarList:
+                return self.handle_columnar_list(instance, **kwargs)
             ducks = self.it_quack(type_obj)
             if ducks and hasattr(type_obj, 'check_in_deserialization_context'):
                 type_obj.check_in_deserialization_context(self.context)
@@ -459,17 +894,98 @@ class DeSerializer(Processor):
                     instance[k] = self.deserialize(v, **kwargs)
 
         if class_id is not None:
-            if ducks and (version_info is not None) and hasattr(type_obj, 'check_convert_update'):
-                if ti := type_obj.check_convert_update(instance, self.context.load_type, version_info):
-                    instance = ti
-                    self.notify_settings_converted(class_id)
-            ret = self.context.handler.handle_node(type_obj, instance, self.context, **kwargs)
-            if method_name := self.semantics[NotifyFinalizedMethodName]:
-                self.context.finalize.subscribe(getattr(ret, method_name.val))
-            return ret
+            return self.make_object(class_id, type_obj, ducks, version_info, instance, **kwargs)
         else:
             return instance
 
+    def handle_compact(self, tag: str, value, **kwargs):
+        if type(value) not in self.primitives:
+            with self.context(tag), self.semantics:
+                value = self.deserialize(value, **kwargs)
+        return self.compact_decoders[tag](value, self.context)
+
+    def make_object(self, class_id: str, type_obj: Type, ducks: bool, version_info, instance: dict, **kwargs):
+        if ducks and (version_info is not None) and hasattr(type_obj, 'check_convert_update'):
+            if ti := type_obj.check_convert_update(instance, self.context.load_type, version_info):
+                instance = ti
+                self.notify_settings_converted(class_id)
+        ret = self.context.handler.handle_node(type_obj, instance, self.context, **kwargs)
+        if self.lazy_state is not None and isinstance(ret, IASettings):
+            for k, v in instance.items():
+                if type(v) is LoadOnAccessProxy:
+                    ret.enable_lazy_member(k)
+        if method_name := self.semantics[NotifyFinalizedMethodName]:
+            self.context.finalize.subscribe(getattr(ret, method_name.val))
+        return ret
+
+    def handle_columnar_list(self, instance: dict, **kwargs) -> list:
+        """
+        Rebuilds the objects of a ColumnarList row by row, each at the path it had as a list element so that
+        references to them and their members resolve the same way
+        """
+        class_id = instance['class']
+        type_obj = self.context.load_type(class_id)
+        ducks = self.it_quack(type_obj)
+        check_in = ducks and hasattr(type_obj, 'check_in_deserialization_context')
+        version_info = None
+        if 'version' in instance:
+            with self.semantics:
+                version_info = self.deserialize(instance['version'])
+        keys = instance['keys']
+        columns = instance['columns']
+        primitives = self.primitives
+        ret = []
+        for i in range(instance['length']):
+            with self.context(i), self.semantics:
+                if check_in:
+                    type_obj.check_in_deserialization_context(self.context)
+                state = {}
+                for k, column in zip(keys, columns):
+                    v = column[i]
+                    if type(v) in primitives:
+                        state[k] = v
+                    else:
+                        with self.context(k), self.semantics:
+                            state[k] = self.deserialize(v, **kwargs)
+                obj = self.make_object(class_id, type_obj, ducks, version_info, state, **kwargs)
+                ret.append(self.secondary_handler.handle(self, obj, **kwargs))
+        return ret
+
+    def load_columnar_containing(self, key_path: list, root_object, root_path: list, **kwargs) -> bool:
+        """
+        The document has no node at a path inside a ColumnarList so a forward reference to one of its objects can't be
+        de-serialized on its own. Instead the whole list is de-serialized and left in the document as a reference
+
+        :return: True if a ColumnarList on the path was de-serialized
+        """
+        columnar_str = format_class_str(ColumnarList)
+        parent, node = None, root_object
+        for depth, key in enumerate(root_path):
+            if type(node) is dict and node.get(self.spec.class_id) == columnar_str:
+                break
+            parent, node = node, node[key]
+        else:
+            return False
+        if parent is None:  # the root is being de-serialized so it can't be loaded again
+            return False
+        node_path = key_path[:len(key_path) - len(root_path) + depth]
+        preserve_key_path = self.context.key_path
+        self.context.key_path = []  # run_semantics_through_path clears it
+        semantics = self.run_semantics_through_path(root_path[:depth - 1], root_object)
+        self.context.key_path = list(node_path[:-1])
+        allow_deferral = self.allow_deferral
+        self.allow_deferral = False
+        with self.context(node_path[-1]), self.semantics:
+            self.semantics.update(semantics)
+            ro = self.deserialize(node, **kwargs)
+        self.allow_deferral = allow_deferral
+        self.context.key_path = preserve_key_path
+        npo = PreservedReference(obj=ro, ref=self.spec.path_to_str(node_path))
+        parent[root_path[depth - 1]] = npo
+        if self.semantics[DetonateDanglingPreservedReferences]:
+            self.preserved_refs.add(npo)
+        return True
+
     def handle_preserved_referece(self, instance: PreservedReference, **kwargs):
         return instance.obj
 
@@ -491,17 +1007,33 @@ class DeSerializer(Processor):
                 return v
             if key_path is None:
                 key_path = self.spec.str_to_path(instance.ref)
-            section_parent = self.spec.get_part_from_path(self.root_object, key_path[:-1])
+            if self.lazy_state is not None:
+                while self.lazy_state.load_containing(key_path):
+                    if v := self.context.check_ref(instance):
+                        return v
+            root_object, root_path = self.root_obj, key_path
+            if self.lazy_state is not None:
+                if tuple(key_path[:len(self.lazy_path)]) == self.lazy_path:
+                    root_path = key_path[len(self.lazy_path):]
+                else:  # outside of the lazy subtree being loaded
+                    root_object = self.lazy_state.root_object
+            if self.load_columnar_containing(key_path, root_object, root_path, **kwargs):
+                if v := self.context.check_ref(instance):
+                    return v
+            section_parent = self.spec.get_part_from_path(root_object, root_path[:-1])
             section_key = key_path[-1]
             section = section_parent[section_key]
 
             preserve_key_path = self.context.key_path
             self.context.key_path = key_path
 
-            semantics = self.run_semantics_through_path(key_path[:-1])
+            semantics = self.run_semantics_through_path(root_path[:-1], root_object)
+            allow_deferral = self.allow_deferral
+            self.allow_deferral = False  # the reference needs the real object
             with self.context(section_key), self.semantics:
                 self.semantics.update(semantics)
                 ro = self.deserialize(section, **kwargs)
+            self.allow_deferral = allow_deferral
 
             self.context.key_path = preserve_key_path
 
@@ -540,7 +1072,12 @@ class DeSerializer(Processor):
                                       frame_semantics=self.context.semantic_context.parent)
 
     def dispose(self):
-        super().dispose()
+        if self.lazy_state is None:
+            super().dispose()
+        else:
+            self.context.id_cache = self.context.id_cache.copy()  # the lazy state keeps using the original
+            with suspend_lazy_members():  # finalize methods must not load the lazy members
+                super().dispose()
         if len(self.preserved_refs) > 0:
             raise PreservedReferenceNotDissolvedError()
 
@@ -552,13 +1089,17 @@ class DeSerializer(Processor):
 class Formatter(IFormatter, ABC):
     FORMAT_SETTINGS = FormatterSpec()
     TYPES = FORMAT_SETTINGS.type_primitives | FORMAT_SETTINGS.type_special
+    WRITES_IN_PLACE = False  # write_to_file only writes what changed, writing chunks would replace the whole file
 
-    def __init__(self, spec: FormatterSpec = None):
+    def __init__(self, spec: FormatterSpec = None, profile: str = PROFILE_VERBOSE):
+        """
+        :param profile: The encoding profile of the serialization handler, see SerializationHandler
+        """
         if spec is None:
             spec = self.FORMAT_SETTINGS.copy()
         self.spec = spec
         self.semantics = set()
-        self.serialization_handler = SerializationHandler()
+        self.serialization_handler = SerializationHandler(profile=profile)
         self.deserialization_handler = DeSerializationHandler()
 
     def get_serialization_handler(self) -> OrderedHandler:
@@ -77,6 +77,15 @@ class PreservedReference:
         return f'PreservedReference(ref={repr(self.ref)}, obj={self.obj})'
 
 
+class ColumnarList:
+    """
+    Names the columnar form of a list of same-class objects (see :py:class:`~grave_settings.semantics.ColumnarEncoding`).
+    It is only a class string, the node holds the class string and version of the objects once, their keys and one
+    column of values per key. It is never instantiated, the deserializer turns the node back into a list.
+    """
+    __slots__ = tuple()
+
+
 class FormatterSpec:
     ROUTE_PATH_TRANSLATION = str.maketrans({
         '\\': '\\\\',
@@ -3,6 +3,8 @@ import bson
 
 from grave_settings.formatter import Formatter, Processor
 from grave_settings.formatter_settings import FormatterContext
+from grave_settings.semantics import SortKeys
+from grave_settings.utilities import sort_mapping_keys
 
 
 class BsonFormatter(Formatter):
@@ -10,6 +12,8 @@ class BsonFormatter(Formatter):
     FORMAT_SETTINGS.type_primitives |= bson.ObjectId
 
     def serialized_obj_to_buffer(self, ser_obj: dict, context: FormatterContext) -> str:
+        if context.semantic_context[SortKeys]:
+            ser_obj = sort_mapping_keys(ser_obj)
         return bson.dumps(ser_obj)
 
     def buffer_to_obj(self, buffer, context: FormatterContext):
@@ -18,11 +22,22 @@ class BsonFormatter(Formatter):
     def to_buffer(self, data, _io: IOBase, encoding=None, serializer: Processor = None):
         return super().to_buffer(data, _io, encoding=encoding, serializer=serializer)
 
-    def write_to_file(self, settings, path: str, encoding=None, serializer: Processor = None):
-        return super().write_to_file(settings, path, encoding=encoding, serializer=serializer)
+    def write_to_file(self, settings, path: str, encoding=None, serializer: Processor = None,
+                      compression: str | bool | None = None, atomic=False):
+        return super().write_to_file(settings, path, encoding=encoding, serializer=serializer, compression=compression,
+                                     atomic=atomic)
+
+    def write_chunks_to_file(self, chunks, path: str, encoding=None, compression: str | bool | None = None,
+                             atomic=False):
+        return super().write_chunks_to_file(chunks, path, encoding=encoding, compression=compression, atomic=atomic)
+
+    def read_buffer_from_file(self, path: str, encoding=None, compression: str | bool | None = None):
+        return super().read_buffer_from_file(path, encoding=encoding, compression=compression)
 
     def from_buffer(self, _io: IOBase, encoding=None, kwargs: dict | None = None, deserializer: Processor = None):
         return super().from_buffer(_io, encoding=encoding, kwargs=kwargs, deserializer=deserializer)
 
-    def read_from_file(self, path: str, encoding=None, kwargs: dict | None = None, deserializer: Processor = None):
-        return super().read_from_file(path, encoding=encoding, kwargs=kwargs, deserializer=deserializer)
+    def read_from_file(self, path: str, encoding=None, kwargs: dict | None = None, deserializer: Processor = None,
+                       compression: str | bool | None = None):
+        return super().read_from_file(path, encoding=encoding, kwargs=kwargs, deserializer=deserializer,
+                                      compression=compression)
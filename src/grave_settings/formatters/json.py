@@ -1,8 +1,20 @@
 import json
+import os
+import re
+from json.decoder import WHITESPACE
+from typing import Iterable
 
+from grave_settings.abstract import IASettings
 from grave_settings.formatter_settings import FormatterContext
-from grave_settings.semantics import Indentation
-from grave_settings.formatter import Formatter
+from grave_settings.semantics import Indentation, SortKeys, OffsetIndex
+from grave_settings.formatter import Formatter, get_compression_from_path
+from grave_settings.utilities import load_type
+
+INDEX_PREFIX = '//gs-index '
+INDEX_FOOTER = '//gs-index-at {:016x}\n'
+INDEX_FOOTER_REGEX = re.compile(r'//gs-index-at ([0-9a-f]{16})\n')
+INDEX_FOOTER_SIZE = len(INDEX_FOOTER.format(0))
+JSON_DECODER = json.JSONDecoder()
 
 
 class JsonFormatter(Formatter):
@@ -10,10 +22,155 @@ class JsonFormatter(Formatter):
         super().__init__(*args, **kwargs)
         self.semantics.add(Indentation(4))
 
-    def serialized_obj_to_buffer(self, ser_obj: dict, context: FormatterContext) -> str:
+    @staticmethod
+    def get_indent(context: FormatterContext):
         if indent := context.semantic_context[Indentation]:
             indent = indent.val
-        return json.dumps(ser_obj, indent=indent)
+        return indent
+
+    def serialized_obj_to_buffer(self, ser_obj: dict, context: FormatterContext) -> str:
+        return json.dumps(ser_obj, indent=self.get_indent(context), sort_keys=bool(context.semantic_context[SortKeys]))
+
+    def serialized_obj_to_chunks(self, ser_obj: dict, context: FormatterContext) -> Iterable[str]:
+        """
+        Encodes one top level member at a time so the file writer (and its compressor) can consume the document
+        without the whole string being built. The output is identical to serialized_obj_to_buffer
+        """
+        if context.semantic_context[OffsetIndex]:
+            yield from self.serialized_obj_to_indexed_chunks(ser_obj, context)
+            return
+        indent = self.get_indent(context)
+        sort_keys = bool(context.semantic_context[SortKeys])
+        if type(ser_obj) is not dict or len(ser_obj) == 0 or any(type(k) is not str for k in ser_obj):
+            yield self.serialized_obj_to_buffer(ser_obj, context)
+            return
+        if indent is None:
+            pad = None
+            start, sep, end = '{', ', ', '}'
+        else:
+            pad = '\n' + (indent if type(indent) is str else ' ' * indent)
+            start, sep, end = '{' + pad, ',' + pad, '\n}'
+        for k in (sorted(ser_obj) if sort_keys else ser_obj):
+            chunk = f'{json.dumps(k)}: {json.dumps(ser_obj[k], indent=indent, sort_keys=sort_keys)}'
+            if pad is not None:
+                chunk = chunk.replace('\n', pad)  # JSON strings never contain raw newlines
+            yield start + chunk
+            start = sep
+        yield end
+
+    def serialized_obj_to_indexed_chunks(self, ser_obj, context: FormatterContext) -> Iterable[str]:
+        """
+        The output of serialized_obj_to_buffer followed by an index: a comment line holding a JSON object that maps the
+        reference path (see FormatterSpec.path_to_str) of every top level member and IASettings object to its
+        [start, end) offsets, then a fixed size footer with the offset of that line. The output is ASCII so the offsets
+        are byte offsets
+        """
+        indent = self.get_indent(context)
+        if type(indent) is int:
+            indent = ' ' * indent
+        sort_keys = bool(context.semantic_context[SortKeys])
+        class_id = self.spec.class_id
+        path_to_str = self.spec.path_to_str
+        settings_classes = {}
+        key_path = []
+        index = {}
+        position = 0
+
+        def is_settings(obj) -> bool:
+            if type(obj) is not dict or type(class_str := obj.get(class_id)) is not str:
+                return False
+            if class_str not in settings_classes:
+                try:
+                    cls = load_type(class_str, do_import=False)  # it was just serialized so it is imported
+                    settings_classes[class_str] = isinstance(cls, type) and issubclass(cls, IASettings)
+                except (PermissionError, KeyError):
+                    settings_classes[class_str] = False
+            return settings_classes[class_str]
+
+        def encode(obj, depth: int):
+            nonlocal position
+            if type(obj) is dict and obj and all(type(k) is str for k in obj):
+                keys = sorted(obj) if sort_keys else obj
+                brackets = '{', '}'
+            elif type(obj) is list and obj:
+                keys = range(len(obj))
+                brackets = '[', ']'
+            else:
+                chunk = json.dumps(obj, indent=indent, sort_keys=sort_keys)
+                if indent is not None and depth:
+                    chunk = chunk.replace('\n', '\n' + indent * depth)  # JSON strings never contain raw newlines
+                position += len(chunk)
+                yield chunk
+                return
+            if indent is None:
+                start, sep, end = brackets[0], ', ', brackets[1]
+            else:
+                pad = '\n' + indent * (depth + 1)
+                start, sep, end = brackets[0] + pad, ',' + pad, '\n' + indent * depth + brackets[1]
+            for k in keys:
+                chunk = start + f'{json.dumps(k)}: ' if type(k) is str else start
+                position += len(chunk)
+                yield chunk
+                start = sep
+                key_path.append(k)
+                member_start = position
+                yield from encode(obj[k], depth + 1)
+                if depth == 0 or is_settings(obj[k]):
+                    index[path_to_str(key_path)] = [member_start, position]
+                key_path.pop(-1)
+            position += len(end)
+            yield end
+
+        yield from encode(ser_obj, 0)
+        index_start = position + len('\n' + INDEX_PREFIX)
+        yield f'\n{INDEX_PREFIX}{json.dumps(index, separators=(",", ":"))}\n{INDEX_FOOTER.format(index_start)}'
+
+    @staticmethod
+    def read_index(f) -> dict | None:
+        """
+        :param f: The file opened in binary mode
+        :return: The index written by serialized_obj_to_indexed_chunks or None if the file does not have one
+        """
+        try:
+            f.seek(-INDEX_FOOTER_SIZE, os.SEEK_END)
+        except OSError:  # shorter than the footer
+            return None
+        match = INDEX_FOOTER_REGEX.fullmatch(f.read(INDEX_FOOTER_SIZE).decode('latin-1'))
+        if match is None:
+            return None
+        f.seek(int(match[1], 16))
+        try:
+            return json.loads(f.readline())
+        except ValueError:
+            return None
+
+    def read_subtree_obj(self, path: str, key_path: Iterable, compression: str | bool | None = None):
+        """
+        Seeks to the closest indexed ancestor of key_path and parses only that member when the file has an index (see
+        :py:class:`~grave_settings.semantics.OffsetIndex`) and is not compressed
+        """
+        key_path = list(key_path)
+        if compression is None:
+            compression = get_compression_from_path(path)
+        if not compression:
+            with open(path, 'rb') as f:
+                if index := self.read_index(f):
+                    for depth in range(len(key_path), 0, -1):
+                        if (span := index.get(self.spec.path_to_str(key_path[:depth]))) is not None:
+                            f.seek(span[0])
+                            obj = json.loads(f.read(span[1] - span[0]))
+                            try:
+                                return self.spec.get_part_from_path(obj, key_path[depth:])
+                            except (IndexError, TypeError):
+                                raise KeyError(key_path)
+        return super().read_subtree_obj(path, key_path, compression=compression)
 
     def buffer_to_obj(self, buffer: str, context: FormatterContext):
-        return json.loads(buffer)
+        if not isinstance(buffer, str):
+            buffer = buffer.decode(json.detect_encoding(buffer))
+        # json.loads, except that the trailing index of serialized_obj_to_indexed_chunks is allowed
+        obj, end = JSON_DECODER.raw_decode(buffer, WHITESPACE.match(buffer, 0).end())
+        end = WHITESPACE.match(buffer, end).end()
+        if end != len(buffer) and not buffer.startswith(INDEX_PREFIX, end):
+            raise json.JSONDecodeError('Extra data', buffer, end)
+        return obj
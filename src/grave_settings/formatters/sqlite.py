@@ -0,0 +1,354 @@
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import closing
+from typing import Any, Iterable
+
+from grave_settings.formatter import Formatter, Processor, get_compression_from_path
+from grave_settings.formatter_settings import FormatterContext, PreservedReference
+from grave_settings.utilities import format_class_str
+
+KIND_VALUE = 0
+KIND_DICT = 1
+KIND_LIST = 2
+KIND_BOOL = 3
+KIND_BIG_INT = 4  # outside of sqlite's 64 bit integers, stored as text
+
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS classes (id INTEGER PRIMARY KEY, class_str TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS versions (id INTEGER PRIMARY KEY, version TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER REFERENCES nodes(id),
+    key TEXT,
+    pos INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    value,
+    class_id INTEGER REFERENCES classes(id),
+    version_id INTEGER REFERENCES versions(id),
+    ref INTEGER,
+    digest BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS nodes_parent ON nodes(parent, pos);
+'''
+
+DELETE_SUBTREE = '''
+WITH RECURSIVE sub(id) AS (SELECT ? UNION ALL SELECT nodes.id FROM nodes JOIN sub ON nodes.parent = sub.id)
+DELETE FROM nodes WHERE id IN sub
+'''
+
+SELECT_SUBTREE = '''
+WITH RECURSIVE sub(id) AS (SELECT ? UNION ALL SELECT nodes.id FROM nodes JOIN sub ON nodes.parent = sub.id)
+SELECT id, parent, key, pos, kind, value, class_id, version_id FROM nodes WHERE id IN sub ORDER BY parent, pos
+'''
+
+NODE_COLUMNS = 'id, parent, key, pos, kind, value, class_id, version_id'
+
+
+class SqliteFormatter(Formatter):
+    """
+    Stores the serialized tree in an SQLite database, one row per dict, list and primitive. Class strings and versions
+    of dicts live in their own tables and preserved references also record the row id they point to (the reference
+    path stays the source of truth).
+
+    write_to_file (which ConfigFile.save uses) updates the database in place inside one transaction. Every row keeps a
+    digest of its subtree so only the rows of subtrees that changed are visited and written, combine it with
+    ConfigFile's cache_fragments to also skip serializing unchanged subtrees. Since nothing is written when nothing
+    changed, ConfigFile's skip_unchanged saves through write_to_file as well and its journal can't be used.
+    read_subtree fetches a single subtree by key path without reading the rest of the file.
+
+    The buffer based methods (dumps, loads, dumps_chunks...) work with whole database images
+    """
+    FORMAT_SETTINGS = Formatter.FORMAT_SETTINGS.copy()
+    WRITES_IN_PLACE = True
+
+    @staticmethod
+    def check_compression(path: str, compression: str | bool | None):
+        if compression is None:
+            compression = get_compression_from_path(path)
+        if compression:
+            raise ValueError('SqliteFormatter does not support compression')
+
+    @staticmethod
+    def connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.executescript(SQLITE_SCHEMA)
+        return conn
+
+    def get_kind(self, obj) -> int:
+        t = type(obj)
+        if t is dict:
+            return KIND_DICT
+        elif t is list:
+            return KIND_LIST
+        elif t is bool:
+            return KIND_BOOL
+        elif t is int and not (-(1 << 63) <= obj < (1 << 63)):
+            return KIND_BIG_INT
+        return KIND_VALUE
+
+    def digest_tree(self, obj, digests: dict) -> bytes:
+        """
+        Fills digests with the digest of every dict and list in obj, keyed by id
+        """
+        h = hashlib.blake2b(digest_size=16)
+        kind = self.get_kind(obj)
+        h.update(bytes((kind,)))
+        if kind == KIND_DICT:
+            for k, v in obj.items():
+                h.update(repr(k).encode('utf-8'))
+                h.update(self.digest_tree(v, digests))
+            digests[id(obj)] = digest = h.digest()
+            return digest
+        elif kind == KIND_LIST:
+            for v in obj:
+                h.update(self.digest_tree(v, digests))
+            digests[id(obj)] = digest = h.digest()
+            return digest
+        h.update(f'{type(obj).__name__}:{obj!r}'.encode('utf-8'))
+        return h.digest()
+
+    def get_value_digest(self, obj, digests: dict) -> bytes:
+        if type(obj) is dict or type(obj) is list:
+            return digests[id(obj)]
+        return self.digest_tree(obj, digests)
+
+    @staticmethod
+    def get_lookup_id(conn: sqlite3.Connection, table: str, column: str, value: str | None, cache: dict) -> int | None:
+        if value is None:
+            return None
+        try:
+            return cache[value]
+        except KeyError:
+            pass
+        conn.execute(f'INSERT OR IGNORE INTO {table} ({column}) VALUES (?)', (value,))
+        row_id = conn.execute(f'SELECT id FROM {table} WHERE {column} = ?', (value,)).fetchone()[0]
+        cache[value] = row_id
+        return row_id
+
+    def split_dict(self, obj: dict) -> tuple[str | None, str | None, list]:
+        """
+        :return: The class string, the JSON encoded version and the other members of a serialized dict
+        """
+        spec = self.spec
+        class_str = obj.get(spec.class_id)
+        if type(class_str) is not str:
+            class_str = None
+        version = obj.get(spec.version_id)
+        if version is not None:
+            version = json.dumps(version, sort_keys=True)
+        items = [(k, v) for k, v in obj.items() if not ((k == spec.class_id and class_str is not None) or
+                                                           k == spec.version_id)]
+        return class_str, version, items
+
+    def get_row_values(self, conn: sqlite3.Connection, obj, lookups: dict) -> tuple:
+        """
+        :return: The (kind, value, class_id, version_id) columns of obj
+        """
+        kind = self.get_kind(obj)
+        if kind == KIND_DICT:
+            class_str, version, _ = self.split_dict(obj)
+            return (kind, None, self.get_lookup_id(conn, 'classes', 'class_str', class_str, lookups['classes']),
+                    self.get_lookup_id(conn, 'versions', 'version', version, lookups['versions']))
+        elif kind == KIND_LIST:
+            return kind, None, None, None
+        elif kind == KIND_BIG_INT:
+            return kind, str(obj), None, None
+        return kind, obj, None, None
+
+    def get_children(self, obj) -> list:
+        if type(obj) is dict:
+            return self.split_dict(obj)[2]
+        elif type(obj) is list:
+            return [(None, v) for v in obj]
+        return []
+
+    def insert_node(self, conn: sqlite3.Connection, parent: int | None, key, pos: int, obj, digests: dict,
+                    lookups: dict) -> int:
+        cursor = conn.execute('INSERT INTO nodes (parent, key, pos, kind, value, class_id, version_id, digest) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (parent, key, pos, *self.get_row_values(conn, obj, lookups),
+                               self.get_value_digest(obj, digests)))
+        row_id = cursor.lastrowid
+        for child_pos, (child_key, child) in enumerate(self.get_children(obj)):
+            self.insert_node(conn, row_id, child_key, child_pos, child, digests, lookups)
+        return row_id
+
+    def sync_node(self, conn: sqlite3.Connection, row_id: int, obj, digests: dict, lookups: dict):
+        """
+        Makes the subtree under row_id (whose kind matches obj) equal to obj, leaving subtrees that did not change alone
+        """
+        conn.execute('UPDATE nodes SET value = ?, class_id = ?, version_id = ?, digest = ? WHERE id = ?',
+                     (*self.get_row_values(conn, obj, lookups)[1:], self.get_value_digest(obj, digests), row_id))
+        children = self.get_children(obj)
+        if not children and type(obj) is not dict and type(obj) is not list:
+            return
+        rows = conn.execute('SELECT id, key, pos, kind, digest FROM nodes WHERE parent = ?', (row_id,)).fetchall()
+        if type(obj) is dict:
+            existing = {row[1]: row for row in rows}
+        else:
+            existing = {row[2]: row for row in rows}
+        for pos, (key, child) in enumerate(children):
+            row = existing.pop(key if type(obj) is dict else pos, None)
+            kind = self.get_kind(child)
+            if row is None or row[3] != kind:
+                if row is not None:
+                    conn.execute(DELETE_SUBTREE, (row[0],))
+                self.insert_node(conn, row_id, key, pos, child, digests, lookups)
+                continue
+            if row[2] != pos:
+                conn.execute('UPDATE nodes SET pos = ? WHERE id = ?', (pos, row[0]))
+            if row[4] != self.get_value_digest(child, digests):
+                self.sync_node(conn, row[0], child, digests, lookups)
+        for row in existing.values():
+            conn.execute(DELETE_SUBTREE, (row[0],))
+
+    def update_references(self, conn: sqlite3.Connection):
+        """
+        Points the ref column of every preserved reference at the row its path names
+        """
+        ref_class = format_class_str(PreservedReference)
+        rows = conn.execute('SELECT nodes.id, nodes.ref, (SELECT value FROM nodes AS r WHERE r.parent = nodes.id AND '
+                            'r.key = ?) FROM nodes JOIN classes ON nodes.class_id = classes.id '
+                            'WHERE classes.class_str = ?', ('ref', ref_class)).fetchall()
+        for row_id, ref, path in rows:
+            target = None if type(path) is not str else self.find_row(conn, self.spec.str_to_path(path))
+            if target is not None:
+                target = target[0]
+            if target != ref:
+                conn.execute('UPDATE nodes SET ref = ? WHERE id = ?', (target, row_id))
+
+    def write_db(self, conn: sqlite3.Connection, ser_obj):
+        digests = {}
+        self.digest_tree(ser_obj, digests)
+        lookups = {'classes': {}, 'versions': {}}
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            root = conn.execute('SELECT id, kind, digest FROM nodes WHERE parent IS NULL').fetchall()
+            if len(root) == 1 and root[0][1] == self.get_kind(ser_obj):
+                if root[0][2] != self.get_value_digest(ser_obj, digests):
+                    self.sync_node(conn, root[0][0], ser_obj, digests, lookups)
+            else:
+                conn.execute('DELETE FROM nodes')
+                self.insert_node(conn, None, None, 0, ser_obj, digests, lookups)
+            self.update_references(conn)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def find_row(self, conn: sqlite3.Connection, key_path: Iterable) -> tuple | None:
+        """
+        :return: The (id, kind) of the row at key_path (keys for dicts, indexes for lists) or None
+        """
+        row = conn.execute('SELECT id, kind FROM nodes WHERE parent IS NULL').fetchone()
+        for key in key_path:
+            if row is None:
+                return None
+            if row[1] == KIND_DICT:
+                row = conn.execute('SELECT id, kind FROM nodes WHERE parent = ? AND key = ?', (row[0], key)).fetchone()
+            elif row[1] == KIND_LIST and type(key) is int:
+                row = conn.execute('SELECT id, kind FROM nodes WHERE parent = ? AND pos = ?', (row[0], key)).fetchone()
+            else:
+                return None
+        return row
+
+    def assemble(self, conn: sqlite3.Connection, rows: list, root_id: int | None = None):
+        """
+        Builds the serialized tree from node rows ordered by (parent, pos)
+        """
+        spec = self.spec
+        classes = dict(conn.execute('SELECT id, class_str FROM classes'))
+        versions = dict(conn.execute('SELECT id, version FROM versions'))
+        objs = {}
+        for row_id, parent, key, pos, kind, value, class_id, version_id in rows:
+            if kind == KIND_DICT:
+                obj = {}
+                if class_id is not None:
+                    obj[spec.class_id] = classes[class_id]
+                if version_id is not None:
+                    obj[spec.version_id] = json.loads(versions[version_id])
+            elif kind == KIND_LIST:
+                obj = []
+            elif kind == KIND_BOOL:
+                obj = bool(value)
+            elif kind == KIND_BIG_INT:
+                obj = int(value)
+            else:
+                obj = value
+            objs[row_id] = obj
+        root = None
+        for row_id, parent, key, pos, kind, *_ in rows:
+            if row_id == root_id or parent is None:
+                root = objs[row_id]
+                continue
+            container = objs.get(parent)
+            if type(container) is dict:
+                container[key] = objs[row_id]
+            elif type(container) is list:
+                container.append(objs[row_id])
+        return root
+
+    def read_db(self, conn: sqlite3.Connection):
+        rows = conn.execute(f'SELECT {NODE_COLUMNS} FROM nodes ORDER BY parent, pos').fetchall()
+        return self.assemble(conn, rows)
+
+    def read_subtree_obj(self, path: str, key_path: Iterable, compression: str | bool | None = None):
+        """
+        :return: The serialized tree at key_path. References in it that point outside of it can't be resolved
+        """
+        self.check_compression(path, compression)
+        with closing(self.connect(path)) as conn:
+            row = self.find_row(conn, key_path)
+            if row is None:
+                raise KeyError(list(key_path))
+            rows = conn.execute(SELECT_SUBTREE, (row[0],)).fetchall()
+            return self.assemble(conn, rows, root_id=row[0])
+
+    def serialized_obj_to_buffer(self, ser_obj, context: FormatterContext) -> bytes:
+        with closing(self.connect(':memory:')) as conn:
+            self.write_db(conn, ser_obj)
+            return conn.serialize()
+
+    def buffer_to_obj(self, buffer: bytes, context: FormatterContext):
+        with closing(sqlite3.connect(':memory:')) as conn:
+            conn.deserialize(buffer)
+            return self.read_db(conn)
+
+    def to_buffer(self, data, _io, encoding=None, serializer: Processor = None):
+        return super().to_buffer(data, _io, encoding=None, serializer=serializer)
+
+    def write_to_file(self, data, path: str, encoding=None, serializer: Processor = None,
+                      compression: str | bool | None = None, atomic=False):
+        """
+        Updates the database at path in place. It is always atomic, SQLite's transaction takes the place of atomic so the
+        file is never replaced
+        """
+        self.check_compression(path, compression)
+        if serializer is None:
+            serializer = self.get_serializer(data, self.get_serialization_context())
+        ser_obj = self.serialize(data, serializer=serializer)
+        with closing(self.connect(path)) as conn:
+            self.write_db(conn, ser_obj)
+
+    def write_chunks_to_file(self, chunks, path: str, encoding=None, compression: str | bool | None = None,
+                             atomic=False):
+        self.check_compression(path, compression)
+        return super().write_chunks_to_file(chunks, path, encoding=None, compression=False, atomic=atomic)
+
+    def read_buffer_from_file(self, path: str, encoding=None, compression: str | bool | None = None) -> bytes:
+        self.check_compression(path, compression)
+        return super().read_buffer_from_file(path, encoding=None, compression=False)
+
+    def from_buffer(self, _io, encoding=None, kwargs: dict | None = None, deserializer: Processor = None):
+        return super().from_buffer(_io, encoding=None, kwargs=kwargs, deserializer=deserializer)
+
+    def read_from_file(self, path: str, encoding=None, kwargs: dict | None = None, deserializer: Processor = None,
+                       compression: str | bool | None = None) -> Any:
+        self.check_compression(path, compression)
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        with closing(self.connect(path)) as conn:
+            ser_obj = self.read_db(conn)
+        return self.deserialize(ser_obj, kwargs=kwargs, deserializer=deserializer)
@@ -1,5 +1,7 @@
 import tomllib
 from grave_settings.formatter_settings import FormatterContext
+from grave_settings.semantics import SortKeys
+from grave_settings.utilities import sort_mapping_keys
 
 try:
     import tomli_w as tlw
@@ -17,6 +19,8 @@ class TomlFormatter(Formatter):
     FORMAT_SETTINGS.type_primitives = int | float | str | bool
 
     def serialized_obj_to_buffer(self, ser_obj: dict, context: FormatterContext) -> str:
+        if context.semantic_context[SortKeys]:
+            ser_obj = sort_mapping_keys(ser_obj)
         return tlw.dumps(ser_obj)
 
     def buffer_to_obj(self, buffer, context: FormatterContext):
@@ -1,3 +1,7 @@
+import threading
+from contextlib import contextmanager
+from typing import Callable, Any
+
 from grave_settings.abstract import Serializable
 from grave_settings.formatter_settings import Temporary
 from grave_settings.framestack_context import FrameStackContext
@@ -7,6 +11,92 @@ class PreservedReferenceNotDissolvedError(Exception):
     pass
 
 
+_UNLOADED = object()
+
+
+class LoadOnAccessProxy:
+    """
+    Stands in for an object that is expensive to produce. loader is called on the first attribute or item access and
+    its result is cached and used from then on. Hashing and equality stay identity based so putting a proxy in a dict
+    or comparing it does not load it. resolve_proxy() returns the real object
+    """
+    __slots__ = '_loader', '_target', '_lock', '__weakref__'
+
+    def __init__(self, loader: Callable[[], Any]):
+        object.__setattr__(self, '_loader', loader)
+        object.__setattr__(self, '_target', _UNLOADED)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def is_proxy_loaded(self) -> bool:
+        return self._target is not _UNLOADED
+
+    def resolve_proxy(self):
+        target = self._target
+        if target is _UNLOADED:
+            with self._lock:
+                target = self._target
+                if target is _UNLOADED:
+                    target = self._loader()
+                    object.__setattr__(self, '_target', target)
+                    object.__setattr__(self, '_loader', None)
+        return target
+
+    def __getattr__(self, item):
+        return getattr(self.resolve_proxy(), item)
+
+    def __setattr__(self, key, value):
+        setattr(self.resolve_proxy(), key, value)
+
+    def __delattr__(self, item):
+        delattr(self.resolve_proxy(), item)
+
+    def __getitem__(self, item):
+        return self.resolve_proxy()[item]
+
+    def __setitem__(self, key, value):
+        self.resolve_proxy()[key] = value
+
+    def __delitem__(self, key):
+        del self.resolve_proxy()[key]
+
+    def __contains__(self, item):
+        return item in self.resolve_proxy()
+
+    def __iter__(self):
+        return iter(self.resolve_proxy())
+
+    def __len__(self):
+        return len(self.resolve_proxy())
+
+    def __bool__(self):
+        return bool(self.resolve_proxy())
+
+    def __repr__(self):
+        if self.is_proxy_loaded():
+            return f'{self.__class__.__name__}({self._target!r})'
+        return f'{self.__class__.__name__}(<not loaded>)'
+
+
+_lazy_suspension = threading.local()
+
+
+@contextmanager
+def suspend_lazy_members():
+    """
+    Lazy SlotSettings members read on this thread return their proxies as they are instead of loading them. Used while
+    finalize methods scan the members
+    """
+    _lazy_suspension.depth = getattr(_lazy_suspension, 'depth', 0) + 1
+    try:
+        yield
+    finally:
+        _lazy_suspension.depth -= 1
+
+
+def lazy_members_suspended() -> bool:
+    return bool(getattr(_lazy_suspension, 'depth', 0))
+
+
 class KeySerializableDict(Serializable):
     __slots__ = 'wrapped_dict',
 
@@ -0,0 +1,135 @@
+# - * -coding: utf - 8 - * -
+"""
+
+
+@author: ☙ Ryan McConnell ❧
+"""
+import json
+import os
+from pathlib import Path
+from typing import Any, AbstractSet, Iterable
+
+JOURNAL_SET = 's'
+JOURNAL_DELETE = 'd'
+
+
+class SettingsJournal:
+    """
+    An append-only file of changes made to the top level keys of a config since its file was last written in full.
+    The first line names the sha256 of the config file the records apply to, every other line is a JSON record:
+    ["s", key, serialized value] or ["d", key]. A journal whose base does not match the config file is ignored, and a
+    torn last line (a crash while appending) is dropped.
+
+    ConfigFile feeds it the keys of each invalidation. Changes whose keys are not known (ex: ones propagated from a
+    nested settings object) can't be journaled, the next save writes the whole file instead. So does the first save
+    that would take the journal over max_bytes, which compacts it
+    """
+    def __init__(self, path: Path, max_bytes: int = 1 << 20, fsync=True):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.base_digest: str | None = None  # of the config file the journal on disk applies to
+        self.size = 0
+        self.pending: set | None = None  # None when there are changes we can't journal
+
+    @classmethod
+    def for_config(cls, config_path: Path, **kwargs):
+        config_path = Path(config_path)
+        return cls(config_path.with_name(f'{config_path.name}.journal'), **kwargs)
+
+    def record(self, keys: AbstractSet | None):
+        if keys is None or self.pending is None:
+            self.pending = None
+        else:
+            self.pending.update(keys)
+
+    def can_append(self, base_digest: str | None) -> bool:
+        return self.pending is not None and base_digest is not None and self.base_digest == base_digest
+
+    def read(self, base_digest: str) -> list[list]:
+        """
+        Reads the records that apply to base_digest and starts tracking changes. Records of another base are ignored
+        and the next save is a full one
+        """
+        self.base_digest = None
+        self.size = 0
+        self.pending = None
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        lines = data.split(b'\n')
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return []
+        if type(header) is not dict or header.get('base') != base_digest:
+            return []
+        records = []
+        size = len(lines[0]) + 1
+        for line in lines[1:-1]:  # the last piece is empty or torn
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            records.append(record)
+            size += len(line) + 1
+        self.base_digest = base_digest
+        self.size = size
+        self.pending = set()
+        return records
+
+    def encode_records(self, records: Iterable[list]) -> bytes | None:
+        try:
+            return ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode('utf-8')
+        except (TypeError, ValueError):  # ex: TOML datetimes
+            return None
+
+    def append(self, records: list[list]) -> bool:
+        """
+        :return: False if the records were not written because they can't be encoded or would take the journal over
+            max_bytes. The caller must write the config file in full and reset the journal instead
+        """
+        data = self.encode_records(records)
+        if data is None or self.size + len(data) > self.max_bytes:
+            return False
+        try:
+            if os.path.getsize(self.path) < self.size:
+                return False  # truncated behind our back
+        except OSError:
+            return False
+        with open(self.path, 'ab') as f:
+            f.seek(self.size)
+            f.truncate()  # drop a torn tail left by a crash
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self.size += len(data)
+        self.pending = set()
+        return True
+
+    def reset(self, base_digest: str):
+        """
+        Starts an empty journal for a config file that was just written in full
+        """
+        header = (json.dumps({'base': base_digest}) + '\n').encode('utf-8')
+        tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.base_digest = base_digest
+        self.size = len(header)
+        self.pending = set()
+
+    @staticmethod
+    def set_record(key, value: Any) -> list:
+        return [JOURNAL_SET, key, value]
+
+    @staticmethod
+    def delete_record(key) -> list:
+        return [JOURNAL_DELETE, key]
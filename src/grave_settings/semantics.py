@@ -338,6 +338,49 @@ class Indentation(Semantic[int]):
     pass
 
 
+class SortKeys(Semantic[bool]):
+    """
+    Canonical output. Mapping keys are written in sorted order (and sets are sorted where their members allow it) so
+    that the same state always produces the same bytes
+    """
+    pass
+
+
+class ExternalBlobs(Semantic[Any]):
+    """
+    A :py:class:`~grave_settings.blob_store.BlobStore` that bytes values at least as large as its min_bytes are written
+    to. The document only holds their digest. Needed to load documents written with it
+    """
+    pass
+
+
+class ColumnarEncoding(Semantic[int]):
+    """
+    Lists of at least this many objects of the same IASettings class are written as one class string, one version, one
+    key list and one column of values per key instead of a dictionary per object. Lists whose objects turn out not to
+    share their keys and version are written as usual
+    """
+    pass
+
+
+class SparseSerialization(Semantic[bool]):
+    """
+    SlotSettings only write the members that differ from the ones a new instance of their class has (captured once per
+    class). Loading makes a new instance first so the members left out get their defaults back. Only immutable values
+    are left out, and a class that needs constructor arguments is always written in full
+    """
+    pass
+
+
+class OffsetIndex(Semantic[bool]):
+    """
+    Files are written with a trailing index of where the top level members and nested IASettings objects are, so
+    Formatter.read_subtree can parse one of them without reading the rest of the file. Formatters without an index
+    ignore this
+    """
+    pass
+
+
 class AutoPreserveReferences(Semantic[bool]):
     """
     The formatter will keep track of objects that are referenced more than once in the object hierarchy and automatically
@@ -406,3 +449,13 @@ class ClassStringPassFunction(Semantic[Callable[[str], bool]]):
 class KeySemanticsTemplate(Semantic[dict[Any, Iterable[Semantic]]]):
     pass
 
+
+class LazyDeserialization(Semantic[bool]):
+    """
+    While de-serializing, nested IASettings objects are not made right away. A LoadOnAccessProxy holding their state
+    takes their place and they are de-serialized the first time the proxy is used. SlotSettings members holding one are
+    replaced by the real object the first time they are read. Like any semantic, a class can turn this off for its
+    members in check_in_deserialization_context
+    """
+    pass
+
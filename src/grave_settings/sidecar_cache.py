@@ -0,0 +1,112 @@
+# - * -coding: utf - 8 - * -
+"""
+
+
+@author: ☙ Ryan McConnell ❧
+"""
+import hashlib
+import marshal
+import os
+import sys
+import threading
+from pathlib import Path
+from typing import Any
+
+from grave_settings.formatter import Formatter
+from grave_settings.utilities import format_class_str
+
+SIDECAR_MAGIC = b'GSC1'
+
+
+class SidecarCache:
+    """
+    Keeps the parsed tree of each config file in a cache directory next to it (like __pycache__), encoded with marshal
+    so loading it skips the text parser. An entry is used only if the mtime, size and (with verify_hash) sha256 of the
+    source file match the ones recorded when it was written, otherwise the source is parsed and the entry rewritten.
+    Trees holding values marshal can't encode (ex: TOML datetimes) are not cached.
+
+    marshal's format is tied to the Python version so the interpreter's cache tag is part of the file name
+    """
+    def __init__(self, dir_name='__gscache__', verify_hash=True):
+        self.dir_name = dir_name
+        self.verify_hash = verify_hash
+        self.hits = 0
+        self.misses = 0
+
+    def get_cache_path(self, path: Path, formatter: Formatter) -> Path:
+        tag = sys.implementation.cache_tag or 'marshal'
+        return path.parent / self.dir_name / f'{path.name}.{formatter.__class__.__name__}.{tag}.gsc'
+
+    @staticmethod
+    def get_content_digest(buffer: str | bytes) -> str:
+        return hashlib.sha256(buffer.encode('utf-8') if type(buffer) is str else buffer).hexdigest()
+
+    def get_source_key(self, path: Path, formatter: Formatter, compression) -> tuple:
+        st = os.stat(path)
+        if self.verify_hash:
+            with open(path, 'rb') as f:
+                source_digest = hashlib.sha256(f.read()).hexdigest()
+        else:
+            source_digest = None
+        return st.st_mtime_ns, st.st_size, source_digest, format_class_str(formatter.__class__), compression
+
+    def load(self, path: Path, formatter: Formatter, compression: str | bool | None = None) -> tuple[str, Any]:
+        """
+        :return: The sha256 hex digest of the decoded file buffer (see ConfigFile.get_content_digest) and the parsed
+            tree of the file
+        """
+        path = Path(path)
+        cache_path = self.get_cache_path(path, formatter)
+        source_key = self.get_source_key(path, formatter, compression)
+        entry = self.read_entry(cache_path)
+        if entry is not None and entry[0] == source_key:
+            self.hits += 1
+            return entry[1], entry[2]
+        self.misses += 1
+        buffer = formatter.read_buffer_from_file(str(path), compression=compression)
+        obj = formatter.buffer_to_obj(buffer, formatter.get_deserialization_context())
+        digest = self.get_content_digest(buffer)
+        if self.get_source_key(path, formatter, compression) == source_key:  # unchanged while we parsed it
+            self.write_entry(cache_path, (source_key, digest, obj))
+        return digest, obj
+
+    @staticmethod
+    def read_entry(cache_path: Path) -> tuple | None:
+        try:
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(SIDECAR_MAGIC):
+            return None
+        try:
+            entry = marshal.loads(data[len(SIDECAR_MAGIC):])
+        except (EOFError, ValueError, TypeError):
+            return None
+        if type(entry) is not tuple or len(entry) != 3:
+            return None
+        return entry
+
+    @staticmethod
+    def write_entry(cache_path: Path, entry: tuple):
+        try:
+            data = SIDECAR_MAGIC + marshal.dumps(entry)
+        except ValueError:  # the tree holds something marshal can't encode
+            return
+        tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            cache_path.parent.mkdir(exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, cache_path)
+        except OSError:  # the cache is optional, a read-only directory just means we parse every time
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def discard(self, path: Path, formatter: Formatter):
+        try:
+            os.remove(self.get_cache_path(Path(path), formatter))
+        except OSError:
+            pass
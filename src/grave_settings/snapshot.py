@@ -0,0 +1,363 @@
+# - * -coding: utf - 8 - * -
+"""
+
+
+@author: ☙ Ryan McConnell ❧
+"""
+import threading
+import weakref
+from types import MappingProxyType
+from typing import Mapping, Any, Iterable, Type, Self, Callable
+
+from observer_hooks import notify, AbortNotifyException
+
+from grave_settings.abstract import IASettings
+
+
+class FrozenSettings(Mapping):
+    """
+    A read-only copy of an IASettings object. Nested settings become FrozenSettings, lists and tuples become tuples,
+    sets become frozensets and dicts become read-only mappings. Other objects are shared with the source.
+
+    Keys can be read as items (key paths included) or, for SlotSettings style access, as attributes
+    """
+    __slots__ = '_data', '_settings_t', '_source', '_revision', '_children'
+
+    def __init__(self, data: dict, settings_t: Type[IASettings] | None = None, source: IASettings | None = None,
+                 children: tuple = tuple()):
+        object.__setattr__(self, '_data', data)
+        object.__setattr__(self, '_settings_t', settings_t)
+        object.__setattr__(self, '_source', None if source is None else weakref.ref(source))
+        object.__setattr__(self, '_revision', None if source is None else source._revision)
+        object.__setattr__(self, '_children', children)  # keys that hold FrozenSettings
+
+    @classmethod
+    def freeze(cls, settings: IASettings, previous: Self | None = None) -> Self:
+        """
+        :param previous: An earlier snapshot of settings. Subtrees whose settings objects have not been invalidated
+            since previous was made are shared with it instead of copied. Every nested settings object is still
+            visited to check its revision, SnapshotPublisher tracks them instead
+        """
+        if previous is not None and previous.is_snapshot_of(settings):
+            # the revision only covers direct changes, children without parent links have to be checked
+            prev_data = previous._data
+            reused = {}
+            for key in previous._children:
+                value = settings[key] if key in settings else None
+                child = prev_data[key]
+                if not isinstance(value, IASettings):
+                    break
+                frozen_child = cls.freeze(value, previous=child)
+                if frozen_child is not child:
+                    reused[key] = frozen_child
+            else:
+                if not reused:
+                    return previous
+                data = prev_data.copy()
+                data.update(reused)
+                return cls(data, settings_t=previous._settings_t, source=settings, children=previous._children)
+        prev_data = None if previous is None or previous._source is None else previous._data
+        data = {}
+        children = []
+        for key, value in settings.generate_key_value_pairs():
+            if isinstance(value, IASettings):
+                prev_child = None
+                if prev_data is not None and type(prev_child := prev_data.get(key)) is not cls:
+                    prev_child = None
+                value = cls.freeze(value, previous=prev_child)
+                children.append(key)
+            else:
+                value = freeze_value(value)
+            data[key] = value
+        return cls(data, settings_t=settings.__class__, source=settings, children=tuple(children))
+
+    def is_snapshot_of(self, settings: IASettings) -> bool:
+        """
+        :return: True if this was made from settings and settings has not been invalidated since
+        """
+        return self._source is not None and self._source() is settings and self._revision == settings._revision
+
+    def set(self, key, value) -> Self:
+        """
+        :param key: A key or a list/tuple key path. The nodes along the path are copied, everything else is shared
+        :return: A new snapshot with key set to value
+        """
+        path = tuple(key) if type(key) in (list, tuple) else (key,)
+        if len(path) > 1:
+            child = self._data[path[0]]
+            if not isinstance(child, FrozenSettings):
+                raise KeyError(path[0])
+            value = child.set(path[1:], value)
+        elif isinstance(value, IASettings):
+            value = FrozenSettings.freeze(value)
+        elif not isinstance(value, FrozenSettings):
+            value = freeze_value(value)
+        key = path[0]
+        data = self._data.copy()
+        data[key] = value
+        children = self._children
+        if isinstance(value, FrozenSettings):
+            if key not in children:
+                children += (key,)
+        elif key in children:
+            children = tuple(k for k in children if k != key)
+        return FrozenSettings(data, settings_t=self._settings_t, children=children)
+
+    def delete(self, key) -> Self:
+        path = tuple(key) if type(key) in (list, tuple) else (key,)
+        data = self._data.copy()
+        children = self._children
+        if len(path) > 1:
+            data[path[0]] = data[path[0]].delete(path[1:])
+        else:
+            del data[path[0]]
+            children = tuple(k for k in children if k != path[0])
+        return FrozenSettings(data, settings_t=self._settings_t, children=children)
+
+    def thaw(self) -> IASettings | dict:
+        """
+        :return: A new mutable settings object of the type this was made from (a dict if it was not made from one)
+        """
+        data = {k: v.thaw() if isinstance(v, FrozenSettings) else thaw_value(v) for k, v in self._data.items()}
+        if self._settings_t is None:
+            return data
+        settings = self._settings_t()
+        settings.update(data)
+        return settings
+
+    def __getitem__(self, item):
+        if type(item) is tuple or type(item) is list:
+            obj = self
+            for key in item:
+                obj = obj[key]
+            return obj
+        return self._data[item]
+
+    def __getattr__(self, item):
+        try:
+            return self._data[item]
+        except KeyError:
+            raise AttributeError(item)
+
+    def __setattr__(self, key, value):
+        raise TypeError('FrozenSettings is immutable, use set()')
+
+    def __contains__(self, item):
+        return item in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._data!r})'
+
+
+def freeze_value(value, freeze_settings: Callable[[IASettings], FrozenSettings] = FrozenSettings.freeze):
+    """
+    :param freeze_settings: Makes the FrozenSettings of the settings objects found inside value
+    """
+    t = type(value)
+    if t is list or t is tuple:
+        return tuple(freeze_value(x, freeze_settings) for x in value)
+    elif t is dict:
+        return MappingProxyType({k: freeze_value(v, freeze_settings) for k, v in value.items()})
+    elif t is set:
+        return frozenset(value)
+    elif isinstance(value, IASettings):
+        return freeze_settings(value)
+    return value
+
+
+def thaw_value(value):
+    t = type(value)
+    if t is tuple:
+        return [thaw_value(x) for x in value]
+    elif t is MappingProxyType:
+        return {k: thaw_value(v) for k, v in value.items()}
+    elif t is frozenset:
+        return set(value)
+    elif t is FrozenSettings:
+        return value.thaw()
+    return value
+
+
+class SnapshotNode:
+    """
+    The published FrozenSettings of one settings object watched by a SnapshotPublisher. It links to the nodes of the
+    settings objects it holds (by key) and to the nodes holding it, so a change only rebuilds the node and its
+    ancestors
+    """
+    __slots__ = 'publisher', 'settings', 'frozen', 'revision', 'children', 'parents', '__weakref__'
+
+    def __init__(self, publisher: 'SnapshotPublisher', settings: IASettings):
+        self.publisher = weakref.ref(publisher)
+        self.settings = settings
+        self.frozen: FrozenSettings | None = None
+        self.revision: int | None = None  # of settings when frozen was made
+        self.children: dict[Any, list[SnapshotNode]] = {}
+        self.parents: dict[SnapshotNode, set] = {}  # node -> the keys we are held under
+
+    def is_stale(self) -> bool:
+        return self.revision != self.settings._revision
+
+    def settings_invalidated(self, *args, **kwargs):
+        publisher = self.publisher()
+        if publisher is not None:
+            publisher.node_invalidated(self)
+
+
+class SnapshotPublisher:
+    """
+    Publishes snapshots of a settings object, RCU style. snapshot() is a plain attribute read so readers never block,
+    and the snapshot they get never changes. Writers build the next snapshot under write_lock, sharing every subtree
+    that did not change with the previous one, and swap it in with a single reference assignment.
+
+    With auto_refresh the publisher subscribes to the invalidate of the settings object and of every settings object
+    nested in it (see :py:class:`SnapshotNode`). An invalidation (once per batch, see
+    :py:meth:`~grave_settings.abstract.IASettings.batch`) re-freezes the members of that one object and copies its
+    ancestors, every other FrozenSettings is shared as is. Changes that bypass invalidate (ex: appending to a list in
+    place) are only picked up when the settings object holding them is invalidated or by refresh().
+    Without a settings object, writers use update() and delete() to publish path copied snapshots
+    """
+    def __init__(self, settings: IASettings | None = None, auto_refresh=True):
+        self.settings = settings
+        self.write_lock = threading.RLock()
+        self.version = 0
+        self.nodes: dict[int, SnapshotNode] = {}  # id of the settings -> node, auto_refresh only
+        self.root: SnapshotNode | None = None
+        if settings is None:
+            self.current = FrozenSettings({})
+        elif auto_refresh:
+            self.root = self.get_node(settings)
+            self.current = self.root.frozen
+        else:
+            self.current = FrozenSettings.freeze(settings)
+
+    def snapshot(self) -> FrozenSettings:
+        return self.current
+
+    def refresh(self) -> FrozenSettings:
+        """
+        Publishes the changes of every settings object that was invalidated without notifying us
+        """
+        with self.write_lock:
+            if self.root is None:
+                self.publish(FrozenSettings.freeze(self.settings, previous=self.current))
+            else:
+                for node in list(self.nodes.values()):
+                    if self.nodes.get(id(node.settings)) is node and node.is_stale():
+                        self.build_node(node)
+                        self.propagate(node)
+                self.publish(self.root.frozen)
+            return self.current
+
+    def node_invalidated(self, node: SnapshotNode):
+        with self.write_lock:
+            # parents are notified before their children, so node may have been rebuilt already
+            if self.nodes.get(id(node.settings)) is not node or not node.is_stale():
+                return
+            self.build_node(node)
+            self.propagate(node)
+            self.publish(self.root.frozen)
+
+    def get_node(self, settings: IASettings) -> SnapshotNode:
+        node = self.nodes.get(id(settings))
+        if node is None:
+            node = self.nodes[id(settings)] = SnapshotNode(self, settings)
+            settings.invalidate.subscribe(node.settings_invalidated)
+            self.build_node(node)
+        elif node.is_stale():
+            self.build_node(node)
+        return node
+
+    def freeze_member(self, node: SnapshotNode, key, value):
+        def freeze_settings(settings: IASettings) -> FrozenSettings:
+            child = self.get_node(settings)
+            node.children.setdefault(key, []).append(child)
+            child.parents.setdefault(node, set()).add(key)
+            return child.frozen
+        return freeze_value(value, freeze_settings)
+
+    def build_node(self, node: SnapshotNode):
+        """
+        Re-freezes the members of node's settings. Nested settings objects that are not stale keep their FrozenSettings
+        """
+        settings = node.settings
+        node.revision = settings._revision
+        old_children = self.unlink_children(node, list(node.children))
+        data = {}
+        children = []
+        for key, value in settings.generate_key_value_pairs():
+            data[key] = self.freeze_member(node, key, value)
+            if isinstance(value, IASettings):
+                children.append(key)
+        node.frozen = FrozenSettings(data, settings_t=settings.__class__, source=settings, children=tuple(children))
+        self.drop_orphans(old_children)
+
+    def propagate(self, node: SnapshotNode):
+        """
+        Copies the FrozenSettings of every ancestor of node with the keys that lead to it re-frozen
+        """
+        for parent, keys in list(node.parents.items()):
+            keys = tuple(keys)  # unlinking empties the set
+            old_children = self.unlink_children(parent, keys)
+            frozen = parent.frozen
+            data = frozen._data.copy()
+            for key in keys:
+                data[key] = self.freeze_member(parent, key, parent.settings[key])
+            parent.frozen = FrozenSettings(data, settings_t=frozen._settings_t, source=parent.settings,
+                                           children=frozen._children)
+            object.__setattr__(parent.frozen, '_revision', frozen._revision)  # the parent itself did not change
+            self.drop_orphans(old_children)
+            self.propagate(parent)
+
+    @staticmethod
+    def unlink_children(node: SnapshotNode, keys: Iterable) -> list[SnapshotNode]:
+        unlinked = []
+        for key in list(keys):
+            for child in node.children.pop(key, ()):
+                parent_keys = child.parents.get(node)
+                if parent_keys is not None:
+                    parent_keys.discard(key)
+                    if not parent_keys:
+                        del child.parents[node]
+                unlinked.append(child)
+        return unlinked
+
+    def drop_orphans(self, nodes: Iterable[SnapshotNode]):
+        for node in nodes:
+            if node.parents or node is self.root or self.nodes.get(id(node.settings)) is not node:
+                continue
+            del self.nodes[id(node.settings)]
+            node.settings.invalidate.unsubscribe(node.settings_invalidated)
+            self.drop_orphans(self.unlink_children(node, list(node.children)))
+
+    def update(self, changes: Mapping | Iterable[tuple[Any, Any]]) -> FrozenSettings:
+        """
+        :param changes: Keys or key paths mapped to their new values
+        """
+        items = changes.items() if isinstance(changes, Mapping) else changes
+        with self.write_lock:
+            snapshot = self.current
+            for key, value in items:
+                snapshot = snapshot.set(key, value)
+            self.publish(snapshot)
+            return snapshot
+
+    def delete(self, key) -> FrozenSettings:
+        with self.write_lock:
+            self.publish(self.current.delete(key))
+            return self.current
+
+    @notify()
+    def publish(self, snapshot: FrozenSettings):
+        """
+        Subscribers are called with each new snapshot
+        """
+        if snapshot is self.current:
+            raise AbortNotifyException(None)
+        self.version += 1
+        self.current = snapshot
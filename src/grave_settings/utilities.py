@@ -51,6 +51,33 @@ def ex_str(obj: object):
         return ext_str_slots(obj)
 
 
+def sort_mapping_keys(obj):
+    """
+    Returns a copy of a primitive object tree with the keys of every dictionary in sorted order
+    """
+    t = type(obj)
+    if t is dict:
+        return {k: sort_mapping_keys(obj[k]) for k in sorted(obj, key=str)}
+    elif t is list:
+        return [sort_mapping_keys(x) for x in obj]
+    else:
+        return obj
+
+
+def copy_primitive_tree(obj):
+    """
+    Copies the dictionaries and lists of a parsed object tree. Everything else is immutable in a parsed tree and is
+    shared, which makes this much faster than copy.deepcopy
+    """
+    t = type(obj)
+    if t is dict:
+        return {k: copy_primitive_tree(v) for k, v in obj.items()}
+    elif t is list:
+        return [copy_primitive_tree(x) for x in obj]
+    else:
+        return obj
+
+
 def format_class_str(x):
     module = x.__module__
     return f'{module}.{x.__name__}'
@@ -0,0 +1,138 @@
+# - * -coding: utf - 8 - * -
+"""
+
+
+@author: ☙ Ryan McConnell ❧
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import threading
+import weakref
+from pathlib import Path
+
+
+class InotifyWaiter:
+    """
+    Blocks until something in a directory changes, using Linux inotify through ctypes. The directory is watched rather
+    than the file because atomic saves replace the file
+    """
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, directory: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = (self.IN_MODIFY | self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE |
+                self.IN_DELETE)
+        if libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed for {directory}')
+        self.wake_r, self.wake_w = os.pipe()
+
+    @staticmethod
+    def is_supported() -> bool:
+        return sys.platform.startswith('linux') and ctypes.util.find_library('c') is not None
+
+    def wait(self, timeout: float | None) -> bool:
+        """
+        :return: True if there were events (or a wake up) before timeout
+        """
+        ready = select.select([self.fd, self.wake_r], [], [], timeout)[0]
+        for fd in ready:
+            try:
+                while os.read(fd, 65536):
+                    if fd == self.wake_r:
+                        break
+            except BlockingIOError:
+                pass
+        return bool(ready)
+
+    def wake(self):
+        os.write(self.wake_w, b'\0')
+
+    def close(self):
+        for fd in (self.fd, self.wake_r, self.wake_w):
+            os.close(fd)
+
+
+class ConfigWatcher:
+    """
+    Reloads a ConfigFile on a background thread when its file changes on disk. The file's (mtime_ns, size, inode) is
+    compared with the one the ConfigFile last read or wrote, so its own saves do not cause reloads. Without inotify the
+    file is polled every interval seconds, with it the interval is only a fallback.
+
+    Changes are applied in place through ConfigFile.reload. Errors (ex: a half written file from a non-atomic writer)
+    are kept in error and the reload is tried again on the next change
+    """
+    def __init__(self, config: 'ConfigFile', interval: float = 1.0, use_inotify=True):
+        self.config = weakref.ref(config)
+        self.path = config.file_path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.error: Exception | None = None
+        self.reloads = 0
+        self.waiter: InotifyWaiter | None = None
+        self.waiter_lock = threading.Lock()
+        if use_inotify and InotifyWaiter.is_supported():
+            try:
+                self.waiter = InotifyWaiter(self.path.parent)
+            except (OSError, AttributeError):  # AttributeError: libc without inotify
+                self.waiter = None
+        self.thread = threading.Thread(target=self.run, name='ConfigWatcher', daemon=True)
+        self.thread.start()
+
+    def check(self) -> bool:
+        """
+        Reloads the config if the file changed since it was last loaded or saved
+
+        :return: True if the data changed
+        """
+        config = self.config()
+        if config is None:
+            self.stopped.set()
+            return False
+        if config.get_file_identity(self.path) == config.file_identity:  # cheap check without the lock
+            return False
+        try:
+            changed = config.reload_if_changed()
+        except Exception as e:
+            self.error = e
+            return False
+        self.error = None
+        if changed:
+            self.reloads += 1
+        return changed
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                self.check()
+                if self.waiter is None:
+                    self.stopped.wait(self.interval)
+                else:
+                    self.waiter.wait(self.interval)
+        finally:
+            with self.waiter_lock:
+                if self.waiter is not None:
+                    self.waiter.close()
+                    self.waiter = None
+
+    def stop(self):
+        self.stopped.set()
+        with self.waiter_lock:
+            if self.waiter is not None:
+                self.waiter.wake()
+        if self.thread is not threading.current_thread():
+            self.thread.join()